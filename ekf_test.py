@@ -37,6 +37,9 @@ def EKFilter_test():
     x = np.array([1, 0.2, 2, 0.3], dtype=float)
 
     ekf = ft.EKFilterAN(f, L, h, M, Q, R, xdim, zdim, order=2, it=1)
+    # the batched jacobian evaluates all the points of difference stencil in one call
+    # hb = lambda x: np.stack((lg.norm(x[..., ::2], axis=-1), np.arctan2(x[..., 2], x[..., 0])), axis=-1)
+    # ekf = ft.EKFilterAN(f, L, h, M, Q, R, xdim, zdim, hjac=tlb.math.Jacobian(hb, zdim, batch=True), order=2, it=1)
     # ekf = ft.EKFilterNAN(f, h, Q, R, xdim, zdim, order=2, it=1)
 
     state_arr = np.empty((xdim, N))
@@ -246,6 +246,54 @@ def IMM_GNNTracker_test():
     plt.show()
 
 
+def OOSM_GNNTracker_test():
+    axis = 2
+    xdim, zdim = 4, 2
+    T = 1
+    sigma_w = [0.1, 0.1]
+    sigma_v = [1, 1]
+    dmodel = model.discrete_model('cv_dd', axis, sigma_w)
+    F, Q = dmodel(T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    R = model.R_cv(axis, sigma_v)
+
+    # the generated filters are recorded, so that the tentative tracks can be inspected
+    filters = []
+    kf_gen = tk.GNNFilterGenerator(ft.KFilter, F, L, H, M, Q, R, dmodel=dmodel)
+    def ft_gen():
+        kf = kf_gen()
+        filters.append(kf)
+        return kf
+    ft_init = tk.GNNFilterInitializer(init.cv_init, vmax=10)
+    lgc = tk.GNNLogicMaintainer(tk.HistoryLogic, 1, 1, 3, 3)
+    tracker = tk.GNNTracker(ft_gen, ft_init, lgc, gate=50)
+
+    # a filter just initialized has no estimate of the previous scan to retrodict from
+    kf = kf_gen()
+    kf.init(np.array([0, 1, 0, 1], dtype=float), np.eye(xdim))
+    print('OOSM ready after init: %s' % kf.OOSM_ready)
+    kf.predict(dt=T)
+    print('OOSM ready after predict: %s' % kf.OOSM_ready)
+
+    # target 0 is observed from the first scan, target 1 appears in the last one
+    pos0 = lambda t: np.array([t, 2 * t], dtype=float)
+    pos1 = np.array([100, -100], dtype=float)
+    for t in range(3):
+        tracker.add_detection(tk.Detection([pos0(t)], [R]), timestamp=t)
+    tracker.add_detection(tk.Detection([pos0(3), pos1], [R, R]), timestamp=3)
+    print('OOSM ready before the OOSM: %s' % [kf.OOSM_ready for kf in filters])
+    state_born = filters[1].state
+
+    # the out-of-sequence scan between the last two observes both targets, only the
+    # track of target 0 is updated, the track born in the last scan is left out
+    tracker.add_detection(tk.Detection([pos0(2.5), pos1 + 1], [R, R]), timestamp=2.5)
+    print('OOSM ready after the OOSM: %s' % [kf.OOSM_ready for kf in filters])
+    print('state of the track born in the last scan unchanged: %s' % np.all(filters[1].state == state_born))
+
+
 if __name__ == '__main__':
     GNNTracker_test()
-    IMM_GNNTracker_test()
\ No newline at end of file
+    IMM_GNNTracker_test()
+    OOSM_GNNTracker_test()
\ No newline at end of file
@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tracklib as tlb
+import tracklib.filter as ft
+import tracklib.init as init
+import tracklib.model as model
+import matplotlib.pyplot as plt
+'''
+notes:
+vector is preferably a column vector, otherwise
+the program may yield uncertain result.
+'''
+
+
+def IKFilter_test():
+    N, T = 200, 1
+    sensor_num = 6
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(1), np.sqrt(1)]
+
+    F = model.F_cv(axis, T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+    R = model.R_cv(axis, sigma_v)
+    # each sensor has its own accuracy
+    Rs = [R * (i + 1) for i in range(sensor_num)]
+
+    # initial state and error convariance
+    x = np.array([1, 0.2, 2, 0.3], dtype=float)
+
+    ikf = ft.IKFilter(F, L, H, M, Q, R)
+
+    state_arr = np.empty((xdim, N))
+    measure_arr = np.empty((zdim, sensor_num, N))
+    post_state_arr = np.empty((xdim, N))
+    post_cov_arr = np.empty((xdim, xdim, N))
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q)
+        x = F @ x + L @ w
+        zs = [H @ x + M @ tlb.multi_normal(0, Rs[i]) for i in range(sensor_num)]
+        if n == -1:
+            x_init, P_init = init.cv_init(zs[0], Rs[0], 1)
+            ikf.init(x_init, P_init)
+            continue
+        state_arr[:, n] = x
+        measure_arr[:, :, n] = np.array(zs).T
+
+        ikf.predict()
+        # all the reports of this scan are fused at once
+        ikf.correct_multi(zs, R=Rs)
+        post_state_arr[:, n] = ikf.state
+        post_cov_arr[:, :, n] = ikf.cov
+
+    print(ikf)
+
+    state_err = state_arr - post_state_arr
+    print('RMS: %s' % np.std(state_err, axis=1))
+
+    # plot
+    n = np.arange(N)
+    fig = plt.figure()
+    ax = fig.add_subplot(211)
+    ax.plot(n, state_arr[0, :], linewidth=0.8)
+    ax.plot(n, measure_arr[0, 0, :], '.')
+    ax.plot(n, post_state_arr[0, :], linewidth=0.8)
+    ax.legend(['real', 'meas', 'esti'])
+    ax.set_title('x state')
+    ax = fig.add_subplot(212)
+    ax.plot(n, post_cov_arr[0, 0, :], linewidth=0.8)
+    ax.plot(n, post_cov_arr[2, 2, :], linewidth=0.8)
+    ax.legend(['x', 'y'])
+    ax.set_title('error variance/mean square error')
+    plt.show()
+
+
+if __name__ == '__main__':
+    IKFilter_test()
@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+import tracklib as tlb
+import tracklib.filter as ft
+import tracklib.init as init
+import tracklib.model as model
+import matplotlib.pyplot as plt
+'''
+notes:
+vector is preferably a column vector, otherwise
+the program may yield uncertain result.
+'''
+
+
+def KFilterBank_test():
+    N, T = 200, 1
+    tracks_n = 1000
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(1), np.sqrt(1)]
+
+    F = model.F_cv(axis, T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+    R = model.R_cv(axis, sigma_v)
+
+    # initial states of all targets
+    x = tlb.multi_normal(np.array([1, 0.2, 2, 0.3], dtype=float), np.diag([100, 1, 100, 1]), tracks_n, axis=0)
+
+    kfb = ft.KFilterBank(F, L, H, M, Q, R)
+    kfs = [ft.KFilter(F, L, H, M, Q, R) for _ in range(tracks_n)]
+
+    state_arr = np.empty((tracks_n, xdim, N))
+    measure_arr = np.empty((tracks_n, zdim, N))
+    post_state_arr = np.empty((tracks_n, xdim, N))
+    bank_time = single_time = 0
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q, tracks_n, axis=0)
+        v = tlb.multi_normal(0, R, tracks_n, axis=0)
+
+        x = x @ F.T + w @ L.T
+        z = x @ H.T + v @ M.T
+        if n == -1:
+            x_init, P_init = zip(*[init.cv_init(z[i], R, 1) for i in range(tracks_n)])
+            kfb.init(x_init, P_init)
+            for i in range(tracks_n):
+                kfs[i].init(x_init[i], P_init[i])
+            continue
+        state_arr[:, :, n] = x
+        measure_arr[:, :, n] = z
+
+        tic = time.time()
+        kfb.predict()
+        kfb.correct(z)
+        bank_time += time.time() - tic
+
+        tic = time.time()
+        for i in range(tracks_n):
+            kfs[i].predict()
+            kfs[i].correct(z[i])
+        single_time += time.time() - tic
+
+        post_state_arr[:, :, n] = kfb.state
+
+    print(kfb)
+    print('bank time: %fs, single filters time: %fs' % (bank_time, single_time))
+    print('max difference: %s' % np.max(np.abs(kfb.state - np.array([kf.state for kf in kfs]))))
+
+    # a subset of tracks and a single track selected by a scalar index
+    idx = [0, 2, 5]
+    print('subset distance: %s' % kfb.distance(z[idx], idx=idx))
+    print('single filters distance: %s' % np.array([kfs[i].distance(z[i]) for i in idx]))
+    d = kfb.distance(z[2], idx=2)
+    print('scalar index distance: %s, shape: %s' % (d, np.shape(d)))
+    x_2, P_2 = kfb.correct(z[2], idx=2)
+    kfs[2].correct(z[2])
+    print('scalar index state shape: %s, cov shape: %s' % (x_2.shape, P_2.shape))
+    print('scalar index max difference: %s' % np.max(np.abs(x_2 - kfs[2].state)))
+
+    state_err = state_arr[0] - post_state_arr[0]
+    print('RMS: %s' % np.std(state_err, axis=1))
+
+    # trajectory of the first target
+    fig = plt.figure()
+    ax = fig.add_subplot()
+    ax.scatter(state_arr[0, 0, 0], state_arr[0, 2, 0], s=50, c='r', marker='x', label='start')
+    ax.plot(state_arr[0, 0, :], state_arr[0, 2, :], linewidth=0.8, label='real')
+    ax.scatter(measure_arr[0, 0, :], measure_arr[0, 1, :], s=5, c='orange', label='meas')
+    ax.plot(post_state_arr[0, 0, :], post_state_arr[0, 2, :], linewidth=0.8, label='post esti')
+    ax.set_xlabel('x')
+    ax.set_ylabel('y')
+    ax.legend()
+    ax.set_title('trajectory')
+    plt.show()
+
+
+if __name__ == '__main__':
+    KFilterBank_test()
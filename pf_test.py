@@ -36,6 +36,9 @@ def PFilter_test():
     x = np.array([1, 0.2, 2, 0.3], dtype=float)
 
     # pf = ft.SIRPFilter(f, L, h, M, Q, R, Ns=Ns, Neff=Neff)
+    # the number of particles can be adapted by KLD-sampling, it is given by pf.Ns
+    # adapt = ft.KLDSampling([0.1, 0.05, 0.1, 0.05], Ns_min=100, Ns_max=1000)
+    # pf = ft.SIRPFilter(f, L, h, M, Q, R, Ns=Ns, Neff=Neff, adapt=adapt)
 
     kernal = ft.EpanechnikovKernal(xdim, Ns)
     # kernal = ft.GaussianKernal(xdim, Ns)
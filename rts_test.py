@@ -0,0 +1,161 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tracklib as tlb
+import tracklib.filter as ft
+import tracklib.smoother as sm
+import tracklib.init as init
+import tracklib.model as model
+import matplotlib.pyplot as plt
+'''
+notes:
+vector is preferably a column vector, otherwise
+the program may yield uncertain result.
+'''
+
+
+def RTSSmoother_test():
+    N, T = 200, 1
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(1), np.sqrt(1)]
+
+    F = model.F_cv(axis, T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+    R = model.R_cv(axis, sigma_v)
+
+    # initial state and error convariance
+    x = np.array([1, 0.2, 2, 0.3], dtype=float)
+
+    kf = ft.KFilter(F, L, H, M, Q, R)
+
+    # the time index is the first axis of the stored forward pass
+    state_arr = np.empty((N, xdim))
+    measure_arr = np.empty((N, zdim))
+    prior_state_arr = np.empty((N, xdim))
+    prior_cov_arr = np.empty((N, xdim, xdim))
+    cross_cov_arr = np.empty((N, xdim, xdim))
+    post_state_arr = np.empty((N, xdim))
+    post_cov_arr = np.empty((N, xdim, xdim))
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q)
+        v = tlb.multi_normal(0, R)
+
+        x = F @ x + L @ w
+        z = H @ x + M @ v
+        if n == -1:
+            x_init, P_init = init.cv_init(z, R, 1)
+            kf.init(x_init, P_init)
+            continue
+        state_arr[n] = x
+        measure_arr[n] = z
+
+        kf.predict()
+        prior_state_arr[n] = kf.state
+        prior_cov_arr[n] = kf.cov
+        cross_cov_arr[n] = kf.cross_cov
+        kf.correct(z)
+        post_state_arr[n] = kf.state
+        post_cov_arr[n] = kf.cov
+
+    smoothed_state_arr, smoothed_cov_arr = sm.rts_smoother(post_state_arr, post_cov_arr,
+                                                           prior_state_arr, prior_cov_arr, cross_cov_arr)
+
+    print(kf)
+
+    print('filter RMS: %s' % np.std(state_arr - post_state_arr, axis=0))
+    print('smoother RMS: %s' % np.std(state_arr - smoothed_state_arr, axis=0))
+
+    # plot
+    n = np.arange(N)
+    fig = plt.figure()
+    ax = fig.add_subplot(211)
+    ax.plot(n, state_arr[:, 0], linewidth=0.8)
+    ax.plot(n, measure_arr[:, 0], '.')
+    ax.plot(n, post_state_arr[:, 0], linewidth=0.8)
+    ax.plot(n, smoothed_state_arr[:, 0], linewidth=0.8)
+    ax.legend(['real', 'meas', 'filter', 'smoother'])
+    ax.set_title('x state')
+    ax = fig.add_subplot(212)
+    ax.plot(n, post_cov_arr[:, 0, 0], linewidth=0.8)
+    ax.plot(n, smoothed_cov_arr[:, 0, 0], linewidth=0.8)
+    ax.legend(['filter', 'smoother'])
+    ax.set_title('x error variance/mean square error')
+    plt.show()
+
+
+def FixedLagSmoother_test():
+    N, T = 200, 1
+    lag = 5
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(1), np.sqrt(1)]
+
+    F = model.F_cv(axis, T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+    R = model.R_cv(axis, sigma_v)
+
+    # initial state and error convariance
+    x = np.array([1, 0.2, 2, 0.3], dtype=float)
+
+    kf = ft.KFilter(F, L, H, M, Q, R)
+    fls = sm.FixedLagSmoother(kf, lag)
+
+    state_arr = np.empty((N, xdim))
+    measure_arr = np.empty((N, zdim))
+    post_state_arr = np.empty((N, xdim))
+    smoothed_state_arr = np.empty((N - lag, xdim))
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q)
+        v = tlb.multi_normal(0, R)
+
+        x = F @ x + L @ w
+        z = H @ x + M @ v
+        if n == -1:
+            x_init, P_init = init.cv_init(z, R, 1)
+            fls.init(x_init, P_init)
+            continue
+        state_arr[n] = x
+        measure_arr[n] = z
+
+        fls.predict()
+        fls.correct(z)
+        post_state_arr[n] = fls.state
+        # the estimate of 'lag' scans ago is smoothed by the measurements since then
+        if n >= lag:
+            smoothed_state_arr[n - lag], _ = fls.smooth()
+
+    print(fls)
+
+    print('filter RMS: %s' % np.std(state_arr - post_state_arr, axis=0))
+    print('smoother RMS: %s' % np.std(state_arr[:N - lag] - smoothed_state_arr, axis=0))
+
+    # plot
+    n = np.arange(N)
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    ax.plot(n, state_arr[:, 0], linewidth=0.8)
+    ax.plot(n, measure_arr[:, 0], '.')
+    ax.plot(n, post_state_arr[:, 0], linewidth=0.8)
+    ax.plot(n[:N - lag], smoothed_state_arr[:, 0], linewidth=0.8)
+    ax.legend(['real', 'meas', 'filter', 'smoother'])
+    ax.set_title('x state')
+    plt.show()
+
+
+if __name__ == '__main__':
+    RTSSmoother_test()
+    FixedLagSmoother_test()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tracklib as tlb
+import tracklib.filter as ft
+import tracklib.init as init
+import tracklib.model as model
+import matplotlib.pyplot as plt
+'''
+notes:
+vector is preferably a column vector, otherwise
+the program may yield uncertain result.
+'''
+
+
+def SRKFilter_test():
+    N, T = 200, 1
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(1), np.sqrt(1)]
+
+    F = model.F_cv(axis, T)
+    H = model.H_cv(axis)
+    L = np.eye(xdim)
+    M = np.eye(zdim)
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+    R = model.R_cv(axis, sigma_v)
+
+    # initial state and error convariance
+    x = np.array([1, 0.2, 2, 0.3], dtype=float)
+
+    kf = ft.KFilter(F, L, H, M, Q, R)
+    srkf = ft.SRKFilter(F, L, H, M, Q, R)
+
+    state_arr = np.empty((xdim, N))
+    measure_arr = np.empty((zdim, N))
+    post_state_arr = np.empty((xdim, N))
+    post_cov_arr = np.empty((xdim, xdim, N))
+    sample_arr = np.empty((xdim, N))
+    cov_err = np.empty(N)
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q)
+        v = tlb.multi_normal(0, R)
+
+        x = F @ x + L @ w
+        z = H @ x + M @ v
+        if n == -1:
+            x_init, P_init = init.cv_init(z, R, 1)
+            kf.init(x_init, P_init)
+            srkf.init(x_init, P_init)
+            continue
+        state_arr[:, n] = x
+        measure_arr[:, n] = z
+
+        kf.predict()
+        kf.correct(z)
+        srkf.predict()
+        srkf.correct(z)
+        post_state_arr[:, n] = srkf.state
+        post_cov_arr[:, :, n] = srkf.cov
+        cov_err[n] = np.max(np.abs(kf.cov - srkf.cov))
+
+        # the factor is used for sampling directly
+        sample_arr[:, n] = tlb.multi_normal(srkf.state, srkf.cov_sqrt, sqrt=True)
+
+    print(srkf)
+
+    state_err = state_arr - post_state_arr
+    print('RMS: %s' % np.std(state_err, axis=1))
+    print('max difference of covariance from KFilter: %s' % np.max(cov_err))
+
+    # plot
+    n = np.arange(N)
+    fig = plt.figure()
+    ax = fig.add_subplot(211)
+    ax.plot(n, state_arr[0, :], linewidth=0.8)
+    ax.plot(n, measure_arr[0, :], '.')
+    ax.plot(n, post_state_arr[0, :], linewidth=0.8)
+    ax.plot(n, sample_arr[0, :], '.')
+    ax.legend(['real', 'meas', 'esti', 'sample'])
+    ax.set_title('x state')
+    ax = fig.add_subplot(212)
+    ax.plot(n, post_cov_arr[0, 0, :], linewidth=0.8)
+    ax.plot(n, post_cov_arr[2, 2, :], linewidth=0.8)
+    ax.legend(['x', 'y'])
+    ax.set_title('error variance/mean square error')
+    plt.show()
+
+
+if __name__ == '__main__':
+    SRKFilter_test()
@@ -2,6 +2,8 @@ from __future__ import division, absolute_import, print_function
 
 
 from .kf import *
+from .kfb import *
+from .ikf import *
 from .ekf import *
 from .ukf import *
 from .ssf import *
@@ -10,6 +12,7 @@ from .immf import *
 from .mmmhf import *
 from .pf import *
 from .gpf import *
+from .pool import *
 
 # extended target filter
 from .eof import *
@@ -8,6 +8,30 @@ from __future__ import division, absolute_import, print_function
 __all__ = ['FilterBase', 'EOFilterBase']
 
 import abc
+import numpy as np
+
+
+def _cache_key(*arrays):
+    '''
+    Key of the cached statistics computed from the given matrices, the shapes and
+    types are included, since matrices of the same bytes can differ in them
+    '''
+    return tuple((a.shape, a.dtype.str, a.tobytes()) for a in arrays)
+
+
+def _check_dt(kwargs):
+    '''
+    The filters whose transition has a fixed interval can not be predicted by a given
+    one, so 'dt' is rejected rather than ignored
+    '''
+    if 'dt' in kwargs:
+        raise ValueError("'dt' is not supported, the transition has a fixed interval")
+
+
+def _readonly(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
 
 
 class FilterBase(abc.ABC):
@@ -40,6 +64,13 @@ class FilterBase(abc.ABC):
     def likelihood(self, z, **kwargs):
         pass
 
+    def log_likelihood(self, z, **kwargs):
+        '''
+        Natural logarithm of likelihood. Subclasses should override it to compute
+        the log-density directly instead of taking the log of the clamped likelihood.
+        '''
+        return np.log(self.likelihood(z, **kwargs))
+
     @property
     def state(self):
         if self._state is not None:
@@ -55,7 +86,30 @@ class FilterBase(abc.ABC):
         else:
             raise AttributeError("'%s' object has no attribute 'cov'" %
                                  self.__class__.__name__)
-    
+
+    @property
+    def state_view(self):
+        '''
+        Read-only view of state without copy. Unlike 'state', it may reflect later
+        in-place updates of the filter, so copy it if it needs to be kept.
+        '''
+        if self._state is not None:
+            return _readonly(self._state)
+        else:
+            raise AttributeError("'%s' object has no attribute 'state_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        '''
+        Read-only view of covariance without copy, see 'state_view'
+        '''
+        if self._cov is not None:
+            return _readonly(self._cov)
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_view'" %
+                                 self.__class__.__name__)
+
 
 class EOFilterBase(abc.ABC):
     def __init__(self):
@@ -83,6 +137,12 @@ class EOFilterBase(abc.ABC):
     def likelihood(self, z, **kwargs):
         pass
 
+    def log_likelihood(self, z, **kwargs):
+        '''
+        Natural logarithm of likelihood, see FilterBase.log_likelihood
+        '''
+        return np.log(self.likelihood(z, **kwargs))
+
     @property
     def state(self):
         if self._state is not None:
@@ -98,7 +158,29 @@ class EOFilterBase(abc.ABC):
         else:
             raise AttributeError("'%s' object has no attribute 'cov'" %
                                  self.__class__.__name__)
-    
+
+    @property
+    def state_view(self):
+        '''
+        Read-only view of state without copy, see FilterBase.state_view
+        '''
+        if self._state is not None:
+            return _readonly(self._state)
+        else:
+            raise AttributeError("'%s' object has no attribute 'state_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        '''
+        Read-only view of covariance without copy, see FilterBase.state_view
+        '''
+        if self._cov is not None:
+            return _readonly(self._cov)
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_view'" %
+                                 self.__class__.__name__)
+
     @property
     def extension(self):
         if self._cov is not None:
@@ -106,3 +188,14 @@ class EOFilterBase(abc.ABC):
         else:
             raise AttributeError("'%s' object has no attribute 'extension'" %
                                  self.__class__.__name__)
+
+    @property
+    def extension_view(self):
+        '''
+        Read-only view of extension without copy, see FilterBase.state_view
+        '''
+        if self._ext is not None:
+            return _readonly(self._ext)
+        else:
+            raise AttributeError("'%s' object has no attribute 'extension_view'" %
+                                 self.__class__.__name__)
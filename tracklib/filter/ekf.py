@@ -4,6 +4,7 @@ Extended Kalman filter
 
 REFERENCE:
 [1]. D. Simon, "Optimal State Estimation: Kalman, H Infinity, and Nonlinear Approaches," John Wiley and Sons, Inc., 2006.
+[2]. Y. Bar-Shalom, "Update with out-of-sequence measurements in tracking: exact solution," in IEEE Transactions on Aerospace and Electronic Systems, vol. 38, no. 3, pp. 769-777, July 2002.
 '''
 from __future__ import division, absolute_import, print_function
 
@@ -12,9 +13,25 @@ __all__ = ['EKFilterAN', 'EKFilterNAN']
 
 import numpy as np
 import scipy.linalg as lg
-from functools import partial
-from .base import FilterBase
-from tracklib.math import num_diff, num_diff_hessian
+from .base import FilterBase, _cache_key, _check_dt
+from .kf import _seq_update, _jpda_update, _retrodict
+from tracklib.math import Jacobian, Hessian
+
+
+def _hessian_trace(hes, cov):
+    '''
+    The second-order terms tr(hes[:, :, i]*cov) of all the components at once,
+    where hes is of shape (n, n, m)
+    '''
+    return np.einsum('jki,kj->i', hes, cov)
+
+
+def _converged(state, last_state, cov, tol):
+    '''
+    Whether the step of iterated update is below 'tol' in every component, measured
+    in the standard deviations of the prior
+    '''
+    return tol is not None and np.all(np.abs(state - last_state) <= tol * np.sqrt(np.diag(cov)))
 
 
 class EKFilterAN(FilterBase):
@@ -28,6 +45,24 @@ class EKFilterAN(FilterBase):
     E(v_k*v_j') = R_k*δ_kj
 
     w_k, v_k, x_0 are uncorrelated to each other
+
+    If 'sequential' is True, the components of measurement are processed one at a
+    time by scalar updates, which is cheaper when R is diagonal.
+
+    A measurement taken after the previous scan but arriving after the current one
+    can be incorporated by 'correct_OOSM' without replaying the scans, see[2]. The
+    linearized transition and Q of the lag are taken from 'dmodel' if given, e.g.
+    the return of model.discrete_model.
+
+    If 'fjac' or 'hjac' is not given, the Jacobian is evaluated by central difference.
+    A tracklib.math.Jacobian can be passed instead to evaluate batched or complex-step
+    differences, or to reuse the Jacobian while the state moves little. Likewise, a
+    batched tracklib.math.Hessian can be passed as 'fhes' or 'hhes' if order is 2.
+
+    If 'it' is positive, the measurement update is iterated by relinearizing about
+    the updated state at most 'it' times. If 'it_tol' is given, the iteration stops
+    once no component of the state moves more than 'it_tol' prior standard
+    deviations, and 'iterations' reports the number used by the last correction.
     '''
     def __init__(self,
                  f,
@@ -43,7 +78,10 @@ class EKFilterAN(FilterBase):
                  fhes=None,
                  hhes=None,
                  order=1,
-                 it=0):
+                 it=0,
+                 it_tol=None,
+                 sequential=False,
+                 dmodel=None):
         super().__init__()
 
         self._f = lambda x, u: f(x, u)
@@ -55,30 +93,30 @@ class EKFilterAN(FilterBase):
         self._xdim = xdim
         self._zdim = zdim
         if fjac is None:
-            def fjac(x, u):
-                F = num_diff(x, partial(self._f, u=u), self._xdim)
-                return F
+            fjac = Jacobian(self._f, self._xdim)
         self._fjac = fjac
         if hjac is None:
-            def hjac(x):
-                H = num_diff(x, partial(self._h), self._zdim)
-                return H
+            hjac = Jacobian(self._h, self._zdim)
         self._hjac = hjac
         if fhes is None:
-            def fhes(x, u):
-                FH = num_diff_hessian(x, partial(self._f, u=u), self._xdim)
-                return FH
+            fhes = Hessian(self._f, self._xdim)
         self._fhes = fhes
         if hhes is None:
-            def hhes(x):
-                HH = num_diff_hessian(x, self._h, self._zdim)
-                return HH
+            hhes = Hessian(self._h, self._zdim)
         self._hhes = hhes
         if order == 1 or order == 2:
             self._order = order
         else:
             raise ValueError('order must be 1 or 2')
         self._it = it
+        self._it_tol = it_tol
+        self._it_count = 0
+        self._sequential = sequential
+        self._dmodel = dmodel
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False     # whether an OOSM or a JPDA update has been incorporated since the last predict
+        self._cache = {}
 
     def __str__(self):
         msg = '%s-order additive noise extended Kalman filter' % ('First' if self._order == 1 else 'Second')
@@ -87,15 +125,50 @@ class EKFilterAN(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
+
+    def __meas_pred(self):
+        # the jacobian and predicted measurement only depend on the current state,
+        # so they are evaluated once per cycle
+        if 'pred' not in self._cache:
+            H = self._hjac(self._state)
+            z_pred = self._h(self._state)
+            if self._order == 2:
+                HH = self._hhes(self._state)
+                quad = _hessian_trace(HH, self._cov)
+                z_pred = z_pred + quad / 2
+            self._cache['pred'] = (H, z_pred)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        # the innovation covariance and its cholesky factor are computed once per cycle
+        # for each measurement noise and shared by distance, likelihood and correct
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            H, z_pred = self.__meas_pred()
+            S = H @ self._cov @ H.T + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (H, z_pred, S, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if len(kwargs) > 0:
             if 'L' in kwargs: self._L[:] = kwargs['L']
@@ -106,14 +179,18 @@ class EKFilterAN(FilterBase):
         F = self._fjac(post_state, u)
         Q_tilde = self._L @ self._Q @ self._L.T
 
+        self._cross_cov = post_cov @ F.T
         self._state = self._f(post_state, u)
-        self._cov = F @ post_cov @ F.T + Q_tilde
+        self._cov = F @ self._cross_cov + Q_tilde
         self._cov = (self._cov + self._cov.T) / 2
 
         if self._order == 2:
             FH = self._fhes(post_state, u)
-            quad = np.array([np.trace(FH[:, :, i] @ post_cov) for i in range(self._xdim)], dtype=float)
+            quad = _hessian_trace(FH, post_cov)
             self._state += quad / 2
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -127,38 +204,49 @@ class EKFilterAN(FilterBase):
 
         prior_state, prior_cov = self._state, self._cov
 
-        H = self._hjac(prior_state)
-        z_pred = self._h(prior_state)
-        if self._order == 2:
-            HH = self._hhes(prior_state)
-            quad = np.array([np.trace(HH[:, :, i] @ prior_cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
-        innov = z - z_pred
-        R_tilde = self._M @ self._R @ self._M.T
-        S = H @ prior_cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        K = prior_cov @ H.T @ lg.inv(S)
+        if self._sequential:
+            R_tilde = self._M @ self._R @ self._M.T
+            H, z_pred = self.__meas_pred()
+            # the innovation is kept for retrodiction of out-of-sequence measurement
+            self._last = (prior_cov, H, self._M.copy(), self._R.copy(), z - z_pred)
+            incre, self._cov = _seq_update(prior_cov, z - z_pred, H, R_tilde)
+            self._state = prior_state + incre
+        else:
+            H, z_pred, S, S_cho, _ = self.__innov_stats(self._M, self._R)
+            innov = z - z_pred
+            self._last = (prior_cov, H, self._M.copy(), self._R.copy(), innov)
+            K = lg.cho_solve(S_cho, H @ prior_cov).T
 
-        self._state = prior_state + K @ innov
-        self._cov = prior_cov - K @ S @ K.T
-        self._cov = (self._cov + self._cov.T) / 2
+            self._state = prior_state + K @ innov
+            self._cov = prior_cov - K @ S @ K.T
+            self._cov = (self._cov + self._cov.T) / 2
 
+        self._it_count = 0
+        R_tilde = self._M @ self._R @ self._M.T
         for _ in range(self._it):
+            last_state = self._state
             H = self._hjac(self._state)
             z_pred = self._h(self._state) + H @ (prior_state - self._state)
             if self._order == 2:
                 HH = self._hhes(self._state)
-                quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
+                quad = _hessian_trace(HH, self._cov)
                 z_pred += quad / 2
             innov = z - z_pred
-            R_tilde = self._M @ self._R @ self._M.T
-            S = H @ prior_cov @ H.T + R_tilde
-            S = (S + S.T) / 2
-            K = prior_cov @ H.T @ lg.inv(S)
+            if self._sequential:
+                incre, self._cov = _seq_update(prior_cov, innov, H, R_tilde)
+                self._state = prior_state + incre
+            else:
+                S = H @ prior_cov @ H.T + R_tilde
+                S = (S + S.T) / 2
+                K = lg.cho_solve(lg.cho_factor(S, lower=True), H @ prior_cov).T
 
-            self._state = prior_state + K @ innov
-            self._cov = prior_cov - K @ S @ K.T
-            self._cov = (self._cov + self._cov.T) / 2
+                self._state = prior_state + K @ innov
+                self._cov = prior_cov - K @ S @ K.T
+                self._cov = (self._cov + self._cov.T) / 2
+            self._it_count += 1
+            if _converged(self._state, last_state, prior_cov, self._it_tol):
+                break
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -167,61 +255,132 @@ class EKFilterAN(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
+        zs = np.asarray(zs, dtype=float).reshape(z_len, -1)
         Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
         Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+        if len(kwargs) > 0:
+            # the noise covariances of all measurements are stacked along the first axis
+            M = np.asarray(Ms)
+            R_tilde = M @ np.asarray(Rs) @ np.swapaxes(M, -1, -2)
+        else:
+            R_tilde = self._M @ self._R @ self._M.T
 
         prior_state, prior_cov = self._state, self._cov
 
-        H = self._hjac(prior_state)
-        z_pred = self._h(prior_state)
-        if self._order == 2:
-            HH = self._hhes(prior_state)
-            quad = np.array([np.trace(HH[:, :, i] @ prior_cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
-
-        state_item = 0
-        cov_item1 = cov_item2 = 0
-        for i in range(z_len):
-            S = H @ prior_cov @ H.T + Ms[i] @ Rs[i] @ Ms[i].T
+        H, z_pred = self.__meas_pred()
+        self._it_count = 0
+        for it in range(self._it + 1):
+            last_state = self._state
+            if it > 0:
+                H = self._hjac(self._state)
+                z_pred = self._h(self._state) + H @ (prior_state - self._state)
+                if self._order == 2:
+                    HH = self._hhes(self._state)
+                    quad = _hessian_trace(HH, self._cov)
+                    z_pred += quad / 2
+
+            if self._sequential:
+                state_item = 0
+                cov_item1 = cov_item2 = 0
+                for i in range(z_len):
+                    incre, post_cov = _seq_update(prior_cov, zs[i] - z_pred, H, Ms[i] @ Rs[i] @ Ms[i].T)
+                    state_item += probs[i] * incre
+                    cov_item1 += probs[i] * post_cov
+                    cov_item2 += probs[i] * np.outer(incre, incre)
+
+                self._state = prior_state + state_item
+                self._cov = (1 - np.sum(probs)) * prior_cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
+                self._cov = (self._cov + self._cov.T) / 2
+            else:
+                PHt = prior_cov @ H.T
+                S = H @ PHt + R_tilde
+                self._state, self._cov = _jpda_update(prior_state, prior_cov, zs - z_pred, PHt, S, probs)
+            if it > 0:
+                self._it_count = it
+                if _converged(self._state, last_state, prior_cov, self._it_tol):
+                    break
+        self._cache.clear()
+        # the retrodiction of out-of-sequence measurement can not undo a JPDA update
+        self._oosm = True
+
+        return self._state, self._cov
+
+    def __oosm_stats(self, dt, kwargs):
+        # the retrodicted state and the innovation covariance of out-of-sequence measurement
+        # are shared by distance_OOSM and correct_OOSM
+        F, Q = self._dmodel(dt) if dt is not None and self._dmodel is not None else (None, None)
+        F = kwargs['F'] if 'F' in kwargs else F
+        Q = kwargs['Q'] if 'Q' in kwargs else Q
+        if F is None or Q is None:
+            raise ValueError("'dt' with 'dmodel', or 'F' and 'Q' of the lag must be given")
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        key = ('oosm',) + _cache_key(F, Q, M, R)
+        if key not in self._cache:
+            state_d, cov_d, cross_cov = _retrodict(self._state, self._cov, F, self._L @ Q @ self._L.T, self._last)
+            H = self._hjac(state_d)
+            z_pred = self._h(state_d)
+            S = H @ cov_d @ H.T + M @ R @ M.T
             S = (S + S.T) / 2
-            K = prior_cov @ H.T @ lg.inv(S)
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet, cross_cov @ H.T)
+        return self._cache[key]
+
+    def correct_OOSM(self, z, dt=None, **kwargs):
+        '''
+        Update with an out-of-sequence measurement taken 'dt' before the current scan
+        but after the previous one, in O(1) by one-step-lag retrodiction, see[2]
+
+        The linearized transition F and Q from that time to the current scan are taken
+        from 'dmodel', or from keyword arguments 'F' and 'Q'. 'M' and 'R' of the
+        measurement can be given by keyword arguments too, which only take effect in
+        this call.
+
+        The retrodiction only accounts for the last in-sequence update, not for an
+        earlier out-of-sequence one, so at most one out-of-sequence measurement can be
+        incorporated between two scans, and a RuntimeError is raised for the next one
+        until predict() is called, see 'OOSM_ready'. Nor does it account for the
+        probabilistic update of 'correct_JPDA', after which it is not allowed either. A filter not predicted since init()
+        or reset(), e.g. of a track born in the current scan, has no estimate of the
+        previous scan and raises a RuntimeError too.
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        if self._cross_cov is None:
+            raise RuntimeError('no estimate of the previous scan to retrodict from, predict() must be called after init()')
+        if self._oosm:
+            raise RuntimeError('no more out-of-sequence measurement can be incorporated until predict() is called')
 
-            innov = zs[i] - z_pred
-            incre = np.dot(K, innov)
-            state_item += probs[i] * incre
-            cov_item1 += probs[i] * (prior_cov - K @ S @ K.T)
-            cov_item2 += probs[i] * np.outer(incre, incre)
+        z_pred, S_cho, _, PHt = self.__oosm_stats(dt, kwargs)
+        innov = z - z_pred
+        K = lg.cho_solve(S_cho, PHt.T).T
 
-        self._state = prior_state + state_item
-        self._cov = (1 - np.sum(probs)) * prior_cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
+        self._state = self._state + K @ innov
+        self._cov = self._cov - K @ PHt.T
         self._cov = (self._cov + self._cov.T) / 2
+        self._cache.clear()
+        self._oosm = True
 
-        for _ in range(self._it):
-            H = self._hjac(self._state)
-            z_pred = self._h(self._state) + H @ (prior_state - self._state)
-            if self._order == 2:
-                HH = self._hhes(self._state)
-                quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-                z_pred += quad / 2
-
-            state_item = 0
-            cov_item1 = cov_item2 = 0
-            for i in range(z_len):
-                S = H @ prior_cov @ H.T + Ms[i] @ Rs[i] @ Ms[i].T
-                S = (S + S.T) / 2
-                K = prior_cov @ H.T @ lg.inv(S)
+        return self._state, self._cov
 
-                innov = zs[i] - z_pred
-                incre = np.dot(K, innov)
-                state_item += probs[i] * incre
-                cov_item1 += probs[i] * (prior_cov - K @ S @ K.T)
-                cov_item2 += probs[i] * np.outer(incre, incre)
+    def distance_OOSM(self, z, dt=None, **kwargs):
+        '''
+        Distance of an out-of-sequence measurement, see 'correct_OOSM'
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        if self._cross_cov is None:
+            raise RuntimeError('no estimate of the previous scan to retrodict from, predict() must be called after init()')
+        if self._oosm:
+            raise RuntimeError('no more out-of-sequence measurement can be incorporated until predict() is called')
 
-            self._state = prior_state + state_item
-            self._cov = (1 - np.sum(probs)) * prior_cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
-            self._cov = (self._cov + self._cov.T) / 2
+        z_pred, S_cho, logdet, _ = self.__oosm_stats(dt, kwargs)
+        innov = z - z_pred
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
-        return self._state, self._cov
+        return d
 
     def distance(self, z, **kwargs):
         if self._init == False:
@@ -230,42 +389,58 @@ class EKFilterAN(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        H = self._hjac(self._state)
-        z_pred = self._h(self._state)
-        if self._order == 2:
-            HH = self._hhes(self._state)
-            quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
+        _, z_pred, _, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        R_tilde = M @ R @ M.T
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        H = self._hjac(self._state)
-        z_pred = self._h(self._state)
-        if self._order == 2:
-            HH = self._hhes(self._state)
-            quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
+        _, z_pred, _, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        R_tilde = M @ R @ M.T
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + self._zdim * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
         return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
 
+    @property
+    def OOSM_ready(self):
+        '''
+        Whether an out-of-sequence measurement can still be incorporated by 'correct_OOSM'
+        before the next predict(), which requires predict() to be called after init()
+        and neither 'correct_OOSM' nor 'correct_JPDA' to be called after predict()
+        '''
+        return self._init and self._cross_cov is not None and not self._oosm
+
+    @property
+    def cross_cov(self):
+        '''
+        Cross-covariance between the last posterior and the predicted state, which is
+        recorded by predict() for smoothing
+        '''
+        if self._cross_cov is not None:
+            return self._cross_cov.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cross_cov'" %
+                                 self.__class__.__name__)
+
+    @property
+    def iterations(self):
+        '''
+        Number of relinearization iterations used by the last correction
+        '''
+        return self._it_count
+
 
 class EKFilterNAN(FilterBase):
     '''
@@ -278,6 +453,12 @@ class EKFilterNAN(FilterBase):
     E(v_k*v_j') = R_k*δ_kj
 
     w_k, v_k, x_0 are uncorrelated to each other
+
+    'fjac' returns the Jacobians (F, L) with respect to x and w, and 'hjac' returns
+    (H, M) with respect to x and v. If not given, they are evaluated by central
+    difference with tracklib.math.Jacobian as in EKFilterAN.
+
+    The iterated update is controlled by 'it' and 'it_tol' as in EKFilterAN.
     '''
     def __init__(self,
                  f,
@@ -291,7 +472,8 @@ class EKFilterNAN(FilterBase):
                  fhes=None,
                  hhes=None,
                  order=1,
-                 it=0):
+                 it=0,
+                 it_tol=None):
         super().__init__()
 
         self._f = lambda x, u, w: f(x, u, w)
@@ -303,32 +485,31 @@ class EKFilterNAN(FilterBase):
         self._zdim = zdim
         self._vdim = self._R.shape[0]
         if fjac is None:
-            def fjac(x, u, w):
-                F = num_diff(x, partial(self._f, u=u, w=w), self._xdim)
-                L = num_diff(w, partial(self._f, x, u), self._wdim)
-                return F, L
+            # the Jacobians with respect to the state and the noise are evaluated by
+            # two engines, each differentiating with respect to its first argument
+            fjac_x = Jacobian(self._f, self._xdim)
+            fjac_w = Jacobian(lambda w, x, u: self._f(x, u, w), self._xdim)
+            fjac = lambda x, u, w: (fjac_x(x, u, w), fjac_w(w, x, u))
         self._fjac = fjac
         if hjac is None:
-            def hjac(x, v):
-                H = num_diff(x, partial(self._h, v=v), self._zdim)
-                M = num_diff(v, partial(self._h, x), self._vdim)
-                return H, M
+            hjac_x = Jacobian(self._h, self._zdim)
+            hjac_v = Jacobian(lambda v, x: self._h(x, v), self._zdim)
+            hjac = lambda x, v: (hjac_x(x, v), hjac_v(v, x))
         self._hjac = hjac
         if fhes is None:
-            def fhes(x, u, w):
-                FH = num_diff_hessian(x, partial(self._f, u=u, w=w), self._xdim)
-                return FH
+            fhes = Hessian(self._f, self._xdim)
         self._fhes = fhes
         if hhes is None:
-            def hhes(x, v):
-                HH = num_diff_hessian(x, partial(self._h, v=v), self._zdim)
-                return HH
+            hhes = Hessian(self._h, self._zdim)
         self._hhes = hhes
         if order == 1 or order == 2:
             self._order = order
         else:
             raise ValueError('order must be 1 or 2')
         self._it = it
+        self._it_tol = it_tol
+        self._it_count = 0
+        self._cache = {}
 
     def __str__(self):
         msg = '%s-order nonadditive noise extended Kalman filter' % ('First' if self._order == 1 else 'Second')
@@ -337,15 +518,18 @@ class EKFilterNAN(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cache.clear()
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if 'Q' in kwargs: self._Q[:] = kwargs['Q']
 
@@ -360,51 +544,73 @@ class EKFilterNAN(FilterBase):
 
         if self._order == 2:
             FH = self._fhes(post_state, u, np.zeros(self._wdim))
-            quad = np.array([np.trace(FH[:, :, i] @ post_cov) for i in range(self._xdim)], dtype=float)
+            quad = _hessian_trace(FH, post_cov)
             self._state += quad / 2
+        self._cache.clear()
 
         return self._state, self._cov
 
+    def __meas_pred(self):
+        # the jacobians and predicted measurement only depend on the current state,
+        # so they are evaluated once per cycle
+        if 'pred' not in self._cache:
+            H, M = self._hjac(self._state, np.zeros(self._vdim))
+            z_pred = self._h(self._state, np.zeros(self._vdim))
+            if self._order == 2:
+                HH = self._hhes(self._state, np.zeros(self._vdim))
+                z_pred = z_pred + _hessian_trace(HH, self._cov) / 2
+            self._cache['pred'] = (H, M, z_pred)
+        return self._cache['pred']
+
+    def __innov_stats(self, R):
+        key = _cache_key(R)
+        if key not in self._cache:
+            H, M, z_pred = self.__meas_pred()
+            S = H @ self._cov @ H.T + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S, S_cho, logdet)
+        return self._cache[key]
+
     def correct(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         if 'R' in kwargs: self._R[:] = kwargs['R']
 
-        prior_state, prior_cov = self.state, self._cov
+        prior_state, prior_cov = self._state, self._cov
 
-        H, M = self._hjac(prior_state, np.zeros(self._vdim))
-        z_pred = self._h(prior_state, np.zeros(self._vdim))
-        if self._order == 2:
-            HH = self._hhes(prior_state, np.zeros(self._vdim))
-            quad = np.array([np.trace(HH[:, :, i] @ prior_cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
+        H, _, _ = self.__meas_pred()
+        z_pred, S, S_cho, _ = self.__innov_stats(self._R)
         innov = z - z_pred
-        R_tilde = M @ self._R @ M.T
-        S = H @ prior_cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        K = prior_cov @ H.T @ lg.inv(S)
+        K = lg.cho_solve(S_cho, H @ prior_cov).T
 
         self._state = prior_state + K @ innov
         self._cov = prior_cov - K @ S @ K.T
         self._cov = (self._cov + self._cov.T) / 2
 
+        self._it_count = 0
         for _ in range(self._it):
+            last_state = self._state
             H, M = self._hjac(self._state, np.zeros(self._vdim))
             z_pred = self._h(self._state, np.zeros(self._vdim)) + H @ (prior_state - self._state)
             if self._order == 2:
                 HH = self._hhes(self._state, np.zeros(self._vdim))
-                quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-                z_pred += quad / 2
+                z_pred += _hessian_trace(HH, self._cov) / 2
             innov = z - z_pred
             R_tilde = M @ self._R @ M.T
             S = H @ prior_cov @ H.T + R_tilde
             S = (S + S.T) / 2
-            K = prior_cov @ H.T @ lg.inv(S)
+            K = lg.cho_solve(lg.cho_factor(S, lower=True), H @ prior_cov).T
 
             self._state = prior_state + K @ innov
             self._cov = prior_cov - K @ S @ K.T
             self._cov = (self._cov + self._cov.T) / 2
+            self._it_count += 1
+            if _converged(self._state, last_state, prior_cov, self._it_tol):
+                break
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -413,58 +619,34 @@ class EKFilterNAN(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
-        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+        zs = np.asarray(zs, dtype=float).reshape(z_len, -1)
+        # the noise covariances of all measurements are stacked along the first axis
+        R = np.asarray(kwargs['R']) if 'R' in kwargs else self._R
 
         prior_state, prior_cov = self._state, self._cov
 
-        H, M = self._hjac(prior_state, np.zeros(self._vdim))
-        z_pred = self._h(prior_state, np.zeros(self._vdim))
-        if self._order == 2:    # not suitable for JPDA
-            HH = self._hhes(prior_state, np.zeros(self._vdim))
-            quad = np.array([np.trace(HH[:, :, i] @ prior_cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
-
-        state_item = 0
-        cov_item1 = cov_item2 = 0
-        for i in range(z_len):
-            S = H @ prior_cov @ H.T + M @ Rs[i] @ M.T
-            S = (S + S.T) / 2
-            K = prior_cov @ H.T @ lg.inv(S)
-
-            innov = zs[i] - z_pred
-            incre = np.dot(K, innov)
-            state_item += probs[i] * incre
-            cov_item1 += probs[i] * (prior_cov - K @ S @ K.T)
-            cov_item2 += probs[i] * np.outer(incre, incre)
+        H, M, z_pred = self.__meas_pred()     # second-order term is not suitable for JPDA
 
-        self._state = prior_state + state_item
-        self._cov = (1 - np.sum(probs)) * prior_cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
-        self._cov = (self._cov + self._cov.T) / 2
+        PHt = prior_cov @ H.T
+        S = H @ PHt + M @ R @ M.T
+        self._state, self._cov = _jpda_update(prior_state, prior_cov, zs - z_pred, PHt, S, probs)
 
+        self._it_count = 0
         for _ in range(self._it):
+            last_state = self._state
             H, M = self._hjac(self._state, np.zeros(self._vdim))
             z_pred = self._h(self._state, np.zeros(self._vdim)) + H @ (prior_state - self._state)
             if self._order == 2:
                 HH = self._hhes(self._state, np.zeros(self._vdim))
-                quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-                z_pred += quad / 2
-
-            state_item = 0
-            cov_item1 = cov_item2 = 0
-            for i in range(z_len):
-                S = H @ prior_cov @ H.T + M @ Rs[i] @ M.T
-                S = (S + S.T) / 2
-                K = prior_cov @ H.T @ lg.inv(S)
+                z_pred += _hessian_trace(HH, self._cov) / 2
 
-                innov = zs[i] - z_pred
-                incre = np.dot(K, innov)
-                state_item += probs[i] * incre
-                cov_item1 += probs[i] * (prior_cov - K @ S @ K.T)
-                cov_item2 += probs[i] * np.outer(incre, incre)
-
-            self._state = prior_state + state_item
-            self._cov = (1 - np.sum(probs)) * prior_cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
-            self._cov = (self._cov + self._cov.T) / 2
+            PHt = prior_cov @ H.T
+            S = H @ PHt + M @ R @ M.T
+            self._state, self._cov = _jpda_update(prior_state, prior_cov, zs - z_pred, PHt, S, probs)
+            self._it_count += 1
+            if _converged(self._state, last_state, prior_cov, self._it_tol):
+                break
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -474,37 +656,32 @@ class EKFilterNAN(FilterBase):
 
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        H, M = self._hjac(self._state, np.zeros(self._vdim))
-        z_pred = self._h(self._state, np.zeros(self._vdim))
-        if self._order == 2:
-            HH = self._hhes(self._state, np.zeros(self._vdim))
-            quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
+        z_pred, _, S_cho, logdet = self.__innov_stats(R)
         innov = z - z_pred
-        R_tilde = M @ R @ M.T
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        H, M = self._hjac(self._state, np.zeros(self._vdim))
-        z_pred = self._h(self._state, np.zeros(self._vdim))
-        if self._order == 2:
-            HH = self._hhes(self._state, np.zeros(self._vdim))
-            quad = np.array([np.trace(HH[:, :, i] @ self._cov) for i in range(self._zdim)], dtype=float)
-            z_pred += quad / 2
+        z_pred, _, S_cho, logdet = self.__innov_stats(R)
         innov = z - z_pred
-        R_tilde = M @ R @ M.T
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(innov) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
         return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def iterations(self):
+        '''
+        Number of relinearization iterations used by the last correction
+        '''
+        return self._it_count
@@ -16,14 +16,37 @@ import scipy.linalg as lg
 import scipy.stats as st
 import scipy.special as sl
 from .base import EOFilterBase
-from tracklib.utils import disc_random, ellip_volume
+from tracklib.utils import disc_random, ellip_volume, get_dtype
+from .pf import _reweight, _weighted_mean, _weighted_cov
+
+
+def _log_weights(state_samples, ext_samples, zs, H, R, lamb):
+    '''
+    Log-likelihoods of the measurements 'zs' for the particles stacked along the
+    first axis, the determinants and inverses are batched over all the particles
+    '''
+    state_samples = state_samples.astype(float, copy=False)
+    ext_samples = ext_samples.astype(float, copy=False)
+    Nm = len(zs)
+    cov = ext_samples / 4 + R
+    n = ext_samples.shape[-1] / 2
+    V = np.pi**n * np.sqrt(np.linalg.det(ext_samples)) / sl.gamma(n + 1)
+    log_pmf = Nm * np.log(lamb * V) - lamb * V - sl.gammaln(Nm + 1)
+    _, logdet = np.linalg.slogdet(2 * np.pi * cov)
+
+    d = zs - (state_samples @ H.T)[:, np.newaxis]
+    scatter = np.swapaxes(d, 1, 2) @ d
+    dist = np.trace(np.linalg.solve(cov, scatter), axis1=1, axis2=2) / 2
+    return log_pmf - Nm / 2 * logdet - dist
 
 
 class EOPFilter(EOFilterBase):
     '''
     SMC Extended object particle filter
+
+    If 'pool' is a ParticlePool, the particles are weighted by its worker processes.
     '''
-    def __init__(self, F, H, Q, R, Ns, Neff, df, lamb=None, resample_alg='roulette'):
+    def __init__(self, F, H, Q, R, Ns, Neff, df, lamb=None, resample_alg='roulette', pool=None):
         self._F = F.copy()
         self._H = H.copy()
         self._Q = Q.copy()
@@ -33,6 +56,9 @@ class EOPFilter(EOFilterBase):
         self._df = df
         self._lamb = lamb
         self._resample_alg = resample_alg
+        self._pool = pool
+        self._state_samples = None
+        self._ext_samples = None
         self._init = False
 
     def init(self, state, cov, df, extension):
@@ -40,11 +66,21 @@ class EOPFilter(EOFilterBase):
         self._cov = cov.copy()
         self._ext = extension.copy()
 
-        self._state_samples = st.multivariate_normal.rvs(state, cov, self._Ns)
-        self._ext_samples = st.wishart.rvs(df, extension / df, self._Ns)
-        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=float)
+        dtype = get_dtype()
+        self._state_samples = st.multivariate_normal.rvs(state, cov, self._Ns).astype(dtype)
+        self._ext_samples = st.wishart.rvs(df, extension / df, self._Ns).astype(dtype)
+        if self._pool is not None:
+            self._state_samples = self._pool.share(self._state_samples, out=self._state_samples)
+            self._ext_samples = self._pool.share(self._ext_samples, out=self._ext_samples)
+        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=dtype)
         self._init = True
 
+    def __moments(self):
+        # the moments are accumulated in float64 whatever type the particles are stored in
+        self._ext = np.tensordot(self._weights.astype(float, copy=False), self._ext_samples, axes=1)
+        self._state = _weighted_mean(self._weights, self._state_samples)
+        self._cov = _weighted_cov(self._weights, self._state_samples, self._state)
+
     def predict(self):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
@@ -61,16 +97,7 @@ class EOPFilter(EOFilterBase):
         ]
 
         # compute prior extension, state and covariance
-        self._ext = 0
-        self._state = 0
-        for i in range(self._Ns):
-            self._ext += self._weights[i] * self._ext_samples[i]
-            self._state += self._weights[i] * self._state_samples[i]
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._state_samples[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        self.__moments()
 
         return self._state, self._cov, self._ext
 
@@ -84,28 +111,14 @@ class EOPFilter(EOFilterBase):
         else:
             lamb = self._lamb
 
-        # update weights
-        const_arr = np.zeros(self._Ns)
-        dist_arr = np.zeros(self._Ns)
-        for i in range(self._Ns):
-            cov = self._ext_samples[i] / 4 + self._R
-            V = ellip_volume(self._ext_samples[i])
-            pmf = (lamb * V)**Nm * np.exp(-lamb * V) / sl.factorial(Nm)
-            # pmf = st.poisson.pmf(Nm, lamb * V)    # too slow
-            # pmf = 1
-            const_arr[i] = pmf / lg.det(2 * np.pi * cov)**(Nm / 2)
-
-            d = zs - np.dot(self._H, self._state_samples[i])
-            dist = (lg.inv(cov) @ (d.T @ d)).trace() / 2
-            # dist = 0
-            # for j in range(Nm):
-            #     d = zs[j] - np.dot(self._H, self._state_samples[i])
-            #     dist += d @ cov_inv @ d / 2
-            dist_arr[i] = dist
-        # the underflow problem is avoided by adding offset to exp function
-        exp_term = np.exp(-dist_arr + dist_arr.min())
-        self._weights *= const_arr * exp_term
-        self._weights /= self._weights.sum()
+        # update weights, the underflow problem is avoided in the log domain
+        zs = np.asarray(zs, dtype=float)
+        samples = (self._state_samples, self._ext_samples)
+        if self._pool is None:
+            log_lh = _log_weights(*samples, zs, self._H, self._R, lamb)
+        else:
+            log_lh = self._pool.map(_log_weights, samples, zs, self._H, self._R, lamb, batch=True)
+        _reweight(self._weights, log_lh)
 
         # resample
         Neff = 1 / (self._weights**2).sum()
@@ -118,16 +131,7 @@ class EOPFilter(EOFilterBase):
             self._weights[:] = 1 / self._Ns
 
         # compute posterior extension, state and covariance
-        self._ext = 0
-        self._state = 0
-        for i in range(self._Ns):
-            self._ext += self._weights[i] * self._ext_samples[i]
-            self._state += self._weights[i] * self._state_samples[i]
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._state_samples[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        self.__moments()
 
         return self._state, self._cov, self._ext
 
@@ -207,9 +211,11 @@ class IMMEOPFilter(EOFilterBase):
 
         # update samples
         index_bak = self._index.copy()
-        for i in range(self._Ns):
-            idx, _ = disc_random(self._trans_mat[:, self._index[i]])
-            self._index[i] = idx[0]
+        # the next model of each particle is drawn from the column of transition matrix
+        # of its current model, all at once by comparing against the cumulative columns
+        cdf = np.cumsum(self._trans_mat, axis=0)[:, index_bak]
+        rnd = np.random.rand(self._Ns)
+        self._index[:] = np.minimum((cdf < rnd).sum(axis=0), self._models_n - 1)
         for i in range(self._Ns):
             idx = self._index[i]
             self._ext_samples[i] = self._ext_trans_fcn[idx](
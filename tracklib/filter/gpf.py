@@ -16,8 +16,10 @@ __all__ = ['GPFilter']
 
 import numpy as np
 import scipy.linalg as lg
-from .base import FilterBase
-from tracklib.utils import multi_normal
+import scipy.special as sl
+from .base import FilterBase, _cache_key, _check_dt
+from tracklib.utils import multi_normal, get_dtype
+from .pf import _weighted_mean, _weighted_cov, _log_likelihoods
 
 
 class GPFilter(FilterBase):
@@ -43,6 +45,7 @@ class GPFilter(FilterBase):
         self._Q = Q.copy()
         self._R = R.copy()
         self._Ns = Ns
+        self._cache = {}
 
     def __str__(self):
         msg = 'Gaussian particle filter'
@@ -51,17 +54,41 @@ class GPFilter(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
-        self._samples = np.empty((self._Ns, len(state)))
-        self._weights = np.empty(self._Ns)
+        self._samples = np.empty((self._Ns, len(state)), dtype=get_dtype())
+        self._weights = np.empty(self._Ns, dtype=get_dtype())
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cache.clear()
+
+    def __meas_pred(self):
+        # the prior samples mapped by measurement function are evaluated once per
+        # cycle and shared by distance, likelihood and correct
+        if 'pred' not in self._cache:
+            h_map = np.array([self._h(self._samples[i]) for i in range(self._Ns)], dtype=float)
+            z_pred = np.sum(h_map, axis=0) / self._Ns
+            S_base = _weighted_cov(np.full(self._Ns, 1 / self._Ns), h_map, z_pred)
+            self._cache['pred'] = (h_map, z_pred, S_base)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            h_map, z_pred, S_base = self.__meas_pred()
+            S = S_base + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if len(kwargs) > 0:
             if 'L' in kwargs: self._L[:] = kwargs['L']
@@ -77,13 +104,9 @@ class GPFilter(FilterBase):
             self._samples[i] = self._f(self._samples[i], u) + proc_noi[i]
 
         # compute prior_state and prior_cov, for coasted
-        self._state = np.sum(self._samples, axis=0) / self._Ns
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._samples[i] - self._state
-            self._cov += np.outer(err, err)
-        self._cov /= self._Ns
-        self._cov = (self._cov + self._cov.T) / 2
+        self._state = np.sum(self._samples, axis=0, dtype=float) / self._Ns
+        self._cov = _weighted_cov(np.full(self._Ns, 1 / self._Ns), self._samples, self._state)
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -96,22 +119,18 @@ class GPFilter(FilterBase):
             if 'R' in kwargs: self._R[:] = kwargs['R']
 
         # update weights to approximate the posterior density
+        h_map, _, _ = self.__meas_pred()
         R_tilde = self._M @ self._R @ self._M.T
-        for i in range(self._Ns):
-            # this is not the innovation, just likelihood of measurement for each predicted sample
-            noi = z - self._h(self._samples[i])
-            pdf = 1 / np.sqrt(lg.det(2 * np.pi * R_tilde))
-            pdf *= np.exp(-noi @ lg.inv(R_tilde) @ noi / 2)
-            self._weights[i] = max(pdf, np.finfo(pdf).tiny)
-        self._weights /= np.sum(self._weights)    # normalize
+        # this is not the innovation, just likelihood of measurement for each predicted sample,
+        # R_tilde is factorized once for all the samples. The weights are normalized in float64
+        # in the log domain before they are stored
+        log_lh = _log_likelihoods(z, h_map, R_tilde)
+        self._weights[:] = np.exp(log_lh - sl.logsumexp(log_lh))
 
         # compute post_state and post_cov and the samples have been drawn in predict step
-        self._state = np.dot(self._weights, self._samples)
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._samples[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        self._state = _weighted_mean(self._weights, self._samples)
+        self._cov = _weighted_cov(self._weights, self._samples, self._state)
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -122,40 +141,28 @@ class GPFilter(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.sum(h_map, axis=0) / self._Ns
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         # this is the real innovation, and the covariance fo innovation is uitilized to calculate
         # the likelihood of measurement for predicted measurement
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += np.outer(err, err)
-        S = S / self._Ns + R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.sum(h_map, axis=0) / self._Ns
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += np.outer(err, err)
-        S = S / self._Ns + R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
         return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+'''
+Information filter
+
+REFERENCE:
+[1]. D. Simon, "Optimal State Estimation: Kalman, H Infinity, and Nonlinear Approaches," John Wiley and Sons, Inc., 2006.
+[2]. A. G. O. Mutambara, "Decentralized Estimation and Control for Multisensor Systems," CRC Press, 1998.
+'''
+from __future__ import division, absolute_import, print_function
+
+
+__all__ = ['IKFilter', 'EIKFilterAN']
+
+import numpy as np
+import scipy.linalg as lg
+from .base import FilterBase, _cache_key, _check_dt, _readonly
+from tracklib.math import Jacobian
+from tracklib.utils import cholcov
+
+
+class IKFilter(FilterBase):
+    '''
+    Linear information filter, see[1]
+
+    system model:
+    x_k = F_k-1*x_k-1 + G_k-1*u_k-1 + L_k-1*w_k-1
+    z_k = H_k*x_k + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    The information matrix Y = inv(P) and information state y = inv(P)*x are
+    stored instead of x and P. The measurements of one scan are fused by summing
+    their contributions H'*inv(R)*H and H'*inv(R)*z, see 'correct_multi'. The time
+    update is also done in information form, which requires F to be invertible.
+
+    If 'dmodel' is given, e.g. the return of model.discrete_model, predict(dt=T)
+    takes F and Q of interval T from it instead of the fixed ones.
+    '''
+    def __init__(self, F, L, H, M, Q, R, G=None, at=1, dmodel=None):
+        super().__init__()
+
+        self._F = F.copy()
+        self._L = L.copy()
+        self._H = H.copy()
+        self._M = M.copy()
+        self._Q = Q.copy()
+        self._R = R.copy()
+        if G is None:
+            self._G = G
+        else:
+            self._G = G.copy()
+        self._at = at   # attenuation factor
+        self._dmodel = dmodel
+        self._info = None
+        self._info_state = None
+        self._cache = {}
+        self._factors = {}
+
+    def __str__(self):
+        msg = 'Linear information filter'
+        return msg
+
+    def __to_info(self, state, cov):
+        cov_cho = lg.cho_factor(cov, lower=True)
+        self._info = lg.cho_solve(cov_cho, np.eye(len(state)))
+        self._info = (self._info + self._info.T) / 2
+        self._info_state = self._info @ state
+        self._cache.clear()
+        # the moments are known, no need to recover them from the information form
+        self._cache['pred'] = (state.copy(), cov.copy())
+
+    def __moments(self):
+        # the state and covariance are recovered from the information form once per cycle
+        if 'pred' not in self._cache:
+            info_cho = lg.cho_factor(self._info, lower=True)
+            cov = lg.cho_solve(info_cho, np.eye(len(self._info_state)))
+            cov = (cov + cov.T) / 2
+            state = lg.cho_solve(info_cho, self._info_state)
+            self._cache['pred'] = (state, cov)
+        return self._cache['pred']
+
+    def __factor(self, name, key, fcn):
+        # the factors of the model only change with F, L and Q, so they are kept
+        # across cycles and recomputed when the matrices change
+        entry = self._factors.get(name)
+        if entry is None or entry[0] != key:
+            entry = (key, fcn())
+            self._factors[name] = entry
+        return entry[1]
+
+    def __innov_stats(self, H, M, R):
+        key = _cache_key(H, M, R)
+        if key not in self._cache:
+            state, cov = self.__moments()
+            z_pred = H @ state
+            S = H @ cov @ H.T + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet)
+        return self._cache[key]
+
+    def init(self, state, cov):
+        self.__to_info(state, cov)
+        self._init = True
+
+    def reset(self, state, cov):
+        self.__to_info(state, cov)
+
+    def predict(self, u=None, **kwargs):
+        '''
+        Time update, return the predicted information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'dt' in kwargs:
+                if self._dmodel is None:
+                    raise ValueError("'dt' requires a discretized model 'dmodel'")
+                F, Q = self._dmodel(kwargs['dt'])
+                self._F[:] = F
+                self._Q[:] = Q
+            if 'F' in kwargs: self._F[:] = kwargs['F']
+            if 'G' in kwargs: self._G[:] = kwargs['G']
+            if 'L' in kwargs: self._L[:] = kwargs['L']
+            if 'Q' in kwargs: self._Q[:] = kwargs['Q']
+
+        F_inv = self.__factor('F', _cache_key(self._F), lambda: lg.inv(self._F))
+        # B*B' = L*Q*L'
+        B = self.__factor('Q', _cache_key(self._L, self._Q), lambda: cholcov(self._L @ self._Q @ self._L.T, lower=True))
+
+        # A = inv(F*inv(Y)*F'*at^2), then the predicted information matrix
+        # inv(inv(A) + B*B') = A - A*B*inv(I + B'*A*B)*B'*A by the matrix inversion lemma
+        A = F_inv.T @ self._info @ F_inv / self._at**2
+        A = (A + A.T) / 2
+        AB = A @ B
+        D_cho = lg.cho_factor(np.eye(B.shape[1]) + B.T @ AB, lower=True)
+        info = A - AB @ lg.cho_solve(D_cho, AB.T)
+        info = (info + info.T) / 2
+        # the predicted information state Y_k*(F*x + G*u) with F*x = inv(A)*inv(F')*y/at^2
+        y = F_inv.T @ self._info_state / self._at**2
+        info_state = y - AB @ lg.cho_solve(D_cho, B.T @ y)
+        if u is not None:
+            info_state = info_state + info @ (self._G @ u)
+
+        self._info, self._info_state = info, info_state
+        self._cache.clear()
+
+        return self._info_state, self._info
+
+    def correct(self, z, **kwargs):
+        '''
+        Measurement update, return the updated information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'H' in kwargs: self._H[:] = kwargs['H']
+            if 'M' in kwargs: self._M[:] = kwargs['M']
+            if 'R' in kwargs: self._R[:] = kwargs['R']
+
+        return self.correct_multi([z])
+
+    def correct_multi(self, zs, **kwargs):
+        '''
+        Fuse several measurements of the same scan, their noise are uncorrelated
+        to each other. The keyword arguments 'H', 'M' and 'R' are lists with one
+        matrix per measurement as in 'correct_JPDA' of other filters.
+
+        Returns
+        -------
+            The updated information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        z_len = len(zs)
+        Hs = kwargs['H'] if 'H' in kwargs else [self._H] * z_len
+        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
+        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+
+        info_item = 0
+        info_state_item = 0
+        for i in range(z_len):
+            R_cho = lg.cho_factor(Ms[i] @ Rs[i] @ Ms[i].T, lower=True)
+            HtRi = lg.cho_solve(R_cho, Hs[i]).T
+            info_item += HtRi @ Hs[i]
+            info_state_item += HtRi @ zs[i]
+
+        self._info = self._info + info_item
+        self._info = (self._info + self._info.T) / 2
+        self._info_state = self._info_state + info_state_item
+        self._cache.clear()
+
+        return self._info_state, self._info
+
+    def distance(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_cho, logdet = self.__innov_stats(H, M, R)
+        innov = z - z_pred
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
+
+        return d
+
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_cho, logdet = self.__innov_stats(H, M, R)
+        innov = z - z_pred
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def state(self):
+        if self._info_state is not None:
+            return self.__moments()[0].copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'state'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov(self):
+        if self._info is not None:
+            return self.__moments()[1].copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov'" %
+                                 self.__class__.__name__)
+
+    @property
+    def state_view(self):
+        if self._info_state is not None:
+            return _readonly(self.__moments()[0])
+        else:
+            raise AttributeError("'%s' object has no attribute 'state_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        if self._info is not None:
+            return _readonly(self.__moments()[1])
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def info(self):
+        if self._info is not None:
+            return self._info.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'info'" %
+                                 self.__class__.__name__)
+
+    @property
+    def info_state(self):
+        if self._info_state is not None:
+            return self._info_state.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'info_state'" %
+                                 self.__class__.__name__)
+
+
+class EIKFilterAN(FilterBase):
+    '''
+    Additive extended information filter, see[1, 2]
+
+    system model:
+    x_k = f_k-1(x_k-1, u_k-1) + L_k-1*w_k-1
+    z_k = h_k(x_k) + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    The measurement model is linearized at the current state, then the measurements
+    of one scan are fused in information space as in 'IKFilter'.
+    '''
+    def __init__(self, f, L, h, M, Q, R, xdim, zdim, fjac=None, hjac=None):
+        super().__init__()
+
+        self._f = lambda x, u: f(x, u)
+        self._L = L.copy()
+        self._h = lambda x: h(x)
+        self._M = M.copy()
+        self._Q = Q.copy()
+        self._R = R.copy()
+        self._xdim = xdim
+        self._zdim = zdim
+        if fjac is None:
+            fjac = Jacobian(self._f, self._xdim)
+        self._fjac = fjac
+        if hjac is None:
+            hjac = Jacobian(self._h, self._zdim)
+        self._hjac = hjac
+        self._info = None
+        self._info_state = None
+        self._cache = {}
+
+    def __str__(self):
+        msg = 'Additive noise extended information filter'
+        return msg
+
+    def __to_info(self, state, cov):
+        cov_cho = lg.cho_factor(cov, lower=True)
+        self._info = lg.cho_solve(cov_cho, np.eye(len(state)))
+        self._info = (self._info + self._info.T) / 2
+        self._info_state = self._info @ state
+        self._cache.clear()
+        # the moments are known, no need to recover them from the information form
+        self._cache['pred'] = (state.copy(), cov.copy())
+
+    def __moments(self):
+        # the state and covariance are recovered from the information form once per cycle
+        if 'pred' not in self._cache:
+            info_cho = lg.cho_factor(self._info, lower=True)
+            cov = lg.cho_solve(info_cho, np.eye(len(self._info_state)))
+            cov = (cov + cov.T) / 2
+            state = lg.cho_solve(info_cho, self._info_state)
+            self._cache['pred'] = (state, cov)
+        return self._cache['pred']
+
+    def __meas_pred(self):
+        # the jacobian and predicted measurement at the current state
+        if 'meas' not in self._cache:
+            state, _ = self.__moments()
+            H = self._hjac(state)
+            z_pred = self._h(state)
+            self._cache['meas'] = (H, z_pred)
+        return self._cache['meas']
+
+    def __innov_stats(self, M, R):
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            _, cov = self.__moments()
+            H, z_pred = self.__meas_pred()
+            S = H @ cov @ H.T + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet)
+        return self._cache[key]
+
+    def init(self, state, cov):
+        self.__to_info(state, cov)
+        self._init = True
+
+    def reset(self, state, cov):
+        self.__to_info(state, cov)
+
+    def predict(self, u=None, **kwargs):
+        '''
+        Time update, return the predicted information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
+
+        if len(kwargs) > 0:
+            if 'L' in kwargs: self._L[:] = kwargs['L']
+            if 'Q' in kwargs: self._Q[:] = kwargs['Q']
+
+        post_state, post_cov = self.__moments()
+
+        F = self._fjac(post_state, u)
+        Q_tilde = self._L @ self._Q @ self._L.T
+        state = self._f(post_state, u)
+        cov = F @ post_cov @ F.T + Q_tilde
+        cov = (cov + cov.T) / 2
+        self.__to_info(state, cov)
+
+        return self._info_state, self._info
+
+    def correct(self, z, **kwargs):
+        '''
+        Measurement update, return the updated information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'M' in kwargs: self._M[:] = kwargs['M']
+            if 'R' in kwargs: self._R[:] = kwargs['R']
+
+        return self.correct_multi([z])
+
+    def correct_multi(self, zs, **kwargs):
+        '''
+        Fuse several measurements of the same scan, their noise are uncorrelated
+        to each other. The keyword arguments 'M' and 'R' are lists with one
+        matrix per measurement as in 'correct_JPDA' of other filters.
+
+        Returns
+        -------
+            The updated information state and information matrix
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        z_len = len(zs)
+        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
+        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+
+        state, _ = self.__moments()
+        H, z_pred = self.__meas_pred()
+        # pseudo-measurement of the linearized model
+        z_lin = H @ state - z_pred
+
+        info_item = 0
+        info_state_item = 0
+        for i in range(z_len):
+            R_cho = lg.cho_factor(Ms[i] @ Rs[i] @ Ms[i].T, lower=True)
+            HtRi = lg.cho_solve(R_cho, H).T
+            info_item += HtRi @ H
+            info_state_item += HtRi @ (zs[i] + z_lin)
+
+        self._info = self._info + info_item
+        self._info = (self._info + self._info.T) / 2
+        self._info_state = self._info_state + info_state_item
+        self._cache.clear()
+
+        return self._info_state, self._info
+
+    def distance(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
+        innov = z - z_pred
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
+
+        return d
+
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
+        innov = z - z_pred
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + self._zdim * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def state(self):
+        if self._info_state is not None:
+            return self.__moments()[0].copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'state'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov(self):
+        if self._info is not None:
+            return self.__moments()[1].copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov'" %
+                                 self.__class__.__name__)
+
+    @property
+    def state_view(self):
+        if self._info_state is not None:
+            return _readonly(self.__moments()[0])
+        else:
+            raise AttributeError("'%s' object has no attribute 'state_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        if self._info is not None:
+            return _readonly(self.__moments()[1])
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_view'" %
+                                 self.__class__.__name__)
+
+    @property
+    def info(self):
+        if self._info is not None:
+            return self._info.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'info'" %
+                                 self.__class__.__name__)
+
+    @property
+    def info_state(self):
+        if self._info_state is not None:
+            return self._info_state.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'info_state'" %
+                                 self.__class__.__name__)
@@ -12,9 +12,10 @@ __all__ = ['IMMFilter']
 
 import numbers
 import numpy as np
+from scipy.special import logsumexp
 from collections.abc import Iterable
 from .base import FilterBase
-from tracklib.model import model_switch
+from tracklib.model import model_switch, model_switch_view
 
 
 class IMMFilter(FilterBase):
@@ -46,6 +47,8 @@ class IMMFilter(FilterBase):
             self._probs = np.full(self._models_n, 1 / self._models_n, dtype=float)
         else:
             self._probs = model_probs
+        if switch_fcn is model_switch:
+            switch_fcn = model_switch_view
         self._switch_fcn = switch_fcn
 
     def __str__(self):
@@ -76,8 +79,8 @@ class IMMFilter(FilterBase):
             raise TypeError("index must be an integer, slice or iterable, not '%s'" % n.__class__.__name__)
 
     def __update(self):
-        state_org = [m.state for m in self._models]
-        cov_org = [m.cov for m in self._models]
+        state_org = [m.state_view for m in self._models]
+        cov_org = [m.cov_view for m in self._models]
         types = [t for t in self._types]
 
         xtmp = 0
@@ -144,8 +147,8 @@ class IMMFilter(FilterBase):
         # mixing probability P(M(k-1)|M(k),Z^(k-1))
         mixing_probs /= self._probs.reshape(-1, 1)
         # mixing
-        state_org = [self._models[i].state for i in range(self._models_n)]
-        cov_org = [self._models[i].cov for i in range(self._models_n)]
+        state_org = [self._models[i].state_view for i in range(self._models_n)]
+        cov_org = [self._models[i].cov_view for i in range(self._models_n)]
         types = [self._types[i] for i in range(self._models_n)]
 
         mixed_state = []
@@ -194,7 +197,7 @@ class IMMFilter(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
-        kwargs_list = [{}] * z_len
+        kwargs_list = [{} for _ in range(z_len)]
         # group the keyword arguments
         for key, value in kwargs.items():
             for vi in range(z_len):
@@ -235,6 +238,16 @@ class IMMFilter(FilterBase):
 
         return pdf
 
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        llh = [self._models[i].log_likelihood(z, **kwargs) for i in range(self._models_n)]
+        # log-sum-exp of the mixture
+        llh = logsumexp(llh, b=self._probs)
+
+        return llh
+
     def models(self):
         return self._models
 
@@ -4,15 +4,102 @@ Linear Kalman filter
 
 REFERENCE:
 [1]. D. Simon, "Optimal State Estimation: Kalman, H Infinity, and Nonlinear Approaches," John Wiley and Sons, Inc., 2006.
+[2]. P. Kaminski, A. Bryson and S. Schmidt, "Discrete square root filtering: A survey of current techniques," in IEEE Transactions on Automatic Control, vol. 16, no. 6, pp. 727-736, December 1971.
+[3]. Y. Bar-Shalom, "Update with out-of-sequence measurements in tracking: exact solution," in IEEE Transactions on Aerospace and Electronic Systems, vol. 38, no. 3, pp. 769-777, July 2002.
 '''
 from __future__ import division, absolute_import, print_function
 
 
-__all__ = ['KFilter']
+__all__ = ['KFilter', 'SRKFilter']
 
 import numpy as np
 import scipy.linalg as lg
-from .base import FilterBase
+from .base import FilterBase, _cache_key, _readonly
+from tracklib.utils import cholcov, tria
+
+
+def _seq_update(cov, innov, H, R):
+    '''
+    Process a measurement one component at a time with scalar updates, so no
+    matrix inversion is needed. `innov` is the innovation with respect to the
+    prior state, and a non-diagonal R is decorrelated by its cholesky factor first.
+
+    return the increment of state and the posterior covariance
+    '''
+    r = np.diag(R)
+    if np.count_nonzero(R - np.diag(r)) > 0:
+        C = lg.cholesky(R, lower=True)
+        innov = lg.solve_triangular(C, innov, lower=True)
+        H = lg.solve_triangular(C, H, lower=True)
+        r = np.ones(len(innov))
+
+    incre = np.zeros(cov.shape[0])
+    for i in range(len(innov)):
+        PHt = cov @ H[i]
+        K = PHt / (H[i] @ PHt + r[i])
+        incre = incre + K * (innov[i] - H[i] @ incre)
+        cov = cov - np.outer(K, PHt)
+    cov = (cov + cov.T) / 2
+
+    return incre, cov
+
+
+def _jpda_update(state, cov, innov, PHt, S, probs):
+    '''
+    Batched JPDA update of all the measurements.
+
+    `innov` is of shape (m, zdim). `PHt` is the cross covariance of state and
+    measurement and `S` the innovation covariance, each can be shared by all the
+    measurements or stacked with one per measurement, e.g. S of shape (m, zdim, zdim).
+
+    return the updated state and covariance
+    '''
+    probs = np.asarray(probs, dtype=float)
+    # K' = inv(S)*PHt' is solved for all measurements at once
+    K = np.swapaxes(np.linalg.solve(S, np.swapaxes(PHt, -1, -2)), -1, -2)
+    incres = np.einsum('...ij,...j->...i', K, innov)
+    # K*S*K' = K*PHt'
+    KSKt = K @ np.swapaxes(PHt, -1, -2)
+    if KSKt.ndim == 3:
+        cov_item1 = np.einsum('i,ijk->jk', probs, KSKt)
+    else:
+        cov_item1 = np.sum(probs) * KSKt
+
+    state_item = probs @ incres
+    cov_item2 = incres.T @ (probs[:, np.newaxis] * incres)
+    cov = cov - cov_item1 + (cov_item2 - np.outer(state_item, state_item))
+    cov = (cov + cov.T) / 2
+
+    return state + state_item, cov
+
+
+def _retrodict(state, cov, F, Q, last):
+    '''
+    One-step-lag retrodiction of the current estimate to the time of an out-of-sequence
+    measurement, see[3]. `F` and `Q` are the transition and process noise covariance from
+    that time to the current one, `last` holds the prior covariance, H, M, R and innovation
+    of the last correct(), or is None if there was no measurement since the previous scan.
+
+    return the retrodicted state, its covariance and its cross covariance with the current state
+    '''
+    F_back = lg.inv(F)
+    if last is None:
+        P_xv = P_vv = Q
+        state_d = F_back @ state
+    else:
+        prior_cov, H, M, R, innov = last
+        S = H @ prior_cov @ H.T + M @ R @ M.T
+        S_cho = lg.cho_factor((S + S.T) / 2, lower=True)
+        HQ = H @ Q
+        KQ = lg.cho_solve(S_cho, HQ)
+        P_vv = Q - HQ.T @ KQ
+        P_xv = Q - (H @ prior_cov).T @ KQ
+        state_d = F_back @ (state - HQ.T @ lg.cho_solve(S_cho, innov))
+    cross_cov = (cov - P_xv) @ F_back.T
+    cov_d = F_back @ (cov + P_vv - P_xv - P_xv.T) @ F_back.T
+    cov_d = (cov_d + cov_d.T) / 2
+
+    return state_d, cov_d, cross_cov
 
 
 class KFilter(FilterBase):
@@ -26,8 +113,17 @@ class KFilter(FilterBase):
     E(v_k*v_j') = R_k*δ_kj
 
     w_k, v_k, x_0 are uncorrelated to each other
+
+    If 'sequential' is True, the components of measurement are processed one at a
+    time by scalar updates, which is cheaper when R is diagonal.
+
+    If 'dmodel' is given, e.g. the return of model.discrete_model, predict(dt=T)
+    takes F and Q of interval T from it instead of the fixed ones.
+
+    A measurement taken after the previous scan but arriving after the current one
+    can be incorporated by 'correct_OOSM' without replaying the scans, see[3].
     '''
-    def __init__(self, F, L, H, M, Q, R, G=None, at=1):
+    def __init__(self, F, L, H, M, Q, R, G=None, at=1, sequential=False, dmodel=None):
         super().__init__()
 
         self._F = F.copy()
@@ -41,6 +137,12 @@ class KFilter(FilterBase):
         else:
             self._G = G.copy()
         self._at = at   # attenuation factor
+        self._sequential = sequential
+        self._dmodel = dmodel
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False     # whether an OOSM or a JPDA update has been incorporated since the last predict
+        self._cache = {}
 
     def __str__(self):
         msg = 'Standard linear Kalman filter'
@@ -49,17 +151,44 @@ class KFilter(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cross_cov = None
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
+
+    def __innov_stats(self, H, M, R):
+        # the predicted measurement, innovation covariance and its cholesky factor are
+        # computed once per cycle and shared by distance, likelihood and correct
+        key = _cache_key(H, M, R)
+        if key not in self._cache:
+            z_pred = H @ self._state
+            S = H @ self._cov @ H.T + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         if len(kwargs) > 0:
+            if 'dt' in kwargs:
+                if self._dmodel is None:
+                    raise ValueError("'dt' requires a discretized model 'dmodel'")
+                F, Q = self._dmodel(kwargs['dt'])
+                self._F[:] = F
+                self._Q[:] = Q
             if 'F' in kwargs: self._F[:] = kwargs['F']
             if 'G' in kwargs: self._G[:] = kwargs['G']
             if 'L' in kwargs: self._L[:] = kwargs['L']
@@ -67,9 +196,13 @@ class KFilter(FilterBase):
 
         Q_tilde = self._L @ self._Q @ self._L.T
         ctl = 0 if u is None else self._G @ u
+        self._cross_cov = self._at**2 * self._cov @ self._F.T
         self._state = self._F @ self._state + ctl
-        self._cov = self._at**2 * self._F @ self._cov @ self._F.T + Q_tilde
+        self._cov = self._F @ self._cross_cov + Q_tilde
         self._cov = (self._cov + self._cov.T) / 2
+        self._last = None
+        self._oosm = False
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -82,15 +215,24 @@ class KFilter(FilterBase):
             if 'M' in kwargs: self._M[:] = kwargs['M']
             if 'R' in kwargs: self._R[:] = kwargs['R']
 
-        R_tilde = self._M @ self._R @ self._M.T
-        innov = z - self._H @ self._state
-        S = self._H @ self._cov @ self._H.T + R_tilde
-        S = (S + S.T) / 2
-        K = self._cov @ self._H.T @ lg.inv(S)
+        if self._sequential:
+            innov = z - self._H @ self._state
+            # the innovation is kept for retrodiction of out-of-sequence measurement
+            self._last = (self._cov, self._H.copy(), self._M.copy(), self._R.copy(), innov)
+            incre, self._cov = _seq_update(self._cov, innov, self._H, self._M @ self._R @ self._M.T)
+            self._state = self._state + incre
+            self._cache.clear()
+            return self._state, self._cov
+
+        z_pred, S, S_cho, _ = self.__innov_stats(self._H, self._M, self._R)
+        innov = z - z_pred
+        self._last = (self._cov, self._H.copy(), self._M.copy(), self._R.copy(), innov)
+        K = lg.cho_solve(S_cho, self._H @ self._cov).T
 
         self._state = self._state + K @ innov
         self._cov = self._cov - K @ S @ K.T
         self._cov = (self._cov + self._cov.T) / 2
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -99,29 +241,124 @@ class KFilter(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
-        Hs = kwargs['H'] if 'H' in kwargs else [self._H] * z_len
-        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
-        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+        if self._sequential:
+            Hs = kwargs['H'] if 'H' in kwargs else [self._H] * z_len
+            Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
+            Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+
+            state_item = 0
+            cov_item1 = cov_item2 = 0
+            for i in range(z_len):
+                innov = zs[i] - Hs[i] @ self._state
+                incre, post_cov = _seq_update(self._cov, innov, Hs[i], Ms[i] @ Rs[i] @ Ms[i].T)
+                state_item += probs[i] * incre
+                cov_item1 += probs[i] * post_cov
+                cov_item2 += probs[i] * np.outer(incre, incre)
+
+            self._state = self._state + state_item
+            self._cov = (1 - np.sum(probs)) * self._cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
+            self._cov = (self._cov + self._cov.T) / 2
+            self._cache.clear()
+            # the retrodiction of out-of-sequence measurement can not undo a JPDA update
+            self._oosm = True
+
+            return self._state, self._cov
 
-        state_item = 0
-        cov_item1 = cov_item2 = 0
-        for i in range(z_len):
-            S = Hs[i] @ self._cov @ Hs[i].T + Ms[i] @ Rs[i] @ Ms[i].T
+        if len(kwargs) > 0:
+            # the matrices of all measurements are stacked along the first axis
+            H = np.asarray(kwargs['H']) if 'H' in kwargs else self._H
+            M = np.asarray(kwargs['M']) if 'M' in kwargs else self._M
+            R = np.asarray(kwargs['R']) if 'R' in kwargs else self._R
+            z_pred = np.einsum('...ij,j->...i', H, self._state)
+            S = H @ self._cov @ np.swapaxes(H, -1, -2) + M @ R @ np.swapaxes(M, -1, -2)
+        else:
+            H = self._H
+            z_pred, S, _, _ = self.__innov_stats(self._H, self._M, self._R)
+        PHt = self._cov @ np.swapaxes(H, -1, -2)
+        innov = np.asarray(zs, dtype=float).reshape(z_len, -1) - z_pred
+
+        self._state, self._cov = _jpda_update(self._state, self._cov, innov, PHt, S, probs)
+        self._cache.clear()
+        self._oosm = True
+
+        return self._state, self._cov
+
+    def __oosm_stats(self, dt, kwargs):
+        # the retrodicted state and the innovation covariance of out-of-sequence measurement
+        # are shared by distance_OOSM and correct_OOSM
+        F, Q = self._dmodel(dt) if dt is not None and self._dmodel is not None else (None, None)
+        F = kwargs['F'] if 'F' in kwargs else F
+        Q = kwargs['Q'] if 'Q' in kwargs else Q
+        if F is None or Q is None:
+            raise ValueError("'dt' with 'dmodel', or 'F' and 'Q' of the lag must be given")
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        key = ('oosm',) + _cache_key(F, Q, H, M, R)
+        if key not in self._cache:
+            state_d, cov_d, cross_cov = _retrodict(self._state, self._cov, F, self._L @ Q @ self._L.T, self._last)
+            z_pred = H @ state_d
+            S = H @ cov_d @ H.T + M @ R @ M.T
             S = (S + S.T) / 2
-            K = self._cov @ Hs[i].T @ lg.inv(S)
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet, cross_cov @ H.T)
+        return self._cache[key]
+
+    def correct_OOSM(self, z, dt=None, **kwargs):
+        '''
+        Update with an out-of-sequence measurement taken 'dt' before the current scan
+        but after the previous one, in O(1) by one-step-lag retrodiction, see[3]
+
+        F and Q from that time to the current scan are taken from 'dmodel', or from
+        keyword arguments 'F' and 'Q'. 'H', 'M' and 'R' of the measurement can be given
+        by keyword arguments too, which only take effect in this call.
+
+        The retrodiction only accounts for the last in-sequence update, not for an
+        earlier out-of-sequence one, so at most one out-of-sequence measurement can be
+        incorporated between two scans, and a RuntimeError is raised for the next one
+        until predict() is called, see 'OOSM_ready'. Nor does it account for the
+        probabilistic update of 'correct_JPDA', after which it is not allowed either. A filter not predicted since init()
+        or reset(), e.g. of a track born in the current scan, has no estimate of the
+        previous scan and raises a RuntimeError too.
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        if self._cross_cov is None:
+            raise RuntimeError('no estimate of the previous scan to retrodict from, predict() must be called after init()')
+        if self._oosm:
+            raise RuntimeError('no more out-of-sequence measurement can be incorporated until predict() is called')
 
-            innov = zs[i] - Hs[i] @ self._state
-            incre = np.dot(K, innov)
-            state_item += probs[i] * incre
-            cov_item1 += probs[i] * (self._cov - K @ S @ K.T)
-            cov_item2 += probs[i] * np.outer(incre, incre)
+        z_pred, S_cho, _, PHt = self.__oosm_stats(dt, kwargs)
+        innov = z - z_pred
+        K = lg.cho_solve(S_cho, PHt.T).T
 
-        self._state = self._state + state_item
-        self._cov = (1 - np.sum(probs)) * self._cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
+        self._state = self._state + K @ innov
+        self._cov = self._cov - K @ PHt.T
         self._cov = (self._cov + self._cov.T) / 2
+        self._cache.clear()
+        self._oosm = True
 
         return self._state, self._cov
 
+    def distance_OOSM(self, z, dt=None, **kwargs):
+        '''
+        Distance of an out-of-sequence measurement, see 'correct_OOSM'
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        if self._cross_cov is None:
+            raise RuntimeError('no estimate of the previous scan to retrodict from, predict() must be called after init()')
+        if self._oosm:
+            raise RuntimeError('no more out-of-sequence measurement can be incorporated until predict() is called')
+
+        z_pred, S_cho, logdet, _ = self.__oosm_stats(dt, kwargs)
+        innov = z - z_pred
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
+
+        return d
+
     def distance(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
@@ -130,16 +367,212 @@ class KFilter(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        innov = z - H @ self._state
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        z_pred, _, S_cho, logdet = self.__innov_stats(H, M, R)
+        innov = z - z_pred
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, _, S_cho, logdet = self.__innov_stats(H, M, R)
+        innov = z - z_pred
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
+
+        return llh
 
     def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def OOSM_ready(self):
+        '''
+        Whether an out-of-sequence measurement can still be incorporated by 'correct_OOSM'
+        before the next predict(), which requires predict() to be called after init()
+        and neither 'correct_OOSM' nor 'correct_JPDA' to be called after predict()
+        '''
+        return self._init and self._cross_cov is not None and not self._oosm
+
+    @property
+    def cross_cov(self):
+        '''
+        Cross-covariance between the last posterior and the predicted state, which is
+        recorded by predict() for smoothing
+        '''
+        if self._cross_cov is not None:
+            return self._cross_cov.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cross_cov'" %
+                                 self.__class__.__name__)
+
+
+class SRKFilter(FilterBase):
+    '''
+    Square-root linear Kalman filter, see[1, 2]
+
+    system model:
+    x_k = F_k-1*x_k-1 + G_k-1*u_k-1 + L_k-1*w_k-1
+    z_k = H_k*x_k + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    The lower triangular factor S of the error covariance P = S*S' is propagated
+    instead of P itself, using QR based time and measurement updates, so P stays
+    symmetric and positive semi-definite by construction. The factor is available
+    through 'cov_sqrt' and can be passed to 'multi_normal' with sqrt=True.
+
+    If 'dmodel' is given, e.g. the return of model.discrete_model, predict(dt=T)
+    takes F, Q and the factor of Q of interval T from it instead of the fixed ones.
+    '''
+    def __init__(self, F, L, H, M, Q, R, G=None, at=1, dmodel=None):
+        super().__init__()
+
+        self._F = F.copy()
+        self._L = L.copy()
+        self._H = H.copy()
+        self._M = M.copy()
+        self._Q = Q.copy()
+        self._R = R.copy()
+        if G is None:
+            self._G = G
+        else:
+            self._G = G.copy()
+        self._at = at   # attenuation factor
+        self._dmodel = dmodel
+        self._cov_sqrt = None
+        self._Q_sqrt = self._L @ cholcov(self._Q, lower=True)
+        self._R_sqrt = cholcov(self._R, lower=True)
+        self._cache = {}
+
+    def __str__(self):
+        msg = 'Square-root linear Kalman filter'
+        return msg
+
+    def init(self, state, cov):
+        self._state = state.copy()
+        self._cov_sqrt = cholcov(cov, lower=True)
+        self._cache.clear()
+        self._init = True
+
+    def reset(self, state, cov):
+        self._state = state.copy()
+        self._cov_sqrt = cholcov(cov, lower=True)
+        self._cache.clear()
+
+    def __innov_stats(self, H, M, R):
+        # the pre-array [[M*R^(1/2), H*S], [0, S]] is triangularized to [[S_e, 0], [K_e, S_post]],
+        # where S_e is the factor of innovation covariance and K = K_e*inv(S_e) is the gain
+        key = _cache_key(H, M, R)
+        if key not in self._cache:
+            z_pred = H @ self._state
+            # R is only factorized again if it differs from the one of the filter
+            R_sqrt = M @ (self._R_sqrt if R is self._R else cholcov(R, lower=True))
+            pre = np.block([[R_sqrt, H @ self._cov_sqrt],
+                            [np.zeros((len(self._state), R_sqrt.shape[1])), self._cov_sqrt]])
+            post = tria(pre)
+            logdet = 2 * np.sum(np.log(np.diag(post)[:len(z_pred)]))
+            self._cache[key] = (z_pred, post, logdet)
+        return self._cache[key]
+
+    def predict(self, u=None, **kwargs):
+        '''
+        Time update, return the predicted state and the factor of its covariance
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'dt' in kwargs:
+                if self._dmodel is None:
+                    raise ValueError("'dt' requires a discretized model 'dmodel'")
+                F, Q = self._dmodel(kwargs['dt'])
+                self._F[:] = F
+                self._Q[:] = Q
+            if 'F' in kwargs: self._F[:] = kwargs['F']
+            if 'G' in kwargs: self._G[:] = kwargs['G']
+            if 'L' in kwargs: self._L[:] = kwargs['L']
+            if 'Q' in kwargs: self._Q[:] = kwargs['Q']
+            if 'dt' in kwargs and 'Q' not in kwargs:
+                # the factor of Q is cached by the model along with F and Q
+                self._Q_sqrt = self._L @ self._dmodel.noise_sqrt(kwargs['dt'])
+            elif 'L' in kwargs or 'Q' in kwargs:
+                self._Q_sqrt = self._L @ cholcov(self._Q, lower=True)
+
+        ctl = 0 if u is None else self._G @ u
+        self._state = self._F @ self._state + ctl
+        self._cov_sqrt = tria(np.hstack((self._at * self._F @ self._cov_sqrt, self._Q_sqrt)))
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def correct(self, z, **kwargs):
+        '''
+        Measurement update, return the updated state and the factor of its covariance
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'H' in kwargs: self._H[:] = kwargs['H']
+            if 'M' in kwargs: self._M[:] = kwargs['M']
+            if 'R' in kwargs:
+                self._R[:] = kwargs['R']
+                self._R_sqrt = cholcov(self._R, lower=True)
+
+        z_pred, post, _ = self.__innov_stats(self._H, self._M, self._R)
+        z_dim = len(z_pred)
+        innov = z - z_pred
+
+        self._state = self._state + post[z_dim:, :z_dim] @ lg.solve_triangular(post[:z_dim, :z_dim], innov, lower=True)
+        self._cov_sqrt = post[z_dim:, z_dim:].copy()
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def correct_JPDA(self, zs, probs, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        z_len = len(zs)
+        Hs = kwargs['H'] if 'H' in kwargs else [self._H] * z_len
+        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
+        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+
+        # the updated covariance is a mixture of the prior and the posteriors plus the
+        # spread of the increments, so its factor is formed by stacking their factors
+        miss_prob = max(1 - np.sum(probs), 0)
+        factors = [np.sqrt(miss_prob) * self._cov_sqrt]
+        incres = []
+        for i in range(z_len):
+            z_pred, post, _ = self.__innov_stats(Hs[i], Ms[i], Rs[i])
+            z_dim = len(z_pred)
+
+            innov = zs[i] - z_pred
+            incres.append(post[z_dim:, :z_dim] @ lg.solve_triangular(post[:z_dim, :z_dim], innov, lower=True))
+            factors.append(np.sqrt(probs[i]) * post[z_dim:, z_dim:])
+        incres = np.array(incres).reshape(z_len, -1)
+        state_item = np.dot(probs, incres)
+        # the missed detection hypothesis has zero increment
+        factors.append(np.sqrt(miss_prob) * -state_item[:, np.newaxis])
+        factors.append(np.sqrt(probs) * (incres - state_item).T)
+
+        self._state = self._state + state_item
+        self._cov_sqrt = tria(np.hstack(factors))
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def distance(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
@@ -147,11 +580,49 @@ class KFilter(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        innov = z - H @ self._state
-        S = H @ self._cov @ H.T + R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        z_pred, post, logdet = self.__innov_stats(H, M, R)
+        z_dim = len(z_pred)
+        w = lg.solve_triangular(post[:z_dim, :z_dim], z - z_pred, lower=True)
+        d = w @ w + logdet
+
+        return d
+
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, post, logdet = self.__innov_stats(H, M, R)
+        z_dim = len(z_pred)
+        w = lg.solve_triangular(post[:z_dim, :z_dim], z - z_pred, lower=True)
+        llh = -(w @ w + logdet + z_dim * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
         return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def cov(self):
+        if self._cov_sqrt is not None:
+            return self._cov_sqrt @ self._cov_sqrt.T
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        return _readonly(self.cov)
+
+    @property
+    def cov_sqrt(self):
+        if self._cov_sqrt is not None:
+            return self._cov_sqrt.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_sqrt'" %
+                                 self.__class__.__name__)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+'''
+Bank of linear Kalman filters
+
+The states and covariances of all tracks sharing the same linear model are stored
+in contiguous (N, n) and (N, n, n) arrays, so that the prediction, correction,
+distance and likelihood of all tracks, or of any index subset, are evaluated by
+batched numpy operations rather than by a python loop over filter objects.
+The arrays are stored in the type given by utils.get_dtype, while the updates
+are computed in float64.
+
+REFERENCE:
+[1]. D. Simon, "Optimal State Estimation: Kalman, H Infinity, and Nonlinear Approaches," John Wiley and Sons, Inc., 2006.
+'''
+from __future__ import division, absolute_import, print_function
+
+
+__all__ = ['KFilterBank']
+
+import numpy as np
+from .base import FilterBase, _cache_key
+from tracklib.utils import get_dtype
+
+
+def _tril_solve(L, B):
+    '''
+    Solve L*X = B by forward substitution for the lower triangular matrices L of
+    shape (..., n, n) stacked along the leading axes, and B of shape (..., n, m).
+    The loop only runs over the small dimension n.
+    '''
+    n = L.shape[-1]
+    X = np.empty(np.broadcast_shapes(L.shape[:-2], B.shape[:-2]) + B.shape[-2:])
+    for i in range(n):
+        coef = np.einsum('...j,...jk->...k', L[..., i, :i], X[..., :i, :])
+        X[..., i, :] = (B[..., i, :] - coef) / L[..., i, i, None]
+    return X
+
+
+class KFilterBank(FilterBase):
+    '''
+    Struct-of-arrays standard linear Kalman filter, see[1]
+
+    system model:
+    x_k = F_k-1*x_k-1 + G_k-1*u_k-1 + L_k-1*w_k-1
+    z_k = H_k*x_k + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    All tracks share F, L, H, M, Q, R and G. The keyword arguments of 'correct',
+    'distance' and 'likelihood' can be a single matrix shared by all selected tracks
+    or a stack of matrices, one per selected track, e.g. R of shape (k, zdim, zdim).
+    Unlike KFilter, the keyword arguments only take effect in the current call.
+    The tracks are selected by 'idx', an index array, a slice or a single integer,
+    in which case the leading track axis is dropped from the results.
+
+    If 'dmodel' is given, e.g. the return of model.discrete_model, predict(dt=T)
+    takes F and Q of interval T from it instead of the fixed ones.
+    '''
+    def __init__(self, F, L, H, M, Q, R, G=None, at=1, dmodel=None):
+        super().__init__()
+
+        self._F = F.copy()
+        self._L = L.copy()
+        self._H = H.copy()
+        self._M = M.copy()
+        self._Q = Q.copy()
+        self._R = R.copy()
+        if G is None:
+            self._G = G
+        else:
+            self._G = G.copy()
+        self._at = at   # attenuation factor
+        self._dmodel = dmodel
+        self._cache = {}
+
+    def __str__(self):
+        msg = 'Bank of %d standard linear Kalman filters' % len(self)
+        return msg
+
+    def __len__(self):
+        return 0 if self._state is None else self._state.shape[0]
+
+    def __stack(self, state, cov):
+        state = np.array(state, dtype=get_dtype(), ndmin=2)
+        cov = np.array(cov, dtype=get_dtype())
+        if cov.ndim == 2:
+            cov = np.broadcast_to(cov, (state.shape[0],) + cov.shape).copy()
+        if cov.shape[0] != state.shape[0]:
+            raise ValueError("the lengths of 'state' and 'cov' must be the same")
+        return state, cov
+
+    def __index(self, idx):
+        # a scalar index is turned into a 1-element index so that the selected arrays
+        # keep their leading track axis, the results are squeezed back on return
+        if idx is None or np.ndim(idx) > 0:
+            return idx, False
+        return np.atleast_1d(idx), True
+
+    def __store(self, state, cov, idx):
+        # the updates computed in float64 are cast to the type of the stored arrays
+        if idx is None:
+            self._state = state.astype(self._state.dtype, copy=False)
+            self._cov = cov.astype(self._cov.dtype, copy=False)
+        else:
+            self._state[idx], self._cov[idx] = state, cov
+        self._cache.clear()
+
+    def init(self, state, cov):
+        '''
+        Initial filter bank
+
+        Parameters
+        ----------
+        state : ndarray
+            Initial prior state estimates of shape (N, n)
+        cov : ndarray
+            Initial error convariance matrices of shape (N, n, n), or a single
+            matrix of shape (n, n) shared by all the tracks
+
+        Returns
+        -------
+            None
+        '''
+        self._state, self._cov = self.__stack(state, cov)
+        self._cache.clear()
+        self._init = True
+
+    def reset(self, state, cov, idx=None):
+        state, cov = self.__stack(state, cov)
+        idx, _ = self.__index(idx)
+        if idx is None:
+            self._state, self._cov = state, cov
+        else:
+            self._state[idx] = state
+            self._cov[idx] = cov
+        self._cache.clear()
+
+    def append(self, state, cov):
+        '''
+        Add new tracks into the bank and return their indices
+        '''
+        state, cov = self.__stack(state, cov)
+        if self._init == False:
+            self.init(state, cov)
+            return np.arange(len(self))
+
+        start = len(self)
+        self._state = np.concatenate((self._state, state))
+        self._cov = np.concatenate((self._cov, cov))
+        self._cache.clear()
+        return np.arange(start, len(self))
+
+    def remove(self, idx):
+        '''
+        Remove tracks from the bank, the indices of the remaining tracks are shifted down
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        self._state = np.delete(self._state, idx, axis=0)
+        self._cov = np.delete(self._cov, idx, axis=0)
+        self._cache.clear()
+
+    def predict(self, u=None, idx=None, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        F, Q = self._F, self._Q
+        if 'dt' in kwargs:
+            if self._dmodel is None:
+                raise ValueError("'dt' requires a discretized model 'dmodel'")
+            F, Q = self._dmodel(kwargs['dt'])
+        F = kwargs['F'] if 'F' in kwargs else F
+        G = kwargs['G'] if 'G' in kwargs else self._G
+        L = kwargs['L'] if 'L' in kwargs else self._L
+        Q = kwargs['Q'] if 'Q' in kwargs else Q
+
+        idx, scalar = self.__index(idx)
+        if idx is None:
+            state, cov = self._state, self._cov
+        else:
+            state, cov = self._state[idx], self._cov[idx]
+
+        Q_tilde = L @ Q @ L.T
+        ctl = 0 if u is None else np.dot(u, G.T)
+        state = np.dot(state, F.T) + ctl
+        cov = self._at**2 * F @ cov @ F.T + Q_tilde
+        cov = (cov + np.swapaxes(cov, -1, -2)) / 2
+
+        self.__store(state, cov, idx)
+
+        if scalar:
+            return state[0], cov[0]
+        return state, cov
+
+    def __key(self, idx):
+        return None if idx is None else _cache_key(np.arange(len(self))[idx])
+
+    def __innov_stats(self, idx, kwargs):
+        H = kwargs['H'] if 'H' in kwargs else self._H
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        # the batched cholesky factors are computed once per cycle and shared by
+        # distance, likelihood and correct of the same tracks and matrices
+        key = (self.__key(idx),) + _cache_key(H, M, R)
+        if key not in self._cache:
+            if idx is None:
+                state, cov = self._state, self._cov
+            else:
+                state, cov = self._state[idx], self._cov[idx]
+
+            R_tilde = M @ R @ np.swapaxes(M, -1, -2)
+            z_pred = np.einsum('...ij,...j->...i', H, state)
+            PHt = cov @ np.swapaxes(H, -1, -2)
+            S = H @ PHt + R_tilde
+            S = (S + np.swapaxes(S, -1, -2)) / 2
+            S = np.broadcast_to(S, (state.shape[0],) + S.shape[-2:])
+            S_cho = np.linalg.cholesky(S)
+            logdet = 2 * np.sum(np.log(np.diagonal(S_cho, axis1=-2, axis2=-1)), axis=-1)
+            # W = inv(S_cho)*H*P, so that K = W'*inv(S_cho) and K*S*K' = W'*W
+            W = _tril_solve(S_cho, np.swapaxes(PHt, -1, -2))
+            self._cache[key] = (state, cov, z_pred, W, S_cho, logdet)
+        return self._cache[key]
+
+    def correct(self, z, idx=None, **kwargs):
+        '''
+        Correct the selected tracks, 'z' is of shape (k, zdim) where k is the number
+        of selected tracks, or of shape (zdim,) if all of them observe the same measurement
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        idx, scalar = self.__index(idx)
+        state, cov, z_pred, W, S_cho, _ = self.__innov_stats(idx, kwargs)
+        w = _tril_solve(S_cho, (z - z_pred)[..., None])[..., 0]
+
+        state = state + np.einsum('...ji,...j->...i', W, w)
+        cov = cov - np.swapaxes(W, -1, -2) @ W
+        cov = (cov + np.swapaxes(cov, -1, -2)) / 2
+
+        self.__store(state, cov, idx)
+
+        if scalar:
+            return state[0], cov[0]
+        return state, cov
+
+    def distance(self, z, idx=None, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        idx, scalar = self.__index(idx)
+        _, _, z_pred, _, S_cho, logdet = self.__innov_stats(idx, kwargs)
+        w = _tril_solve(S_cho, (z - z_pred)[..., None])[..., 0]
+        d = np.sum(w**2, axis=-1) + logdet
+
+        return d[0] if scalar else d
+
+    def log_likelihood(self, z, idx=None, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        idx, scalar = self.__index(idx)
+        _, _, z_pred, _, S_cho, logdet = self.__innov_stats(idx, kwargs)
+        w = _tril_solve(S_cho, (z - z_pred)[..., None])[..., 0]
+        llh = -(np.sum(w**2, axis=-1) + logdet + S_cho.shape[-1] * np.log(2 * np.pi)) / 2
+
+        return llh[0] if scalar else llh
+
+    def likelihood(self, z, idx=None, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, idx=idx, **kwargs))
+
+        return np.maximum(pdf, np.finfo(pdf.dtype).tiny)     # prevent likelihood from being too small
@@ -17,9 +17,10 @@ __all__ = ['MMFilter']
 
 import numbers
 import numpy as np
+from scipy.special import logsumexp
 from collections.abc import Iterable
 from .base import FilterBase
-from tracklib.model import model_switch
+from tracklib.model import model_switch, model_switch_view
 
 
 class MMFilter(FilterBase):
@@ -42,6 +43,8 @@ class MMFilter(FilterBase):
             self._probs = np.full(self._models_n, 1 / self._models_n, dtype=float)
         else:
             self._probs = model_probs
+        if switch_fcn is model_switch:
+            switch_fcn = model_switch_view
         self._switch_fcn = switch_fcn
 
     def __str__(self):
@@ -72,8 +75,8 @@ class MMFilter(FilterBase):
             raise TypeError("index must be an integer, slice or iterable, not '%s'" % n.__class__.__name__)
 
     def __update(self):
-        state_org = [m.state for m in self._models]
-        cov_org = [m.cov for m in self._models]
+        state_org = [m.state_view for m in self._models]
+        cov_org = [m.cov_view for m in self._models]
         types = [t for t in self._types]
 
         xtmp = 0
@@ -171,7 +174,7 @@ class MMFilter(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
-        kwargs_list = [{}] * z_len
+        kwargs_list = [{} for _ in range(z_len)]
         # group the keyword arugments
         for key, value in kwargs.items():
             for vi in range(z_len):
@@ -190,6 +193,8 @@ class MMFilter(FilterBase):
         # update posterior state and covariance
         self.__update()
 
+        return self._state, self._cov
+
     def distance(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
@@ -210,6 +215,16 @@ class MMFilter(FilterBase):
 
         return pdf
 
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        llh = [self._models[i].log_likelihood(z, **kwargs) for i in range(self._models_n)]
+        # log-sum-exp of the mixture
+        llh = logsumexp(llh, b=self._probs)
+
+        return llh
+
     def models(self):
         return self._models
 
@@ -9,9 +9,10 @@ __all__ = ['MMMHFilter']
 
 import numbers
 import numpy as np
+from scipy.special import logsumexp
 from collections.abc import Iterable
 from .base import FilterBase
-from tracklib.model import model_switch
+from tracklib.model import model_switch, model_switch_view
 
 
 class MMMMFQueue():
@@ -90,6 +91,8 @@ class MMMHFilter(FilterBase):
             h.put(i)
             self._hypos.append(h)
         self._pruning = pruning
+        if switch_fcn is model_switch:
+            switch_fcn = model_switch_view
         self._switch_fcn = switch_fcn
         self._is_first = True
 
@@ -129,8 +132,8 @@ class MMMHFilter(FilterBase):
         pass
 
     def __update(self):
-        state_org = [m.state for m in self._models]
-        cov_org = [m.cov for m in self._models]
+        state_org = [m.state_view for m in self._models]
+        cov_org = [m.cov_view for m in self._models]
         types = [t for t in self._cur_types]
 
         xtmp = 0
@@ -207,7 +210,7 @@ class MMMHFilter(FilterBase):
         idx = []
         hypos = []
         for i in range(self._models_n):
-            state, cov = self._models[i].state, self._models[i].cov
+            state, cov = self._models[i].state_view, self._models[i].cov_view
             for j in range(len(self._cls)):
                 x = self._switch_fcn(state, self._cur_types[i], self._types[j])
                 P = self._switch_fcn(cov, self._cur_types[i], self._types[j])
@@ -288,3 +291,13 @@ class MMMHFilter(FilterBase):
             pdf += self._probs[i] * self._models[i].likelihood(z, **kwargs)
 
         return pdf
+
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        llh = [self._models[i].log_likelihood(z, **kwargs) for i in range(self._models_n)]
+        # log-sum-exp of the mixture
+        llh = logsumexp(llh, b=self._probs)
+
+        return llh
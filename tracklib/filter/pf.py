@@ -8,16 +8,90 @@ REFERENCE:
 [3]. A. Doucet, J. F. G. de Freitas, and N. J. Gordon, Eds. "Sequential Monte Carlo Methods in Practice," New York: Springer-Verlag, 2001.
 [4]. A. Doucet, S. Godsill and C. Andrieu, "On sequential Monte Carlo sampling methods for Bayesian filtering," Statistics and Computing 10, 197–208 (2000).
 [5]. J. Candy, "Bayesian signal processing: Classical, modern, and particle filtering methods, second edition", Wiley Online Books, 2016
+[6]. D. Fox, "Adapting the Sample Size in Particle Filters Through KLD-Sampling," The International Journal of Robotics Research, vol. 22, no. 12, pp. 985-1003, 2003.
 '''
 from __future__ import division, absolute_import, print_function
 
 
-__all__ = ['SIRPFilter', 'RPFilter', 'EpanechnikovKernal', 'GaussianKernal']
+__all__ = ['SIRPFilter', 'RPFilter', 'EpanechnikovKernal', 'GaussianKernal', 'KLDSampling']
 
+import functools
 import numpy as np
 import scipy.linalg as lg
-from .base import FilterBase
-from tracklib.utils import multi_normal, disc_random, cholcov
+import scipy.special as sl
+import scipy.stats as st
+from .base import FilterBase, _cache_key, _check_dt
+from tracklib.utils import multi_normal, disc_random, cholcov, get_dtype
+
+
+def _transform(fcn, batch, samples, *args, pool=None, shape=None):
+    '''
+    Map the particles stacked along the first axis, the mapped particles are returned
+    stacked in the same way. If 'batch' is True, 'fcn' is called once with all of them.
+    If 'pool' is given, the particles are mapped by its worker processes in chunks, and
+    'shape' is the shape of a mapped particle, see ParticlePool.map.
+    '''
+    if pool is not None:
+        return pool.map(fcn, samples, *args, batch=batch, shape=shape)
+    elif batch:
+        return np.asarray(fcn(samples, *args), dtype=float)
+    else:
+        return np.array([fcn(samples[i], *args) for i in range(len(samples))], dtype=float)
+
+
+def _weighted_mean(weights, samples):
+    '''
+    Weighted mean of the particles stacked along the first axis, which is accumulated
+    in float64 even if the particles are stored in float32
+    '''
+    return np.dot(weights.astype(float, copy=False), samples)
+
+
+def _weighted_cov(weights, samples, mean):
+    '''
+    Weighted covariance of the particles stacked along the first axis
+    '''
+    err = samples - mean
+    cov = (weights * err.T) @ err
+    return (cov + cov.T) / 2
+
+
+def _log_likelihoods(z, h_map, R):
+    '''
+    Gaussian log-likelihoods of measurement 'z' for all the mapped particles, only
+    a single cholesky factorization of R is needed
+    '''
+    R_cho = lg.cholesky(R, lower=True)
+    w = lg.solve_triangular(R_cho, (z - h_map).T, lower=True)
+    logdet = 2 * np.sum(np.log(np.diag(R_cho)))
+    return -(np.sum(w**2, axis=0) + logdet + len(z) * np.log(2 * np.pi)) / 2
+
+
+def _kernal_resample(samples, weights, Ns, resample_alg, index=None):
+    '''
+    Resample the particles for a regularization kernal, and return the resampled
+    particles with the whitening factor D of the empirical covariance D*D', by which
+    the jitter drawn from the unit kernal is scaled. If 'index' is given, the
+    particles it selects are taken instead of drawing Ns of them.
+    '''
+    emp_mean = _weighted_mean(weights, samples)
+    emp_cov = _weighted_cov(weights, samples, emp_mean)
+    D = cholcov(emp_cov, lower=True)
+    if index is None:
+        sample, _ = disc_random(weights, Ns, samples, alg=resample_alg)
+    else:
+        sample = samples[index]
+    return sample, D
+
+
+def _reweight(weights, log_lh):
+    '''
+    Multiply the weights by the likelihoods and normalize them in the log domain
+    by log-sum-exp, so they do not underflow when all the likelihoods are small
+    '''
+    with np.errstate(divide='ignore'):
+        log_w = np.log(weights) + log_lh
+    weights[:] = np.exp(log_w - sl.logsumexp(log_w))
 
 
 class SIRPFilter(FilterBase):
@@ -34,8 +108,22 @@ class SIRPFilter(FilterBase):
 
     note that the transition density is selected as its proposal distribution in SIR filter,
     which is also called condensation filter.
+
+    If 'batch' is True, 'f' and 'h' are called once per cycle with all the particles
+    stacked along the first axis, i.e. f(X, u) and h(X) with X of shape (Ns, xdim).
+
+    If 'pool' is a ParticlePool, the particles are kept in its shared memory and 'f'
+    and 'h' are evaluated by its worker processes in chunks, which pays off when they
+    are expensive. With 'batch', they are called once per chunk instead. 'f' and 'h'
+    should be registered by the 'functions' argument of the pool, otherwise they are
+    pickled with every task. The weights stay in the memory of the main process, since
+    the workers never read them and they are updated there.
+
+    If 'adapt' is a KLDSampling, the number of particles is chosen by it at each
+    resampling within its bounds, starting from 'Ns', and 'Neff' is scaled with the
+    number of particles. The current number is given by the 'Ns' property.
     '''
-    def __init__(self, f, L, h, M, Q, R, Ns, Neff, resample_alg='roulette'):
+    def __init__(self, f, L, h, M, Q, R, Ns, Neff, resample_alg='roulette', batch=False, pool=None, adapt=None):
         super().__init__()
 
         self._f = f
@@ -45,8 +133,14 @@ class SIRPFilter(FilterBase):
         self._Q = Q.copy()
         self._R = R.copy()
         self._Ns = Ns
+        self._Ns_init = Ns
         self._Neff = Neff
         self._resample_alg = resample_alg
+        self._batch = batch
+        self._pool = pool
+        self._adapt = adapt
+        self._samples = None
+        self._cache = {}
 
     def __str__(self):
         msg = 'SIR particle filter'
@@ -55,19 +149,51 @@ class SIRPFilter(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = state.copy()
-        self._samples = multi_normal(state, cov, self._Ns, axis=0)
-        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=float)
+        self._Ns = self._Ns_init
+        self._samples = self.__share(multi_normal(state, cov, self._Ns, axis=0, dtype=get_dtype()))
+        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=get_dtype())
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = state.copy()
-        self._samples = multi_normal(state, cov, self._Ns, axis=0)
-        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=float)
+        self._Ns = self._Ns_init
+        self._samples = self.__share(multi_normal(state, cov, self._Ns, axis=0, dtype=get_dtype()))
+        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=get_dtype())
+        self._cache.clear()
+
+    def __share(self, samples):
+        # the particles are placed in shared memory once and updated in place after
+        if self._pool is None:
+            return samples
+        return self._pool.share(samples, out=self._samples)
+
+    def __meas_pred(self):
+        # the particles mapped by measurement function are evaluated once per cycle
+        # and shared by distance, likelihood and correct
+        if 'pred' not in self._cache:
+            h_map = _transform(self._h, self._batch, self._samples, pool=self._pool, shape=self._M.shape[:1])
+            z_pred = _weighted_mean(self._weights, h_map)
+            S_base = _weighted_cov(self._weights, h_map, z_pred)
+            self._cache['pred'] = (h_map, z_pred, S_base)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            h_map, z_pred, S_base = self.__meas_pred()
+            S = S_base + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if len(kwargs) > 0:
             if 'L' in kwargs: self._L[:] = kwargs['L']
@@ -75,19 +201,15 @@ class SIRPFilter(FilterBase):
 
         # compute prior state and covariance
         # E[x_k+1|z_1:k] = E[f(x_k)+w_k|z_1:k] = E[f(x_k)|z_1:k] = Σf(x_k^i)*w^i
-        f_map = [self._f(self._samples[i], u) for i in range(self._Ns)]
-        self._state = np.dot(self._weights, f_map)
-        self._cov = 0
-        for i in range(self._Ns):
-            err = f_map[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        f_map = _transform(self._f, self._batch, self._samples, u, pool=self._pool, shape=self._samples.shape[1:])
+        self._state = _weighted_mean(self._weights, f_map)
+        self._cov = _weighted_cov(self._weights, f_map, self._state)
 
         # update samples
         Q_tilde = self._L @ self._Q @ self._L.T
         proc_noi = multi_normal(0, Q_tilde, self._Ns, axis=0)
-        for i in range(self._Ns):
-            self._samples[i] = f_map[i] + proc_noi[i]
+        self._samples[:] = f_map + proc_noi
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -100,27 +222,26 @@ class SIRPFilter(FilterBase):
             if 'R' in kwargs: self._R[:] = kwargs['R']
 
         # update weights
+        h_map, _, _ = self.__meas_pred()
         R_tilde = self._M @ self._R @ self._M.T
-        for i in range(self._Ns):
-            noi = z - self._h(self._samples[i])
-            pdf = 1 / np.sqrt(lg.det(2 * np.pi * R_tilde))
-            pdf *= np.exp(-noi @ lg.inv(R_tilde) @ noi / 2)
-            self._weights[i] *= max(pdf, np.finfo(pdf).tiny)
-        self._weights /= self._weights.sum()
+        _reweight(self._weights, _log_likelihoods(z, h_map, R_tilde))
 
         # resample
         Neff = 1 / (self._weights**2).sum()
-        if Neff <= self._Neff:
-            self._samples[:], _ = disc_random(self._weights, self._Ns, self._samples, alg=self._resample_alg)
-            self._weights[:] = 1 / self._Ns
+        if Neff <= self._Neff * self._Ns / self._Ns_init:
+            if self._adapt is not None:
+                index = self._adapt.draw(self._samples, self._weights, self._resample_alg)
+                self._Ns = len(index)
+                samples = self._samples[index]
+            else:
+                samples, _ = disc_random(self._weights, self._Ns, self._samples, alg=self._resample_alg)
+            self._samples = self.__share(samples)
+            self._weights = np.full(self._Ns, 1 / self._Ns, dtype=self._weights.dtype)
 
         # compute posterior state and covariance
-        self._state = np.dot(self._weights, self._samples)
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._samples[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        self._state = _weighted_mean(self._weights, self._samples)
+        self._cov = _weighted_cov(self._weights, self._samples, self._state)
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -131,41 +252,33 @@ class SIRPFilter(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.dot(self._weights, h_map)
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += self._weights[i] * np.outer(err, err)
-        S += R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.dot(self._weights, h_map)
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += self._weights[i] * np.outer(err, err)
-        S += R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
 
-        return max(pdf, np.finfo(pdf).tiny)
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def Ns(self):
+        return self._Ns
 
 class RPFilter(FilterBase):
     '''
@@ -179,8 +292,10 @@ class RPFilter(FilterBase):
 
     w_k, v_k, x_0 are uncorrelated to each other
     mainly solves sample impoverishment problem
+
+    'batch', 'pool' and 'adapt' are the same as in SIRPFilter.
     '''
-    def __init__(self, f, L, h, M, Q, R, Ns, Neff, kernal, resample_alg='roulette'):
+    def __init__(self, f, L, h, M, Q, R, Ns, Neff, kernal, resample_alg='roulette', batch=False, pool=None, adapt=None):
         super().__init__()
 
         self._f = f
@@ -190,9 +305,15 @@ class RPFilter(FilterBase):
         self._Q = Q.copy()
         self._R = R.copy()
         self._Ns = Ns
+        self._Ns_init = Ns
         self._Neff = Neff
         self._kernal = kernal
         self._resample_alg = resample_alg
+        self._batch = batch
+        self._pool = pool
+        self._adapt = adapt
+        self._samples = None
+        self._cache = {}
 
     def __str__(self):
         msg = 'Regularized particle filter'
@@ -201,19 +322,51 @@ class RPFilter(FilterBase):
     def init(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
-        self._samples = multi_normal(state, cov, Ns=self._Ns, axis=0)
-        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=float)
+        self._Ns = self._Ns_init
+        self._samples = self.__share(multi_normal(state, cov, Ns=self._Ns, axis=0, dtype=get_dtype()))
+        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=get_dtype())
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
-        self._samples = multi_normal(state, cov, Ns=self._Ns, axis=0)
-        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=float)
+        self._Ns = self._Ns_init
+        self._samples = self.__share(multi_normal(state, cov, Ns=self._Ns, axis=0, dtype=get_dtype()))
+        self._weights = np.full(self._Ns, 1 / self._Ns, dtype=get_dtype())
+        self._cache.clear()
+
+    def __share(self, samples):
+        # the particles are placed in shared memory once and updated in place after
+        if self._pool is None:
+            return samples
+        return self._pool.share(samples, out=self._samples)
+
+    def __meas_pred(self):
+        # the particles mapped by measurement function are evaluated once per cycle
+        # and shared by distance, likelihood and correct
+        if 'pred' not in self._cache:
+            h_map = _transform(self._h, self._batch, self._samples, pool=self._pool, shape=self._M.shape[:1])
+            z_pred = _weighted_mean(self._weights, h_map)
+            S_base = _weighted_cov(self._weights, h_map, z_pred)
+            self._cache['pred'] = (h_map, z_pred, S_base)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            h_map, z_pred, S_base = self.__meas_pred()
+            S = S_base + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_pred, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if len(kwargs) > 0:
             if 'L' in kwargs: self._L[:] = kwargs['L']
@@ -221,19 +374,15 @@ class RPFilter(FilterBase):
 
         # compute prior state and covariance
         # E[x_k+1|z_1:k] = E[f(x_k)+w_k|z_1:k] = E[f(x_k)|z_1:k] = Σf(x_k^i)*w^i
-        f_map = [self._f(self._samples[i], u) for i in range(self._Ns)]
-        self._state = np.dot(self._weights, f_map)
-        self._cov = 0
-        for i in range(self._Ns):
-            err = f_map[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        f_map = _transform(self._f, self._batch, self._samples, u, pool=self._pool, shape=self._samples.shape[1:])
+        self._state = _weighted_mean(self._weights, f_map)
+        self._cov = _weighted_cov(self._weights, f_map, self._state)
 
         # update samples
         Q_tilde = self._L @ self._Q @ self._L.T
         proc_noi = multi_normal(0, Q_tilde, self._Ns, axis=0)
-        for i in range(self._Ns):
-            self._samples[i] = f_map[i] + proc_noi[i]
+        self._samples[:] = f_map + proc_noi
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -246,27 +395,25 @@ class RPFilter(FilterBase):
             if 'R' in kwargs: self._R[:] = kwargs['R']
 
         # update weights
+        h_map, _, _ = self.__meas_pred()
         R_tilde = self._M @ self._R @ self._M.T
-        for i in range(self._Ns):
-            noi = z - self._h(self._samples[i])
-            pdf = 1 / np.sqrt(lg.det(2 * np.pi * R_tilde))
-            pdf *= np.exp(-noi @ lg.inv(R_tilde) @ noi / 2)
-            self._weights[i] *= max(pdf, np.finfo(pdf).tiny)
-        self._weights /= self._weights.sum()
+        _reweight(self._weights, _log_likelihoods(z, h_map, R_tilde))
 
         # resample and regularize
         Neff = 1 / (self._weights**2).sum()
-        if Neff <= self._Neff:
-            self._samples[:], self._weights[:] = self._kernal.resample(
-                self._samples, self._weights, resample_alg=self._resample_alg)
+        if Neff <= self._Neff * self._Ns / self._Ns_init:
+            index = None
+            if self._adapt is not None:
+                index = self._adapt.draw(self._samples, self._weights, self._resample_alg)
+                self._Ns = len(index)
+            samples, self._weights = self._kernal.resample(
+                self._samples, self._weights, resample_alg=self._resample_alg, Ns=self._Ns, index=index)
+            self._samples = self.__share(samples)
 
         # compute posterior state and covariance
-        self._state = np.dot(self._weights, self._samples)
-        self._cov = 0
-        for i in range(self._Ns):
-            err = self._samples[i] - self._state
-            self._cov += self._weights[i] * np.outer(err, err)
-        self._cov = (self._cov + self._cov.T) / 2
+        self._state = _weighted_mean(self._weights, self._samples)
+        self._cov = _weighted_cov(self._weights, self._samples, self._state)
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -277,41 +424,33 @@ class RPFilter(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.dot(self._weights, h_map)
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += self._weights[i] * np.outer(err, err)
-        S += R_tilde
-        S = (S + S.T) / 2
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        R_tilde = M @ R @ M.T
-        h_map = [self._h(self._samples[i]) for i in range(self._Ns)]
-        z_pred = np.dot(self._weights, h_map)
+        z_pred, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        S = 0
-        for i in range(self._Ns):
-            err = h_map[i] - z_pred
-            S += self._weights[i] * np.outer(err, err)
-        S += R_tilde
-        S = (S + S.T) / 2
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
 
-        return max(pdf, np.finfo(pdf).tiny)
+    @property
+    def Ns(self):
+        return self._Ns
 
 
 class EpanechnikovKernal():
@@ -322,34 +461,26 @@ class EpanechnikovKernal():
         self._dim = dim
         self._Ns = Ns
 
-    def resample(self, samples, weights, resample_alg='roulette'):
-        emp_mean = np.dot(weights, samples)
-        emp_cov = 0
-        for i in range(self._Ns):
-            err = samples[i] - emp_mean
-            emp_cov += weights[i] * np.outer(err, err)
-        emp_cov = (emp_cov + emp_cov.T) / 2
-        D = cholcov(emp_cov, lower=True)
-
-        sample, _ = disc_random(weights, self._Ns, samples, alg=resample_alg)
-        sample = np.array(sample, dtype=float)
-        weight = np.full(weights.shape, 1 / self._Ns, dtype=float)
-
-        # sample from beta distribution
-        beta = np.random.beta(self._dim / 2, 2, self._Ns)
-        # sample from a uniform distribution over unit sphere
-        r = np.random.rand(self._Ns)
-        r = r**(1 / self._dim)      # cdf: r^(1/n)
-        theta = np.random.randn(self._dim, self._Ns)
-        theta = theta / lg.norm(theta, axis=0)       # normalize random vector
-        T = r * theta
-        # sample from epanechnikov kernal
-        eps = np.sqrt(beta) * T
-        sample[:] = sample + self.opt_bandwidth * np.dot(D, eps).T
+    def resample(self, samples, weights, resample_alg='roulette', Ns=None, index=None):
+        # the optimal bandwidth is proportional to Ns^(-1/(dim+4)), and the particles
+        # selected by 'index' are taken if it is given
+        Ns = len(index) if index is not None else self._Ns if Ns is None else Ns
+        bandwidth = self.opt_bandwidth * (self._Ns / Ns)**(1 / (self._dim + 4))
+
+        sample, D = _kernal_resample(samples, weights, Ns, resample_alg, index)
+        weight = np.full(Ns, 1 / Ns, dtype=weights.dtype)
+
+        # the squared radius of the unit epanechnikov kernal follows beta(dim/2, 2),
+        # and its direction is uniform over the unit sphere
+        beta = np.random.beta(self._dim / 2, 2, Ns)
+        eps = np.random.randn(Ns, self._dim)
+        eps *= np.sqrt(beta / np.einsum('ij,ij->i', eps, eps))[:, np.newaxis]
+        sample += eps @ (bandwidth * D.T)
 
         return sample, weight
 
     @staticmethod
+    @functools.lru_cache()
     def unit_hypershpere_volumn(dim):
         if dim % 2 == 0:
             vol = np.pi
@@ -373,20 +504,79 @@ class GaussianKernal():
         self._dim = dim
         self._Ns = Ns
 
-    def resample(self, samples, weights, resample_alg='roulette'):
-        emp_mean = np.dot(weights, samples)
-        emp_cov = 0
-        for i in range(self._Ns):
-            err = samples[i] - emp_mean
-            emp_cov += weights[i] * np.outer(err, err)
-        emp_cov = (emp_cov + emp_cov.T) / 2
-        D = cholcov(emp_cov, lower=True)
+    def resample(self, samples, weights, resample_alg='roulette', Ns=None, index=None):
+        Ns = len(index) if index is not None else self._Ns if Ns is None else Ns
+        bandwidth = self.opt_bandwidth * (self._Ns / Ns)**(1 / (self._dim + 4))
 
-        sample, _ = disc_random(weights, self._Ns, samples, alg=resample_alg)
-        sample = np.array(sample, dtype=float)
-        weight = np.full(weights.shape, 1 / self._Ns, dtype=float)
+        sample, D = _kernal_resample(samples, weights, Ns, resample_alg, index)
+        weight = np.full(Ns, 1 / Ns, dtype=weights.dtype)
 
-        eps = np.random.randn(self._dim, self._Ns)
-        sample[:] = sample + self.opt_bandwidth * np.dot(D, eps).T
+        eps = np.random.randn(Ns, self._dim)
+        sample += eps @ (bandwidth * D.T)
 
         return sample, weight
+
+
+class KLDSampling():
+    '''
+    KLD-sampling policy choosing the number of particles at resampling, see [6]
+
+    The particles are drawn from the weighted particles until their number
+    bounds the Kullback-Leibler divergence between the sample-based and the true
+    posterior by 'epsilon' with probability 1-'delta'. The bound grows with the number
+    k of bins of size 'bin_size' occupied by the drawn particles, so the particle set
+    grows when the posterior spreads out and shrinks when it is tight, between
+    'Ns_min' and 'Ns_max'. 'bin_size' is a scalar or an array of the state dimension.
+    '''
+    def __init__(self, bin_size, Ns_min, Ns_max, epsilon=0.05, delta=0.01):
+        self._bin_size = np.asarray(bin_size, dtype=float)
+        self._Ns_min = Ns_min
+        self._Ns_max = Ns_max
+        self._epsilon = epsilon
+        self._z = st.norm.ppf(1 - delta)
+
+    def bound(self, k):
+        '''
+        The number of particles needed when they occupy k bins, by the Wilson-Hilferty
+        approximation of the chi-square quantile
+        '''
+        k = np.maximum(np.asarray(k, dtype=float) - 1, 1)
+        a = 2 / (9 * k)
+        return np.ceil(k / (2 * self._epsilon) * (1 - a + np.sqrt(a) * self._z)**3)
+
+    def draw(self, samples, weights, resample_alg='roulette'):
+        '''
+        Draw the indices of the resampled particles, the number of particles is the
+        length of the returned indices.
+
+        The particles are drawn in chunks, starting from Ns_min and doubling the number
+        drawn so far, and the chunks are shuffled so that the bound can be met at any
+        draw of a chunk. Only the bins occupied so far are kept between the chunks, so
+        the cost grows with the chosen number rather than with Ns_max.
+        '''
+        dim = np.size(samples[0])
+        bins = np.empty((0, dim))       # bins occupied by the drawn particles
+        chunks = []
+        drawn = 0
+        size = max(self._Ns_min, 1)
+        while drawn < self._Ns_max:
+            size = min(size, self._Ns_max - drawn)
+            _, index = disc_random(weights, size, alg=resample_alg)
+            index = np.random.permutation(index)
+            chunk_bins = np.floor(samples[index] / self._bin_size).reshape(size, dim)
+
+            # the first occurrences in the chunk of the bins not occupied before
+            _, first = np.unique(np.concatenate((bins, chunk_bins)), axis=0, return_index=True)
+            new = np.zeros(size, dtype=bool)
+            new[first[first >= len(bins)] - len(bins)] = True
+            k = len(bins) + np.cumsum(new)
+            n = drawn + np.arange(1, size + 1)
+            met = np.flatnonzero((n >= self.bound(k)) & (n >= self._Ns_min))
+            if len(met) > 0:
+                chunks.append(index[:met[0] + 1])
+                break
+            chunks.append(index)
+            bins = np.concatenate((bins, chunk_bins[new]))
+            drawn += size
+            size = drawn
+        return np.concatenate(chunks)
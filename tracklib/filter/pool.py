@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+'''
+Process pool of particle filters
+'''
+from __future__ import division, absolute_import, print_function
+
+
+__all__ = ['ParticlePool']
+
+import os
+import weakref
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+
+_functions = ()     # functions registered to the pool, set in each worker by _init
+_attached = {}      # shared memory blocks attached by a worker, keyed by name
+
+
+def _init(functions):
+    global _functions
+    _functions = functions
+
+
+def _release(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # arrays still referring to the block keep it mapped until they are freed
+        pass
+
+
+def _attach(name, shape, dtype):
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf)
+
+
+def _detach(live):
+    # the blocks released by the pool are closed in the workers as well
+    for name in [name for name in _attached if name not in live]:
+        _release(_attached.pop(name))
+
+
+def _evaluate(fcn, batch, arrays, args):
+    if batch:
+        return np.asarray(fcn(*arrays, *args), dtype=float)
+    else:
+        return np.array([fcn(*(a[i] for a in arrays), *args) for i in range(len(arrays[0]))], dtype=float)
+
+
+def _task(key, fcn, batch, in_specs, out_spec, live, start, stop, args):
+    _detach(live)
+    if fcn is None:
+        fcn = _functions[key]
+    arrays = [_attach(*spec)[start:stop] for spec in in_specs]
+    mapped = _evaluate(fcn, batch, arrays, args)
+    if out_spec is None:
+        return mapped
+    out = _attach(*out_spec)
+    out[start:stop] = mapped.reshape((stop - start,) + out.shape[1:])
+
+
+def _shutdown(workers, blocks, scratch):
+    while workers:
+        pool = workers.pop()
+        pool.terminate()
+        pool.join()
+    for shm in list(blocks.values()) + list(scratch.values()):
+        _release(shm)
+        shm.unlink()
+    blocks.clear()
+    scratch.clear()
+
+
+class ParticlePool():
+    '''
+    Process pool mapping the particles of particle filters in parallel
+
+    The particles stacked along the first axis are split into chunks which are mapped
+    by the worker processes. The particles and the results are exchanged through
+    blocks of multiprocessing.shared_memory, so only the names of the blocks and the
+    bounds of the chunks are sent to the workers, and the particle cloud is never
+    pickled. The arrays returned by 'share' already live in shared memory and are
+    mapped without copy, other arrays are copied into a scratch block first.
+
+    The functions given by 'functions' are sent to the workers once when they are
+    started, with the 'fork' start method they are inherited instead of being
+    pickled, so closures and lambdas can be registered. Other functions are pickled
+    with every task, so they must be picklable, e.g. module-level functions or
+    methods of picklable objects.
+
+    The pool holds operating system resources, so it should be released by close()
+    or used in a with statement. The shared memory is also released when the pool
+    is garbage collected or the interpreter exits.
+    '''
+    def __init__(self, processes=None, chunks=None, start_method=None, functions=()):
+        self._processes = os.cpu_count() if processes is None else processes
+        # more chunks than processes balance the load if the cost varies among particles
+        self._chunks = self._processes if chunks is None else chunks
+        if start_method is None:
+            start_method = 'fork' if 'fork' in mp.get_all_start_methods() else None
+        self._ctx = mp.get_context(start_method)
+        self._functions = tuple(functions)
+        self._keys = {id(fcn): key for key, fcn in enumerate(self._functions)}
+        self._workers = []      # the worker pool, started by the first map
+        self._blocks = {}       # address of the shared arrays -> shared memory block
+        self._scratch = {}      # role -> shared memory block of copies and results
+        self._finalizer = weakref.finalize(self, _shutdown, self._workers, self._blocks, self._scratch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        msg = 'Particle pool of %d processes' % self._processes
+        return msg
+
+    def __release(self, shm):
+        _release(shm)
+        shm.unlink()
+
+    def __create(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        return arr, shm
+
+    def share(self, arr, out=None):
+        '''
+        Return a copy of 'arr' placed in shared memory. If 'out' is an array returned
+        by share() before with the same shape and type, it is reused.
+        '''
+        arr = np.asarray(arr)
+        if out is not None:
+            addr = out.__array_interface__['data'][0]
+            if addr in self._blocks:
+                if out.shape == arr.shape and out.dtype == arr.dtype:
+                    out[:] = arr
+                    return out
+                self.__release(self._blocks.pop(addr))
+        shared, shm = self.__create(arr.shape, arr.dtype)
+        shared[:] = arr
+        self._blocks[shared.__array_interface__['data'][0]] = shm
+        return shared
+
+    def __scratch_block(self, role, shape, dtype):
+        dtype = np.dtype(dtype)
+        shm = self._scratch.get(role)
+        if shm is None or shm.size < int(np.prod(shape)) * dtype.itemsize:
+            if shm is not None:
+                self.__release(shm)
+            _, shm = self.__create(shape, dtype)
+            self._scratch[role] = shm
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        return arr, (shm.name, shape, dtype.str)
+
+    def __in_spec(self, arr, role):
+        shm = self._blocks.get(arr.__array_interface__['data'][0])
+        if shm is not None and arr.flags.c_contiguous and arr.nbytes <= shm.size:
+            return (shm.name, arr.shape, arr.dtype.str)
+        buf, spec = self.__scratch_block(role, arr.shape, arr.dtype)
+        buf[:] = arr
+        return spec
+
+    def __pool(self):
+        if not self._workers:
+            self._workers.append(self._ctx.Pool(self._processes, initializer=_init, initargs=(self._functions,)))
+        return self._workers[0]
+
+    def map(self, fcn, samples, *args, batch=False, shape=None):
+        '''
+        Map the particles stacked along the first axis of 'samples', or of each array
+        if 'samples' is a tuple, by fcn(x, *args) in the workers, and return the
+        mapped particles stacked in the same way. If 'batch' is True, 'fcn' is called
+        once for each chunk with the particles of the chunk stacked along the first axis.
+
+        If 'shape', the shape of a mapped particle, is given, the workers write the
+        mapped particles into a shared block, otherwise they send back their chunks.
+        '''
+        arrays = samples if isinstance(samples, tuple) else (samples,)
+        arrays = [np.asarray(a) for a in arrays]
+        Ns = len(arrays[0])
+        in_specs = [self.__in_spec(a, 'in%d' % i) for i, a in enumerate(arrays)]
+        if shape is None:
+            out_spec = None
+        else:
+            out, out_spec = self.__scratch_block('out', (Ns,) + tuple(shape), float)
+        key = self._keys.get(id(fcn))
+        live = frozenset(shm.name for shm in list(self._blocks.values()) + list(self._scratch.values()))
+        bounds = np.linspace(0, Ns, self._chunks + 1).astype(int)
+        tasks = [(key, None if key is not None else fcn, batch, in_specs, out_spec, live, start, stop, args)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+        chunks = self.__pool().starmap(_task, tasks)
+        if shape is None:
+            return np.concatenate(chunks)
+        return out.copy()
+
+    def close(self):
+        '''
+        Terminate the workers and release the shared memory
+        '''
+        _shutdown(self._workers, self._blocks, self._scratch)
+
+    @property
+    def processes(self):
+        return self._processes
@@ -20,7 +20,7 @@ __all__ = [
 
 import numpy as np
 import scipy.linalg as lg
-from .base import FilterBase
+from .base import FilterBase, _check_dt
 from tracklib.model import F_poly, H_pos_only
 
 
@@ -367,6 +367,7 @@ class SSFilter(FilterBase):
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         ctl = 0 if u is None else self._G @ u
         self._state = self._F @ self._state + ctl
@@ -393,12 +394,18 @@ class SSFilter(FilterBase):
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         innov = z - self._H @ self._state
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * self._S))
-        pdf *= np.exp(-innov @ lg.inv(self._S) @ innov / 2)
+        S_cho = lg.cho_factor(self._S, lower=True)
+        logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(innov) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
         return max(pdf, np.finfo(pdf).tiny)
@@ -10,19 +10,58 @@ REFERENCE:
 [5]. S. Julier, “The spherical simplex unscented transformation,” American Con- trol Conference, pp. 2430-2434, 2003.
 [6]. E. A. Wan and R. Van Der Merwe, "The unscented Kalman filter for nonlinear estimation," Proceedings of the IEEE, 2000, pp. 153-158.
 [7]. I. Arasaratnam and S. Haykin, "Cubature Kalman Filters," in IEEE Transactions on Automatic Control, vol. 54, no. 6, pp. 1254-1269, June 2009.
+[8]. R. Van der Merwe and E. A. Wan, "The square-root unscented Kalman filter for state and parameter-estimation," 2001 IEEE International Conference on Acoustics, Speech, and Signal Processing, 2001, pp. 3461-3464 vol.6.
+[9]. B. Jia, M. Xin and Y. Cheng, "High-degree cubature Kalman filter," Automatica, vol. 49, no. 2, pp. 510-518, 2013.
 '''
 from __future__ import division, absolute_import, print_function
 
 
 __all__ = [
-    'UKFilterAN', 'UKFilterNAN', 'SimplexSigmaPoints',
-    'SphericalSimplexSigmaPoints', 'SymmetricSigmaPoints', 'ScaledSigmaPoints'
+    'UKFilterAN', 'SRUKFilterAN', 'CKFilterAN', 'UKFilterNAN', 'SimplexSigmaPoints',
+    'SphericalSimplexSigmaPoints', 'SymmetricSigmaPoints', 'ScaledSigmaPoints',
+    'CubaturePoints'
 ]
 
 import numpy as np
 import scipy.linalg as lg
-from .base import FilterBase
-from tracklib.utils import cholcov
+from .base import FilterBase, _cache_key, _check_dt, _readonly
+from .kf import _jpda_update
+from tracklib.utils import cholcov, tria, cholupdate
+
+
+def _transform(fcn, batch, *pts):
+    '''
+    Map the sigma points stacked along the second axis of each of 'pts', the mapped
+    points are returned stacked along the first axis. If 'batch' is True, 'fcn' is
+    called once with all the points stacked along the first axis of its arguments.
+    '''
+    if batch:
+        return np.asarray(fcn(*(p.T for p in pts)), dtype=float)
+    else:
+        return np.array([fcn(*(p[:, i] for p in pts)) for i in range(pts[0].shape[1])], dtype=float)
+
+
+def _moments(w_mean, w_cov, mapped):
+    '''
+    Weighted mean, deviations and covariance of the points stacked along the first axis
+    '''
+    mean = w_mean @ mapped
+    err = mapped - mean
+    cov = (w_cov * err.T) @ err
+    return mean, err, cov
+
+
+def _sqrt_moments(w_cov, err, noise_sqrt):
+    '''
+    Lower triangular factor of the weighted covariance of the deviations stacked along
+    the first axis plus noise_sqrt*noise_sqrt', where the deviations of negative
+    weights are removed by rank-1 downdates
+    '''
+    pos = w_cov >= 0
+    S = tria(np.hstack((np.sqrt(w_cov[pos]) * err[pos].T, noise_sqrt)))
+    for i in np.flatnonzero(~pos):
+        S = cholupdate(S, np.sqrt(-w_cov[i]) * err[i], '-')
+    return S
 
 
 class UKFilterAN(FilterBase):
@@ -36,8 +75,19 @@ class UKFilterAN(FilterBase):
     E(v_k*v_j') = R_k*δ_kj
 
     w_k, v_k, x_0 are uncorrelated to each other
+
+    If 'batch' is True, 'f' and 'h' are called once per cycle with all the sigma
+    points stacked along the first axis, i.e. f(X, u) and h(X) with X of shape
+    (points_num, xdim), and must return the mapped points stacked in the same way.
+    The functions returned by model.f_cv, f_ca, f_ct, h_cv, h_ca and h_ct accept
+    both a single state and stacked states.
+
+    If 'reuse_points' is True, the measurement function is evaluated at the sigma
+    points propagated by predict() instead of the points regenerated from the
+    predicted covariance, which saves a factorization per cycle but ignores the
+    spread added by the process noise.
     '''
-    def __init__(self, f, L, h, M, Q, R, point_generator):
+    def __init__(self, f, L, h, M, Q, R, point_generator, batch=False, reuse_points=False):
         super().__init__()
 
         self._f = f
@@ -47,6 +97,10 @@ class UKFilterAN(FilterBase):
         self._Q = Q.copy()
         self._R = R.copy()
         self._pt_gen = point_generator
+        self._batch = batch
+        self._reuse_points = reuse_points
+        self._cross_cov = None
+        self._cache = {}
 
     def __str__(self):
         msg = 'Additive noise unscented Kalman filter'
@@ -56,37 +110,64 @@ class UKFilterAN(FilterBase):
         self._state = state.copy()
         self._cov = cov.copy()
         self._pt_gen.init(len(state))
+        self._cache.clear()
         self._init = True
 
     def reset(self, state, cov):
         self._state = state.copy()
         self._cov = cov.copy()
+        self._cross_cov = None
+        self._cache.clear()
+
+    def __meas_pred(self):
+        # the sigma points mapped by measurement function only depend on the
+        # current state and covariance, so they are evaluated once per cycle
+        if 'pred' not in self._cache:
+            w_mean, w_cov = self._pt_gen.weights()
+            if 'pts' in self._cache:
+                pts = self._cache['pts']
+            else:
+                pts = self._pt_gen.sigma_points(self._state, self._cov)
+
+            h_map = _transform(self._h, self._batch, pts)
+            z_pred, z_err, S_base = _moments(w_mean, w_cov, h_map)
+            self._cache['pred'] = (z_err, z_pred, S_base)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        # the innovation covariance and its cholesky factor are computed once per cycle
+        # for each measurement noise and shared by distance, likelihood and correct
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            z_err, z_pred, S_base = self.__meas_pred()
+            S = S_base + M @ R @ M.T
+            S = (S + S.T) / 2
+            S_cho = lg.cho_factor(S, lower=True)
+            logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+            self._cache[key] = (z_err, z_pred, S, S_cho, logdet)
+        return self._cache[key]
 
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if len(kwargs) > 0:
             if 'L' in kwargs: self._L[:] = kwargs['L']
             if 'Q' in kwargs: self._Q[:] = kwargs['Q']
 
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
+        post_state = self._state
         pts = self._pt_gen.sigma_points(self._state, self._cov)
 
-        self.__f_map = []
-        self._state = 0
-        for pi in range(pts_num):
-            tmp = self._f(pts[:, pi], u)
-            self.__f_map.append(tmp)
-            self._state += w_mean[pi] * tmp
-
-        self._cov = 0
-        for pi in range(pts_num):
-            err = self.__f_map[pi] - self._state
-            self._cov += w_cov[pi] * np.outer(err, err)
+        self.__f_map = _transform(lambda x: self._f(x, u), self._batch, pts)
+        self._state, err, self._cov = _moments(w_mean, w_cov, self.__f_map)
+        self._cross_cov = (w_cov * (pts - post_state.reshape(-1, 1))) @ err
         self._cov += self._L @ self._Q @ self._L.T
         self._cov = (self._cov + self._cov.T) / 2
+        self._cache.clear()
+        if self._reuse_points:
+            self._cache['pts'] = self.__f_map.T
 
         return self._state, self._cov
 
@@ -98,32 +179,18 @@ class UKFilterAN(FilterBase):
             if 'M' in kwargs: self._M[:] = kwargs['M']
             if 'R' in kwargs: self._R[:] = kwargs['R']
 
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
-        pts = self._pt_gen.sigma_points(self._state, self._cov)
+        z_err, z_pred, S, S_cho, _ = self.__innov_stats(self._M, self._R)
 
-        h_map = []
-        z_pred = 0
-        for pi in range(pts_num):
-            tmp = self._h(pts[:, pi])
-            h_map.append(tmp)
-            z_pred += w_mean[pi] * tmp
-
-        S = 0
-        xz_cov = 0
-        for pi in range(pts_num):
-            z_err = h_map[pi] - z_pred
-            S += w_cov[pi] * np.outer(z_err, z_err)
-            x_err = self.__f_map[pi] - self._state
-            xz_cov += w_cov[pi] * np.outer(x_err, z_err)
-        S += self._M @ self._R @ self._M.T
-        S = (S + S.T) / 2
+        x_err = self.__f_map - self._state
+        xz_cov = (w_cov * x_err.T) @ z_err
         innov = z - z_pred
-        K = xz_cov @ lg.inv(S)
+        K = lg.cho_solve(S_cho, xz_cov.T).T
 
         self._state = self._state + K @ innov
         self._cov = self._cov - K @ S @ K.T
         self._cov = (self._cov + self._cov.T) / 2
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -132,44 +199,23 @@ class UKFilterAN(FilterBase):
             raise RuntimeError('filter must be initialized with init() before use')
 
         z_len = len(zs)
-        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
-        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
-
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
-        pts = self._pt_gen.sigma_points(self._state, self._cov)
+        z_err, z_pred, S_base = self.__meas_pred()
 
-        h_map = []
-        z_pred = 0
-        for pi in range(pts_num):
-            tmp = self._h(pts[:, pi])
-            h_map.append(tmp)
-            z_pred += w_mean[pi] * tmp
-
-        S_base = 0
-        xz_cov = 0
-        for pi in range(pts_num):
-            z_err = h_map[pi] - z_pred
-            S_base += w_cov[pi] * np.outer(z_err, z_err)
-            x_err = self.__f_map[pi] - self._state
-            xz_cov += w_cov[pi] * np.outer(x_err, z_err)
-
-        state_item = 0
-        cov_item1 = cov_item2 = 0
-        for i in range(z_len):
-            S = S_base + Ms[i] @ Rs[i] @ Ms[i].T
-            S = (S + S.T) / 2
-            K = xz_cov @ lg.inv(S)
+        if len(kwargs) > 0:
+            # the noise covariances of all measurements are stacked along the first axis
+            M = np.asarray(kwargs['M']) if 'M' in kwargs else self._M
+            R = np.asarray(kwargs['R']) if 'R' in kwargs else self._R
+            S = S_base + M @ R @ np.swapaxes(M, -1, -2)
+        else:
+            _, _, S, _, _ = self.__innov_stats(self._M, self._R)
 
-            innov = zs[i] - z_pred
-            incre = np.dot(K, innov)
-            state_item += probs[i] * incre
-            cov_item1 += probs[i] * (self._cov - K @ S @ K.T)
-            cov_item2 += probs[i] * np.outer(incre, incre)
+        x_err = self.__f_map - self._state
+        xz_cov = (w_cov * x_err.T) @ z_err
+        innov = np.asarray(zs, dtype=float).reshape(z_len, -1) - z_pred
 
-        self._state = self._state + state_item
-        self._cov = (1 - np.sum(probs)) * self._cov + cov_item1 + (cov_item2 - np.outer(state_item, state_item))
-        self._cov = (self._cov + self._cov.T) / 2
+        self._state, self._cov = _jpda_update(self._state, self._cov, innov, xz_cov, S, probs)
+        self._cache.clear()
 
         return self._state, self._cov
 
@@ -180,57 +226,298 @@ class UKFilterAN(FilterBase):
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        pts_num = self._pt_gen.points_num()
-        w_mean, w_cov = self._pt_gen.weights()
-        pts = self._pt_gen.sigma_points(self._state, self._cov)
-
-        h_map = []
-        z_pred = 0
-        for i in range(pts_num):
-            tmp = self._h(pts[:, i])
-            h_map.append(tmp)
-            z_pred += w_mean[i] * tmp
-
-        S = 0
-        for i in range(pts_num):
-            z_err = h_map[i] - z_pred
-            S += w_cov[i] * np.outer(z_err, z_err)
-        S += M @ R @ M.T
-        S = (S + S.T) / 2
+        _, z_pred, _, S_cho, logdet = self.__innov_stats(M, R)
         innov = z - z_pred
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         M = kwargs['M'] if 'M' in kwargs else self._M
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        pts_num = self._pt_gen.points_num()
+        _, z_pred, _, S_cho, logdet = self.__innov_stats(M, R)
+        innov = z - z_pred
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def cross_cov(self):
+        '''
+        Cross-covariance between the last posterior and the predicted state, which is
+        recorded by predict() for smoothing
+        '''
+        if self._cross_cov is not None:
+            return self._cross_cov.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cross_cov'" %
+                                 self.__class__.__name__)
+
+
+class SRUKFilterAN(FilterBase):
+    '''
+    Square-root unscented Kalman filter, see[8]
+
+    system model:
+    x_k = f_k-1(x_k-1, u_k-1) + L_k-1*w_k-1
+    z_k = h_k(x_k) + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    The lower triangular factor S of the error covariance P = S*S' is propagated
+    instead of P itself, using QR decomposition and rank-1 Cholesky downdates, and
+    is passed to the point generator directly, so no covariance is factorized in
+    predict or correct. The factor is available through 'cov_sqrt'. 'batch' is the
+    same as in UKFilterAN.
+    '''
+    def __init__(self, f, L, h, M, Q, R, point_generator, batch=False):
+        super().__init__()
+
+        self._f = f
+        self._L = L.copy()
+        self._h = h
+        self._M = M.copy()
+        self._Q = Q.copy()
+        self._R = R.copy()
+        self._pt_gen = point_generator
+        self._batch = batch
+        self._cov_sqrt = None
+        self._Q_sqrt = self._L @ cholcov(self._Q, lower=True)
+        self._R_sqrt = cholcov(self._R, lower=True)
+        self._cross_cov = None
+        self._cache = {}
+
+    def __str__(self):
+        msg = 'Square-root additive noise unscented Kalman filter'
+        return msg
+
+    def init(self, state, cov):
+        self._state = state.copy()
+        self._cov_sqrt = cholcov(cov, lower=True)
+        self._pt_gen.init(len(state))
+        self._cross_cov = None
+        self._cache.clear()
+        self._init = True
+
+    def reset(self, state, cov):
+        self._state = state.copy()
+        self._cov_sqrt = cholcov(cov, lower=True)
+        self._cross_cov = None
+        self._cache.clear()
+
+    def __meas_pred(self):
+        # the sigma points and their mapping by measurement function only depend on
+        # the current state and factor, so they are evaluated once per cycle
+        if 'pred' not in self._cache:
+            w_mean, _ = self._pt_gen.weights()
+            pts = self._pt_gen.sigma_points(self._state, self._cov_sqrt, sqrt=True)
+
+            h_map = _transform(self._h, self._batch, pts)
+            z_pred = w_mean @ h_map
+            self._cache['pred'] = (z_pred, h_map - z_pred, pts.T - self._state)
+        return self._cache['pred']
+
+    def __innov_stats(self, M, R):
+        # the factor of innovation covariance and the gain are computed once per cycle
+        # for each measurement noise and shared by distance, likelihood and correct
+        key = _cache_key(M, R)
+        if key not in self._cache:
+            _, w_cov = self._pt_gen.weights()
+            z_pred, z_err, x_err = self.__meas_pred()
+            # R is only factorized again if it differs from the one of the filter
+            R_sqrt = self._R_sqrt if R is self._R else cholcov(R, lower=True)
+            S_z = _sqrt_moments(w_cov, z_err, M @ R_sqrt)
+            xz_cov = (w_cov * x_err.T) @ z_err
+            K = lg.cho_solve((S_z, True), xz_cov.T).T
+            logdet = 2 * np.sum(np.log(np.diag(S_z)))
+            self._cache[key] = (z_pred, S_z, K, logdet)
+        return self._cache[key]
+
+    def __post_sqrt(self, M, R):
+        # P - K*S_z*(K*S_z)' is obtained by downdating the prior factor with the columns of K*S_z
+        key = ('post',) + _cache_key(M, R)
+        if key not in self._cache:
+            _, S_z, K, _ = self.__innov_stats(M, R)
+            self._cache[key] = cholupdate(self._cov_sqrt, K @ S_z, '-')
+        return self._cache[key]
+
+    def predict(self, u=None, **kwargs):
+        '''
+        Time update, return the predicted state and the factor of its covariance
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
+
+        if len(kwargs) > 0:
+            if 'L' in kwargs: self._L[:] = kwargs['L']
+            if 'Q' in kwargs: self._Q[:] = kwargs['Q']
+            if 'L' in kwargs or 'Q' in kwargs:
+                self._Q_sqrt = self._L @ cholcov(self._Q, lower=True)
+
         w_mean, w_cov = self._pt_gen.weights()
-        pts = self._pt_gen.sigma_points(self._state, self._cov)
+        post_state = self._state
+        pts = self._pt_gen.sigma_points(self._state, self._cov_sqrt, sqrt=True)
 
-        h_map = []
-        z_pred = 0
-        for i in range(pts_num):
-            tmp = self._h(pts[:, i])
-            h_map.append(tmp)
-            z_pred += w_mean[i] * tmp
-
-        S = 0
-        for i in range(pts_num):
-            z_err = h_map[i] - z_pred
-            S += w_cov[i] * np.outer(z_err, z_err)
-        S += M @ R @ M.T
-        S = (S + S.T) / 2
-        innov = z - z_pred
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        f_map = _transform(lambda x: self._f(x, u), self._batch, pts)
+        self._state = w_mean @ f_map
+        err = f_map - self._state
+        self._cross_cov = (w_cov * (pts - post_state.reshape(-1, 1))) @ err
+        self._cov_sqrt = _sqrt_moments(w_cov, err, self._Q_sqrt)
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def correct(self, z, **kwargs):
+        '''
+        Measurement update, return the updated state and the factor of its covariance
+        '''
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        if len(kwargs) > 0:
+            if 'M' in kwargs: self._M[:] = kwargs['M']
+            if 'R' in kwargs:
+                self._R[:] = kwargs['R']
+                self._R_sqrt = cholcov(self._R, lower=True)
+
+        z_pred, _, K, _ = self.__innov_stats(self._M, self._R)
+
+        self._state = self._state + K @ (z - z_pred)
+        self._cov_sqrt = self.__post_sqrt(self._M, self._R)
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def correct_JPDA(self, zs, probs, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        z_len = len(zs)
+        Ms = kwargs['M'] if 'M' in kwargs else [self._M] * z_len
+        Rs = kwargs['R'] if 'R' in kwargs else [self._R] * z_len
+
+        # the updated covariance is a mixture of the prior and the posteriors plus the
+        # spread of the increments, so its factor is formed by stacking their factors
+        miss_prob = max(1 - np.sum(probs), 0)
+        factors = [np.sqrt(miss_prob) * self._cov_sqrt]
+        incres = []
+        for i in range(z_len):
+            M, R = np.asarray(Ms[i]), np.asarray(Rs[i])
+            z_pred, _, K, _ = self.__innov_stats(M, R)
+            incres.append(K @ (zs[i] - z_pred))
+            factors.append(np.sqrt(probs[i]) * self.__post_sqrt(M, R))
+        incres = np.array(incres).reshape(z_len, -1)
+        state_item = np.dot(probs, incres)
+        # the missed detection hypothesis has zero increment
+        factors.append(np.sqrt(miss_prob) * -state_item[:, np.newaxis])
+        factors.append(np.sqrt(probs) * (incres - state_item).T)
+
+        self._state = self._state + state_item
+        self._cov_sqrt = tria(np.hstack(factors))
+        self._cache.clear()
+
+        return self._state, self._cov_sqrt
+
+    def distance(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_z, _, logdet = self.__innov_stats(M, R)
+        w = lg.solve_triangular(S_z, z - z_pred, lower=True)
+        d = w @ w + logdet
+
+        return d
+
+    def log_likelihood(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('filter must be initialized with init() before use')
+
+        M = kwargs['M'] if 'M' in kwargs else self._M
+        R = kwargs['R'] if 'R' in kwargs else self._R
+
+        z_pred, S_z, _, logdet = self.__innov_stats(M, R)
+        w = lg.solve_triangular(S_z, z - z_pred, lower=True)
+        llh = -(w @ w + logdet + len(z_pred) * np.log(2 * np.pi)) / 2
 
-        return max(pdf, np.finfo(pdf).tiny)
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
+
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
+
+    @property
+    def cov(self):
+        if self._cov_sqrt is not None:
+            return self._cov_sqrt @ self._cov_sqrt.T
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cov_view(self):
+        return _readonly(self.cov)
+
+    @property
+    def cov_sqrt(self):
+        if self._cov_sqrt is not None:
+            return self._cov_sqrt.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cov_sqrt'" %
+                                 self.__class__.__name__)
+
+    @property
+    def cross_cov(self):
+        '''
+        Cross-covariance between the last posterior and the predicted state, which is
+        recorded by predict() for smoothing
+        '''
+        if self._cross_cov is not None:
+            return self._cross_cov.copy()
+        else:
+            raise AttributeError("'%s' object has no attribute 'cross_cov'" %
+                                 self.__class__.__name__)
+
+
+class CKFilterAN(UKFilterAN):
+    '''
+    Cubature Kalman filter, see[7, 9]
+
+    system model:
+    x_k = f_k-1(x_k-1, u_k-1) + L_k-1*w_k-1
+    z_k = h_k(x_k) + M_k*v_k
+    E(w_k*w_j') = Q_k*δ_kj
+    E(v_k*v_j') = R_k*δ_kj
+
+    w_k, v_k, x_0 are uncorrelated to each other
+
+    It is the additive noise unscented Kalman filter using the spherical-radial
+    cubature points of CubaturePoints. The third-degree rule has 2n equally weighted
+    points and the fifth-degree rule 2n^2+1 points. 'batch' and 'reuse_points' are
+    the same as in UKFilterAN.
+    '''
+    def __init__(self, f, L, h, M, Q, R, degree=3, batch=False, reuse_points=False):
+        super().__init__(f, L, h, M, Q, R, CubaturePoints(degree), batch=batch, reuse_points=reuse_points)
+        self._degree = degree
+
+    def __str__(self):
+        msg = '%s-degree cubature Kalman filter' % ('Third' if self._degree == 3 else 'Fifth')
+        return msg
 
 
 class UKFilterNAN(FilterBase):
@@ -244,8 +531,11 @@ class UKFilterNAN(FilterBase):
     E(v_k*v_j') = R_k*δ_kj
 
     w_k, v_k, x_0 are uncorrelated to each other
+
+    If 'batch' is True, 'f' and 'h' are called once per cycle with all the sigma
+    points stacked along the first axis, i.e. f(X, u, W) and h(X, V).
     '''
-    def __init__(self, f, h, Q, R, point_generator, epsilon=0.01):
+    def __init__(self, f, h, Q, R, point_generator, epsilon=0.01, batch=False):
         super().__init__()
 
         self._f = f
@@ -255,6 +545,7 @@ class UKFilterNAN(FilterBase):
         self._Q = Q + epsilon * np.diag(Q.diagonal())
         self._R = R + epsilon * np.diag(R.diagonal())
         self._pt_gen = point_generator
+        self._batch = batch
 
     def __str__(self):
         msg = 'Nonadditive noise unscented Kalman filter'
@@ -273,11 +564,11 @@ class UKFilterNAN(FilterBase):
     def predict(self, u=None, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
+        _check_dt(kwargs)
 
         if 'Q' in kwargs: self._Q[:] = kwargs['Q']
 
         xdim, wdim, vdim = self._state.shape[0], self._Q.shape[0], self._R.shape[0]
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
 
         cov_asm = lg.block_diag(self._cov, self._Q, self._R)
@@ -286,17 +577,8 @@ class UKFilterNAN(FilterBase):
         pts = pts_asm[:xdim]
         w_pts = pts_asm[xdim:xdim + wdim]
 
-        self.__f_map = []
-        self._state = 0
-        for i in range(pts_num):
-            tmp = self._f(pts[:, i], u, w_pts[:, i])
-            self.__f_map.append(tmp)
-            self._state += w_mean[i] * tmp
-
-        self._cov = 0
-        for i in range(pts_num):
-            err = self.__f_map[i] - self._state
-            self._cov += w_cov[i] * np.outer(err, err)
+        self.__f_map = _transform(lambda x, w: self._f(x, u, w), self._batch, pts, w_pts)
+        self._state, _, self._cov = _moments(w_mean, w_cov, self.__f_map)
         self._cov = (self._cov + self._cov.T) / 2
 
         return self._state, self._cov
@@ -308,7 +590,6 @@ class UKFilterNAN(FilterBase):
         if 'R' in kwargs: self._R[:] = kwargs['R']
 
         xdim, wdim, vdim = self._state.shape[0], self._Q.shape[0], self._R.shape[0]
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
 
         cov_asm = lg.block_diag(self._cov, self._Q, self._R)
@@ -317,24 +598,15 @@ class UKFilterNAN(FilterBase):
         pts = pts_asm[:xdim]
         v_pts = pts_asm[xdim + wdim:]
 
-        h_map = []
-        z_pred = 0
-        for i in range(pts_num):
-            tmp = self._h(pts[:, i], v_pts[:, i])
-            h_map.append(tmp)
-            z_pred += w_mean[i] * tmp
-
-        S = 0
-        xz_cov = 0
-        for i in range(pts_num):
-            z_err = h_map[i] - z_pred
-            S += w_cov[i] * np.outer(z_err, z_err)
-            x_err = self.__f_map[i] - self._state
-            xz_cov += w_cov[i] * np.outer(x_err, z_err)
+        h_map = _transform(self._h, self._batch, pts, v_pts)
+        z_pred, z_err, S = _moments(w_mean, w_cov, h_map)
         S = (S + S.T) / 2
+        x_err = self.__f_map - self._state
+        xz_cov = (w_cov * x_err.T) @ z_err
 
         innov = z - z_pred
-        K = xz_cov @ lg.inv(S)
+        S_cho = lg.cho_factor(S, lower=True)
+        K = lg.cho_solve(S_cho, xz_cov.T).T
 
         self._state = self._state + K @ innov
         self._cov = self._cov - K @ S @ K.T
@@ -348,7 +620,6 @@ class UKFilterNAN(FilterBase):
 
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
 
         cov_asm = lg.block_diag(self._cov, self._Q, R)
@@ -357,30 +628,22 @@ class UKFilterNAN(FilterBase):
         pts = pts_asm[:len(self._state)]
         v_pts = pts_asm[len(self._state) + self._Q.shape[0]:]
 
-        h_map = []
-        z_pred = 0
-        for i in range(pts_num):
-            tmp = self._h(pts[:, i], v_pts[:, i])
-            h_map.append(tmp)
-            z_pred += w_mean[i] * tmp
-
-        S = 0
-        for i in range(pts_num):
-            z_err = h_map[i] - z_pred
-            S += w_cov[i] * np.outer(z_err, z_err)
+        h_map = _transform(self._h, self._batch, pts, v_pts)
+        z_pred, _, S = _moments(w_mean, w_cov, h_map)
         S = (S + S.T) / 2
         innov = z - z_pred
-        d = innov @ lg.inv(S) @ innov + np.log(lg.det(S))
+        S_cho = lg.cho_factor(S, lower=True)
+        logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+        d = innov @ lg.cho_solve(S_cho, innov) + logdet
 
         return d
 
-    def likelihood(self, z, **kwargs):
+    def log_likelihood(self, z, **kwargs):
         if self._init == False:
             raise RuntimeError('filter must be initialized with init() before use')
 
         R = kwargs['R'] if 'R' in kwargs else self._R
 
-        pts_num = self._pt_gen.points_num()
         w_mean, w_cov = self._pt_gen.weights()
 
         cov_asm = lg.block_diag(self._cov, self._Q, R)
@@ -389,23 +652,20 @@ class UKFilterNAN(FilterBase):
         pts = pts_asm[:len(self._state)]
         v_pts = pts_asm[len(self._state) + self._Q.shape[0]:]
 
-        h_map = []
-        z_pred = 0
-        for i in range(pts_num):
-            tmp = self._h(pts[:, i], v_pts[:, i])
-            h_map.append(tmp)
-            z_pred += w_mean[i] * tmp
-
-        S = 0
-        for i in range(pts_num):
-            z_err = h_map[i] - z_pred
-            S += w_cov[i] * np.outer(z_err, z_err)
+        h_map = _transform(self._h, self._batch, pts, v_pts)
+        z_pred, _, S = _moments(w_mean, w_cov, h_map)
         S = (S + S.T) / 2
         innov = z - z_pred
-        pdf = 1 / np.sqrt(lg.det(2 * np.pi * S))
-        pdf *= np.exp(-innov @ lg.inv(S) @ innov / 2)
+        S_cho = lg.cho_factor(S, lower=True)
+        logdet = 2 * np.sum(np.log(np.diag(S_cho[0])))
+        llh = -(innov @ lg.cho_solve(S_cho, innov) + logdet + len(innov) * np.log(2 * np.pi)) / 2
+
+        return llh
+
+    def likelihood(self, z, **kwargs):
+        pdf = np.exp(self.log_likelihood(z, **kwargs))
 
-        return max(pdf, np.finfo(pdf).tiny)
+        return max(pdf, np.finfo(pdf).tiny)     # prevent likelihood from being too small
 
 
 class SimplexSigmaPoints():
@@ -420,6 +680,23 @@ class SimplexSigmaPoints():
         self._w[0] = self._w0
         self._w[1: 3] = (1 - self._w0) / 2**dim
         self._w[3: dim + 2] = (2**np.arange(1, dim)) * self._w[1]
+
+        # the unit sigma points only depend on the dimension, so they are built once
+        psi = np.zeros(dim + 2).tolist()
+        psi[0] = np.array([0], dtype=float)
+        psi[1] = np.array([-1 / np.sqrt(2 * self._w[1])], dtype=float)
+        psi[2] = np.array([1 / np.sqrt(2 * self._w[1])], dtype=float)
+        for j in range(2, dim + 1):
+            for i in range(j + 2):
+                if i == 0:
+                    psi[i] = np.concatenate((psi[0], np.zeros(1)))
+                elif i == j + 1:
+                    tmp = np.array([1 / np.sqrt(2 * self._w[j + 1])], dtype=float)
+                    psi[i] = np.concatenate((np.zeros(j - 1), tmp))
+                else:
+                    tmp = np.array([-1 / np.sqrt(2 * self._w[j + 1])], dtype=float)
+                    psi[i] = np.concatenate((psi[i], tmp))
+        self._psi = np.array(psi, dtype=float).T
         self._init = True
 
     def points_num(self):
@@ -432,28 +709,13 @@ class SimplexSigmaPoints():
             raise RuntimeError('point generator must be initialized with init() before use')
         return self._w, self._w
 
-    def sigma_points(self, mean, cov):
+    def sigma_points(self, mean, cov, sqrt=False):
         if self._init == False:
             raise RuntimeError('point generator must be initialized with init() before use')
-        # P = C * C'
-        cov_sqrt = cholcov(cov, lower=True)
+        # P = C * C', and 'cov' is C itself if 'sqrt' is True
+        cov_sqrt = cov if sqrt else cholcov(cov, lower=True)
 
-        psi = np.zeros(self._dim + 2).tolist()
-        psi[0] = np.array([0], dtype=float)
-        psi[1] = np.array([-1 / np.sqrt(2 * self._w[1])], dtype=float)
-        psi[2] = np.array([1 / np.sqrt(2 * self._w[1])], dtype=float)
-        for j in range(2, self._dim + 1):
-            for i in range(j + 2):
-                if i == 0:
-                    psi[i] = np.concatenate((psi[0], np.zeros(1)))
-                elif i == j + 1:
-                    tmp = np.array([1 / np.sqrt(2 * self._w[j + 1])], dtype=float)
-                    psi[i] = np.concatenate((np.zeros(j - 1), tmp))
-                else:
-                    tmp = np.array([-1 / np.sqrt(2 * self._w[j + 1])], dtype=float)
-                    psi[i] = np.concatenate((psi[i], tmp))
-        psi = np.array(psi, dtype=float).T
-        pts = mean.reshape(-1, 1) + cov_sqrt @ psi
+        pts = mean.reshape(-1, 1) + cov_sqrt @ self._psi
         return pts
 
 
@@ -468,6 +730,23 @@ class SphericalSimplexSigmaPoints():
         self._w = np.zeros(dim + 2)
         self._w[0] = self._w0
         self._w[1:] = (1 - self._w0) / (dim + 1)
+
+        # the unit sigma points only depend on the dimension, so they are built once
+        psi = np.zeros(dim + 2).tolist()
+        psi[0] = np.array([0], dtype=float)
+        psi[1] = np.array([-1 / np.sqrt(2 * self._w[1])], dtype=float)
+        psi[2] = np.array([1 / np.sqrt(2 * self._w[1])], dtype=float)
+        for j in range(2, dim + 1):
+            for i in range(j + 2):
+                if i == 0:
+                    psi[i] = np.concatenate((psi[0], np.zeros(1)))
+                elif i == j + 1:
+                    tmp = np.array([j / np.sqrt(j * (j + 1) * self._w[1])], dtype=float)
+                    psi[i] = np.concatenate((np.zeros(j - 1), tmp))
+                else:
+                    tmp = np.array([-1 / np.sqrt(j * (j + 1) * self._w[1])], dtype=float)
+                    psi[i] = np.concatenate((psi[i], tmp))
+        self._psi = np.array(psi, dtype=float).T
         self._init = True
 
     def points_num(self):
@@ -480,28 +759,13 @@ class SphericalSimplexSigmaPoints():
             raise RuntimeError('point generator must be initialized with init() before use')
         return self._w, self._w
 
-    def sigma_points(self, mean, cov):
+    def sigma_points(self, mean, cov, sqrt=False):
         if self._init == False:
             raise RuntimeError('point generator must be initialized with init() before use')
-        # P = C * C'
-        cov_sqrt = cholcov(cov, lower=True)
+        # P = C * C', and 'cov' is C itself if 'sqrt' is True
+        cov_sqrt = cov if sqrt else cholcov(cov, lower=True)
 
-        psi = np.zeros(self._dim + 2).tolist()
-        psi[0] = np.array([0], dtype=float)
-        psi[1] = np.array([-1 / np.sqrt(2 * self._w[1])], dtype=float)
-        psi[2] = np.array([1 / np.sqrt(2 * self._w[1])], dtype=float)
-        for j in range(2, self._dim + 1):
-            for i in range(j + 2):
-                if i == 0:
-                    psi[i] = np.concatenate((psi[0], np.zeros(1)))
-                elif i == j + 1:
-                    tmp = np.array([j / np.sqrt(j * (j + 1) * self._w[1])], dtype=float)
-                    psi[i] = np.concatenate((np.zeros(j - 1), tmp))
-                else:
-                    tmp = np.array([-1 / np.sqrt(j * (j + 1) * self._w[1])], dtype=float)
-                    psi[i] = np.concatenate((psi[i], tmp))
-        psi = np.array(psi, dtype=float).T
-        pts = mean.reshape(-1, 1) + cov_sqrt @ psi
+        pts = mean.reshape(-1, 1) + cov_sqrt @ self._psi
         return pts
 
 
@@ -518,6 +782,9 @@ class SymmetricSigmaPoints():
     def init(self, dim):
         self._dim = dim
         self._w = np.full(2 * dim, 1 / (2 * dim), dtype=float)
+        # the unit sigma points are the scaled columns of identity and their opposites
+        unit = np.sqrt(dim) * np.eye(dim)
+        self._psi = np.concatenate((unit, -unit), axis=1)
         self._init = True
 
     def points_num(self):
@@ -530,16 +797,13 @@ class SymmetricSigmaPoints():
             raise RuntimeError('point generator must be initialized with init() before use')
         return self._w, self._w
 
-    def sigma_points(self, mean, cov):
+    def sigma_points(self, mean, cov, sqrt=False):
         if self._init == False:
             raise RuntimeError('point generator must be initialized with init() before use')
-        # P = C * C'
-        cov_sqrt = cholcov(cov, lower=True)
+        # P = C * C', and 'cov' is C itself if 'sqrt' is True
+        cov_sqrt = cov if sqrt else cholcov(cov, lower=True)
 
-        pts = np.zeros((self._dim, 2 * self._dim))
-        for i in range(self._dim):
-            pts[:, i] = mean + np.sqrt(self._dim) * cov_sqrt[:, i]
-            pts[:, self._dim + i] = mean - np.sqrt(self._dim) * cov_sqrt[:, i]
+        pts = mean.reshape(-1, 1) + cov_sqrt @ self._psi
         return pts
 
 
@@ -577,6 +841,9 @@ class ScaledSigmaPoints():
         self._w_mean[-1] = self._lamb / (dim + self._lamb)
         self._w_cov = self._w_mean.copy()
         self._w_cov[-1] = self._w_mean[-1] + (1 - self._alpha**2 + self._beta)
+        # the unit sigma points, the last one of which is the mean
+        unit = np.sqrt(dim + self._lamb) * np.eye(dim)
+        self._psi = np.concatenate((unit, -unit, np.zeros((dim, 1))), axis=1)
         self._init = True
 
     def points_num(self):
@@ -589,15 +856,64 @@ class ScaledSigmaPoints():
             raise RuntimeError('point generator must be initialized with init() before use')
         return self._w_mean, self._w_cov
 
-    def sigma_points(self, mean, cov):
+    def sigma_points(self, mean, cov, sqrt=False):
+        if self._init == False:
+            raise RuntimeError('point generator must be initialized with init() before use')
+        # P = C * C', and 'cov' is C itself if 'sqrt' is True
+        cov_sqrt = cov if sqrt else cholcov(cov, lower=True)
+
+        pts = mean.reshape(-1, 1) + cov_sqrt @ self._psi
+        return pts
+
+
+class CubaturePoints():
+    def __init__(self, degree=3):
+        '''
+        degree:
+            Degree of the spherical-radial cubature rule, 3 or 5. The third-degree rule
+            uses the 2n points sqrt(n)*(±e_i) with equal weights 1/(2n), see[7]. The
+            fifth-degree rule uses the mean, the 2n points sqrt(n+2)*(±e_i) and the
+            2n(n-1) points sqrt(n+2)*(±e_i±e_j)/sqrt(2), i<j, see[9]. Its weights of
+            the axis points are negative if n > 4.
+        '''
+        if degree != 3 and degree != 5:
+            raise ValueError('degree must be 3 or 5')
+        self._degree = degree
+        self._init = False
+
+    def init(self, dim):
+        self._dim = dim
+        # the unit cubature points and weights only depend on the dimension
+        eye = np.eye(dim)
+        if self._degree == 3:
+            unit = np.sqrt(dim) * eye
+            self._psi = np.concatenate((unit, -unit), axis=1)
+            self._w = np.full(2 * dim, 1 / (2 * dim), dtype=float)
+        else:
+            i, j = np.triu_indices(dim, 1)
+            pair = np.concatenate((eye[:, i] + eye[:, j], eye[:, i] - eye[:, j]), axis=1) / np.sqrt(2)
+            unit = np.sqrt(dim + 2) * np.concatenate((eye, pair), axis=1)
+            self._psi = np.concatenate((np.zeros((dim, 1)), unit, -unit), axis=1)
+            w_unit = np.concatenate((np.full(dim, (4 - dim) / (2 * (dim + 2)**2)),
+                                     np.full(2 * len(i), 1 / (dim + 2)**2)))
+            self._w = np.concatenate(([2 / (dim + 2)], w_unit, w_unit))
+        self._init = True
+
+    def points_num(self):
+        if self._init == False:
+            raise RuntimeError('point generator must be initialized with init() before use')
+        return self._psi.shape[1]
+
+    def weights(self):
         if self._init == False:
             raise RuntimeError('point generator must be initialized with init() before use')
-        # P = C * C'
-        cov_sqrt = cholcov(cov, lower=True)
-
-        pts = np.zeros((self._dim, 2 * self._dim + 1))
-        pts[:, -1] = mean
-        for i in range(self._dim):
-            pts[:, i] = mean + np.sqrt(self._dim + self._lamb) * cov_sqrt[:, i]
-            pts[:, self._dim + i] = mean - np.sqrt(self._dim + self._lamb) * cov_sqrt[:, i]
+        return self._w, self._w
+
+    def sigma_points(self, mean, cov, sqrt=False):
+        if self._init == False:
+            raise RuntimeError('point generator must be initialized with init() before use')
+        # P = C * C', and 'cov' is C itself if 'sqrt' is True
+        cov_sqrt = cov if sqrt else cholcov(cov, lower=True)
+
+        pts = mean.reshape(-1, 1) + cov_sqrt @ self._psi
         return pts
@@ -2,14 +2,20 @@
 '''
 REFERENCE:
 [1]. R. L. Burden and J. D. Faires, "Numerical Analysis," 9th ed. Boston, MA: Brooks/ Cole, 2011.
+[2]. J. R. R. A. Martins, P. Sturdza and J. J. Alonso, "The complex-step derivative approximation," ACM Transactions on Mathematical Software, vol. 29, no. 3, pp. 245-262, 2003.
+[3]. C. G. Broyden, "A class of methods for solving nonlinear simultaneous equations," Mathematics of Computation, vol. 19, no. 92, pp. 577-593, 1965.
 '''
 from __future__ import division, absolute_import, print_function
 
 
-__all__ = ['lagrange_interp_poly', 'num_diff', 'num_diff2', 'num_diff_hessian']
+__all__ = [
+    'lagrange_interp_poly', 'num_diff', 'num_diff_complex', 'num_diff2',
+    'num_diff_hessian', 'Jacobian', 'Hessian'
+]
 
 import numbers
 import numpy as np
+from functools import lru_cache
 
 
 def lagrange_interp_poly(x, y=None):
@@ -55,23 +61,18 @@ def lagrange_interp_poly(x, y=None):
 # print(lagrange_interp_poly([40, 66, 18, 71, 4, 28, 5, 10, 83, 70], [32, 96, 4, 44, 39, 77, 80, 19, 49, 45]))
 
 
-def num_diff(x, f, f_dim, order=1, epsilon=None):
-    '''
-    First-order numerical differentiation which can be used
-    to calculate the Jacobian matrix.
-    '''
-    x = np.array(x, dtype=float)
-    x_dim = len(x)
-
+def _diff_step(x, epsilon):
     if isinstance(epsilon, numbers.Number):
         epsilon = np.full(x.shape, epsilon, dtype=float)
 
     # If epsilon is not specified, then use some ad-hoc default value
     if epsilon is None:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in 1e-5 * np.abs(x)], dtype=float)
-    else:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in epsilon], dtype=float)
+        epsilon = 1e-5 * np.abs(x)
+    return np.maximum(np.asarray(epsilon, dtype=float), np.sqrt(np.finfo(float).eps))
+
 
+@lru_cache(maxsize=None)
+def _diff_coef(order):
     # 2*order+1 points fomula, error term is O(eps^(2*order))
     if order == 1:
         a, d = [1], 2
@@ -93,8 +94,32 @@ def num_diff(x, f, f_dim, order=1, epsilon=None):
         _, a, _ = lagrange_interp_poly(list(range(-order, order + 1)))
         a = (-a[-1, order - 1::-1]).tolist()
         d = 1
+    return tuple(a), d
+
+
+def num_diff(x, f, f_dim, order=1, epsilon=None, batch=False):
+    '''
+    First-order numerical differentiation which can be used
+    to calculate the Jacobian matrix.
+
+    If 'batch' is True, f must map the stacked points of shape (m, x_dim) to
+    an array of shape (m, f_dim), and all the 2*order*x_dim points of stencil
+    are evaluated in a single call.
+    '''
+    x = np.array(x, dtype=float)
+    x_dim = len(x)
+    epsilon = _diff_step(x, epsilon)
+    a, d = _diff_coef(order)
 
     p = len(a)
+    if batch:
+        # offsets of shape (p, x_dim, x_dim), the i-th row of the k-th block is (k+1)*eps_i*e_i
+        offset = np.arange(1, p + 1)[:, np.newaxis, np.newaxis] * np.diag(epsilon)
+        pts = np.concatenate((x + offset, x - offset)).reshape(-1, x_dim)
+        fx = np.asarray(f(pts), dtype=float).reshape(2, p, x_dim, f_dim)
+        J = np.einsum('k,kij->ji', a, fx[0] - fx[1]) / (d * epsilon)
+        return J
+
     J = np.zeros((f_dim, x_dim))
     for cur_el in range(x_dim):  # epsilon has same length as x
         eps = epsilon[cur_el]
@@ -128,21 +153,39 @@ def num_diff(x, f, f_dim, order=1, epsilon=None):
 # print(num_diff(x, f, 2, order=9))
 
 
-def num_diff2(x, f, f_dim, order=1, epsilon=None):
+def num_diff_complex(x, f, f_dim, epsilon=1e-20, batch=False):
     '''
-    Second-order numerical differentiation
+    Complex-step differentiation used to calculate the Jacobian matrix, see[2].
+    f must accept complex input and be real analytic, e.g. no abs or conjugate. As
+    no subtraction is involved, the result is accurate to machine precision and
+    only x_dim evaluations are needed.
+
+    If 'batch' is True, f must map the stacked points of shape (x_dim, x_dim) to
+    an array of shape (x_dim, f_dim), and all the points are evaluated in a single call.
     '''
     x = np.array(x, dtype=float)
     x_dim = len(x)
 
-    if isinstance(epsilon, numbers.Number):
-        epsilon = np.full(x.shape, epsilon, dtype=float)
+    if batch:
+        pts = x + 1j * epsilon * np.eye(x_dim)
+        fx = np.asarray(f(pts)).reshape(x_dim, f_dim)
+        return fx.imag.T / epsilon
+
+    J = np.zeros((f_dim, x_dim))
+    for cur_el in range(x_dim):
+        xp = x.astype(complex)
+        xp[cur_el] += 1j * epsilon
+        J[:, cur_el] = np.imag(f(xp)) / epsilon
+    return J
 
-    # If epsilon is not specified, then use some ad-hoc default value
-    if epsilon is None:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in 1e-5 * np.abs(x)], dtype=float)
-    else:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in epsilon], dtype=float)
+
+def num_diff2(x, f, f_dim, order=1, epsilon=None):
+    '''
+    Second-order numerical differentiation
+    '''
+    x = np.array(x, dtype=float)
+    x_dim = len(x)
+    epsilon = _diff_step(x, epsilon)
 
     # 2*N+1 points fomula, error term is O(eps^(2*N))
     if order == 1:
@@ -182,21 +225,31 @@ def num_diff2(x, f, f_dim, order=1, epsilon=None):
 # print(num_diff2(x, f, 1))
 
 
-def num_diff_hessian(x, f, f_dim, epsilon=None):
+def num_diff_hessian(x, f, f_dim, epsilon=None, batch=False):
     '''
-    Second-order partial derivation used to calculate Hessian matrix
+    Second-order partial derivation used to calculate Hessian matrix,
+    the hessian of the i-th component of f is hess[:, :, i].
+
+    Only the lower triangle is evaluated as the hessian is symmetric. If 'batch'
+    is True, f must map the stacked points of shape (m, x_dim) to an array of
+    shape (m, f_dim), and all the 2*x_dim*(x_dim+1) points are evaluated in a
+    single call.
     '''
     x = np.array(x, dtype=float)
     x_dim = len(x)
-
-    if isinstance(epsilon, numbers.Number):
-        epsilon = np.full(x.shape, epsilon, dtype=float)
-
-    # If epsilon is not specified, then use some ad-hoc default value
-    if epsilon is None:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in 1e-5 * np.abs(x)], dtype=float)
-    else:
-        epsilon = np.array([max(eps, np.sqrt(np.finfo(eps).eps)) for eps in epsilon], dtype=float)
+    epsilon = _diff_step(x, epsilon)
+
+    if batch:
+        row, col = np.tril_indices(x_dim)
+        step = np.diag(epsilon)
+        h, k = step[row], step[col]
+        pts = np.concatenate((x + h + k, x - h - k, x - h + k, x + h - k))
+        fx = np.asarray(f(pts), dtype=float).reshape(4, len(row), f_dim)
+        val = (fx[0] + fx[1] - fx[2] - fx[3]) / (4 * epsilon[row] * epsilon[col])[:, np.newaxis]
+        hess = np.empty((x_dim, x_dim, f_dim))
+        hess[row, col] = val
+        hess[col, row] = val
+        return hess
 
     hess = np.zeros((x_dim, x_dim, f_dim))
     e1 = np.zeros(x_dim)
@@ -205,7 +258,7 @@ def num_diff_hessian(x, f, f_dim, epsilon=None):
         e1[i] = 1
         h = epsilon[i] * e1
         e1[i] = 0
-        for j in range(x_dim):
+        for j in range(i + 1):
             e2[j] = 1
             k = epsilon[j] * e2
             e2[j] = 0
@@ -226,3 +279,84 @@ def num_diff_hessian(x, f, f_dim, epsilon=None):
 # x = np.array([0.25, 1])
 # print(num_diff_hessian(x, f, 2)[:, :, 0])
 # print(num_diff_hessian(x, f, 2)[:, :, 1])
+
+
+class Jacobian():
+    '''
+    Numerical Jacobian engine of f(x, *args) with respect to x, which can be passed
+    to the extended filters as 'fjac' or 'hjac' directly.
+
+    method : 'central' uses num_diff with the given 'order', 'complex' uses num_diff_complex
+    batch : if True, f is evaluated once on all the stacked points, see num_diff
+    reuse_tol : if given, the Jacobian is only re-evaluated when x moves farther than
+        'reuse_tol' (scalar or per component) from the point of the last evaluation.
+        In between it is refined by Broyden's rank-one update, see[3], which costs a
+        single evaluation of f. The other arguments of f are assumed unchanged.
+    '''
+    def __init__(self, f, f_dim, method='central', order=1, epsilon=None, batch=False, reuse_tol=None):
+        if method not in ('central', 'complex'):
+            raise ValueError("method must be 'central' or 'complex'")
+        self._f = f
+        self._f_dim = f_dim
+        self._method = method
+        self._order = order
+        self._eps = epsilon
+        self._batch = batch
+        self._tol = reuse_tol
+        self.reset()
+
+    def reset(self):
+        self._x0 = None     # point of the last full evaluation
+        self._x = None
+        self._fx = None
+        self._J = None
+
+    def __eval(self, x, args):
+        fcn = lambda x: self._f(x, *args)
+        if self._method == 'complex':
+            eps = 1e-20 if self._eps is None else self._eps
+            return num_diff_complex(x, fcn, self._f_dim, epsilon=eps, batch=self._batch)
+        else:
+            return num_diff(x, fcn, self._f_dim, order=self._order, epsilon=self._eps, batch=self._batch)
+
+    def __value(self, x, args):
+        if self._batch:
+            return np.asarray(self._f(x[np.newaxis], *args), dtype=float).reshape(self._f_dim)
+        else:
+            return np.asarray(self._f(x, *args), dtype=float)
+
+    def __call__(self, x, *args):
+        x = np.array(x, dtype=float)
+        if self._tol is None:
+            return self.__eval(x, args)
+
+        if self._J is not None and np.all(np.abs(x - self._x0) <= self._tol):
+            dx = x - self._x
+            dx2 = dx @ dx
+            if dx2 > 0:
+                fx = self.__value(x, args)
+                self._J = self._J + np.outer(fx - self._fx - self._J @ dx, dx) / dx2
+                self._x, self._fx = x, fx
+        else:
+            self._J = self.__eval(x, args)
+            self._x0 = self._x = x
+            self._fx = self.__value(x, args)
+        return self._J.copy()
+
+
+class Hessian():
+    '''
+    Numerical Hessian engine of f(x, *args) with respect to x, which can be passed
+    to the second-order extended filters as 'fhes' or 'hhes' directly.
+
+    batch : if True, f is evaluated once on all the stacked points, see num_diff_hessian
+    '''
+    def __init__(self, f, f_dim, epsilon=None, batch=False):
+        self._f = f
+        self._f_dim = f_dim
+        self._eps = epsilon
+        self._batch = batch
+
+    def __call__(self, x, *args):
+        fcn = lambda x: self._f(x, *args)
+        return num_diff_hessian(x, fcn, self._f_dim, epsilon=self._eps, batch=self._batch)
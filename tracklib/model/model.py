@@ -5,25 +5,29 @@ REFERENCES:
 [2] R. A. Singer, "Estimating Optimal Tracking Filter Performance for Manned Maneuvering Targets," in IEEE Transactions on Aerospace and Electronic Systems, vol. AES-6, no. 4, pp. 473-483, July 1970.
 [3] X. Rong Li and V. P. Jilkov, "Survey of maneuvering target tracking. Part I. Dynamic models," in IEEE Transactions on Aerospace and Electronic Systems, vol. 39, no. 4, pp. 1333-1364, Oct. 2003.
 [4] W. Koch, "Tracking and Sensor Data Fusion: Methodological Framework and Selected Applications," Heidelberg, Germany: Springer, 2014.
+[5] C. Van Loan, "Computing integrals involving the matrix exponential," in IEEE Transactions on Automatic Control, vol. 23, no. 3, pp. 395-404, June 1978.
 '''
 from __future__ import division, absolute_import, print_function
 
 
 __all__ = [
     'F_poly', 'F_singer', 'F_van_keuk', 'Q_poly_dc', 'Q_poly_dd', 'Q_singer',
-    'Q_van_keuk', 'H_pos_only', 'R_pos_only', 'F_cv', 'f_cv', 'f_cv_jac',
+    'Q_van_keuk', 'van_loan', 'DiscreteModel', 'discrete_model',
+    'continuous_model', 'H_pos_only', 'R_pos_only', 'F_cv', 'f_cv', 'f_cv_jac',
     'Q_cv_dc', 'Q_cv_dd', 'H_cv', 'h_cv', 'h_cv_jac', 'R_cv', 'F_ca', 'f_ca',
     'f_ca_jac', 'Q_ca_dc', 'Q_ca_dd', 'H_ca', 'h_ca', 'h_ca_jac', 'R_ca',
     'F_ct', 'f_ct', 'f_ct_jac', 'Q_ct', 'h_ct', 'h_ct_jac', 'R_ct',
-    'model_switch', 'trajectory_cv', 'trajectory_ca', 'trajectory_ct',
+    'model_switch', 'model_switch_view', 'trajectory_cv', 'trajectory_ca', 'trajectory_ct',
     'trajectory_generator'
 ]
 
 import numbers
 import numpy as np
+from collections import OrderedDict
 import scipy.linalg as lg
 import scipy.stats as st
 import scipy.special as sl
+from tracklib.utils import cholcov
 
 
 def F_poly(order, axis, T):
@@ -323,6 +327,167 @@ def Q_van_keuk(axis, T, std, tau=20):
     return Q
 
 
+def van_loan(A, L, Qc, T):
+    '''
+    Discretize the continuous-time linear model dx/dt = A*x + L*w with
+    E(w(t)*w(s)') = Qc*δ(t-s) using Van Loan's method, see [5].
+
+    Parameters
+    ----------
+    A : ndarray
+        The system matrix of continuous-time model
+    L : ndarray
+        The noise gain matrix of continuous-time model
+    Qc : ndarray
+        The power spectral density of continuous-time process noise
+    T : float
+        The time-duration of the propagation interval.
+
+    Returns
+    -------
+    F : ndarray
+        The state transition matrix, F = expm(A*T)
+    Q : ndarray
+        Process noise convariance, Q = ∫expm(A*s)*L*Qc*L'*expm(A*s)'ds from 0 to T
+    '''
+    n = A.shape[0]
+    C = np.zeros((2 * n, 2 * n))
+    C[:n, :n] = -A
+    C[:n, n:] = L @ Qc @ L.T
+    C[n:, n:] = A.T
+    D = lg.expm(C * T)
+    F = D[n:, n:].T
+    Q = F @ D[:n, n:]
+    Q = (Q + Q.T) / 2
+
+    return F, Q
+
+
+class DiscreteModel():
+    '''
+    Discretized model with a bounded LRU cache of (F, Q) pairs keyed by interval.
+
+    The matrices of each distinct interval are built only once and then shared by
+    all filters using this object, so it suits variable-rate and asynchronous sensors
+    which produce a few distinct intervals repeatedly. The returned matrices are
+    read-only.
+
+    Parameters
+    ----------
+    fcn : callable
+        fcn(T) returns the state transition matrix and process noise covariance
+        (F, Q) of interval T
+    maxsize : int
+        The maximum number of intervals kept in the cache
+    '''
+    def __init__(self, fcn, maxsize=128):
+        self._fcn = fcn
+        self._maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __entry(self, T):
+        T = float(T)
+        if T in self._cache:
+            self._cache.move_to_end(T)
+            return self._cache[T]
+
+        F, Q = self._fcn(T)
+        F = np.array(F, dtype=float)
+        Q = np.array(Q, dtype=float)
+        F.flags.writeable = False
+        Q.flags.writeable = False
+        entry = [F, Q, None]
+        self._cache[T] = entry
+        if len(self._cache) > self._maxsize:
+            self._cache.popitem(last=False)
+        return entry
+
+    def __call__(self, T):
+        F, Q, _ = self.__entry(T)
+        return F, Q
+
+    def noise_sqrt(self, T):
+        '''
+        The lower triangular square root of Q of interval T, used by square-root filters
+        '''
+        entry = self.__entry(T)
+        if entry[2] is None:
+            entry[2] = cholcov(entry[1], lower=True)
+            entry[2].flags.writeable = False
+        return entry[2]
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+
+_dmodel_lib = {}
+
+def discrete_model(model, axis, std, tau=20, maxsize=128):
+    '''
+    Get the discretized model from library, the same object is returned for
+    the same arguments including 'maxsize', so the instance and its cache are
+    shared by all the callers.
+
+    Parameters
+    ----------
+    model : str
+        'cv_dc', 'cv_dd', 'ca_dc', 'ca_dd', 'singer' or 'van_keuk', where 'dc' means
+        discretized continuous-time model and 'dd' means direct discrete-time model
+    axis : int
+        Motion directions in Cartesian coordinate.
+    std : number, list
+        The standard deviation of process noise, see the corresponding Q function
+    tau : float
+        The time constant of 'singer' and 'van_keuk' model
+    maxsize : int
+        The maximum number of intervals kept in the cache
+
+    Returns
+    -------
+    dmodel : DiscreteModel
+        dmodel(T) returns (F, Q) of interval T
+    '''
+    key = (model, axis, tuple(np.ravel(std)), tau, maxsize)
+    if key in _dmodel_lib:
+        return _dmodel_lib[key]
+
+    if model == 'cv_dc':
+        fcn = lambda T: (F_poly(2, axis, T), Q_poly_dc(2, axis, T, std))
+    elif model == 'cv_dd':
+        fcn = lambda T: (F_poly(2, axis, T), Q_poly_dd(2, axis, T, std, ht=1))
+    elif model == 'ca_dc':
+        fcn = lambda T: (F_poly(3, axis, T), Q_poly_dc(3, axis, T, std))
+    elif model == 'ca_dd':
+        fcn = lambda T: (F_poly(3, axis, T), Q_poly_dd(3, axis, T, std))
+    elif model == 'singer':
+        fcn = lambda T: (F_singer(axis, T, tau), Q_singer(axis, T, std, tau))
+    elif model == 'van_keuk':
+        fcn = lambda T: (F_van_keuk(axis, T, tau), Q_van_keuk(axis, T, std, tau))
+    else:
+        raise ValueError('unknown model: %s' % model)
+    dmodel = DiscreteModel(fcn, maxsize)
+    _dmodel_lib[key] = dmodel
+
+    return dmodel
+
+
+def continuous_model(A, L, Qc, maxsize=128):
+    '''
+    Discretized model of an arbitrary continuous-time linear model using Van Loan's
+    method, see 'van_loan'
+
+    Returns
+    -------
+    dmodel : DiscreteModel
+        dmodel(T) returns (F, Q) of interval T
+    '''
+    A, L, Qc = A.copy(), L.copy(), Qc.copy()
+    return DiscreteModel(lambda T: van_loan(A, L, Qc, T), maxsize)
+
+
 def H_pos_only(order, axis):
     '''
     Position-only measurement matrix is used with discretized continuous-time models
@@ -376,6 +541,14 @@ def R_pos_only(axis, std):
     return R
 
 
+def _linear_map(A, x):
+    # x is a single state or states stacked along the first axis
+    if np.ndim(x) == 2 and np.shape(x)[1] == A.shape[1]:
+        return np.dot(x, A.T)
+    else:
+        return np.dot(A, x)
+
+
 def F_cv(axis, T):
     return F_poly(2, axis, T)
 
@@ -383,7 +556,7 @@ def F_cv(axis, T):
 def f_cv(axis, T):
     F = F_cv(axis, T)
     def f(x, u=None):
-        return np.dot(F, x)
+        return _linear_map(F, x)
     return f
 
 
@@ -409,7 +582,7 @@ def H_cv(axis):
 def h_cv(axis):
     H = H_cv(axis)
     def h(x):
-        return np.dot(H, x)
+        return _linear_map(H, x)
     return h
 
 
@@ -431,7 +604,7 @@ def F_ca(axis, T):
 def f_ca(axis, T):
     F = F_ca(axis, T)
     def f(x, u=None):
-        return np.dot(F, x)
+        return _linear_map(F, x)
     return f
 
 
@@ -457,7 +630,7 @@ def H_ca(axis):
 def h_ca(axis):
     H = H_ca(axis)
     def h(x):
-        return np.dot(H, x)
+        return _linear_map(H, x)
     return h
 
 
@@ -500,27 +673,29 @@ def f_ct(axis, T):
     assert (axis >= 2)
 
     def f(x, u=None):
-        omega = np.deg2rad(x[4])
-        if np.fabs(omega) >= np.sqrt(np.finfo(omega).eps):
-            wt = omega * T
-            sin_wt = np.sin(wt)
-            cos_wt = np.cos(wt)
-            sin_div = sin_wt / omega
-            cos_div = (cos_wt - 1) / omega
-        else:
-            sin_wt = 0
-            cos_wt = 1
-            sin_div = T
-            cos_div = 0
-
-        F = np.array([[1, sin_div, 0, cos_div], [0, cos_wt, 0, -sin_wt],
-                      [0, -cos_div, 1, sin_div], [0, sin_wt, 0, cos_wt]],
-                     dtype=float)
-        F = lg.block_diag(F, 1)
+        # x is a single state or states stacked along the first axis
+        x = np.asarray(x, dtype=float)
+        xt = x.T
+        omega = np.deg2rad(xt[4])
+        turn = np.fabs(omega) >= np.sqrt(np.finfo(float).eps)
+        omega = np.where(turn, omega, 1)
+        wt = omega * T
+        sin_wt = np.where(turn, np.sin(wt), 0)
+        cos_wt = np.where(turn, np.cos(wt), 1)
+        sin_div = np.where(turn, sin_wt / omega, T)
+        cos_div = np.where(turn, (cos_wt - 1) / omega, 0)
+
+        out = np.empty_like(x)
+        outt = out.T
+        outt[0] = xt[0] + sin_div * xt[1] + cos_div * xt[3]
+        outt[1] = cos_wt * xt[1] - sin_wt * xt[3]
+        outt[2] = -cos_div * xt[1] + xt[2] + sin_div * xt[3]
+        outt[3] = sin_wt * xt[1] + cos_wt * xt[3]
+        outt[4] = xt[4]
         if axis == 3:
-            zblock = F_cv(1, T)
-            F = lg.block_diag(F, zblock)
-        return np.dot(F, x)
+            outt[5] = xt[5] + T * xt[6]
+            outt[6] = xt[6]
+        return out
     return f
 
 
@@ -586,7 +761,7 @@ def h_ct(axis):
         H = H_pos_only(2, 2)
     H = np.insert(H, 4, 0, axis=1)
     def h(x):
-        return np.dot(H, x)
+        return _linear_map(H, x)
     return h
 
 
@@ -609,13 +784,14 @@ def R_ct(axis, std):
     return R_pos_only(axis, std)
 
 
-def state_switch(state, type_in, type_out):
+def state_switch(state, type_in, type_out, copy=True):
+    # if 'copy' is False, the input is returned without copy when type_in is the same
+    # as type_out, which is only safe if the result is not modified
     dim = len(state)
-    state = state.copy()
     if type_in == 'cv':
         axis = dim // 2
         if type_out == 'cv':
-            return state
+            return state.copy() if copy else state
         elif type_out == 'ca':
             ca_dim = 3 * axis
             sel = np.setdiff1d(range(ca_dim), range(2, ca_dim, 3))
@@ -639,7 +815,7 @@ def state_switch(state, type_in, type_out):
             stmp = np.dot(slct, state)
             return stmp
         elif type_out == 'ca':
-            return state
+            return state.copy() if copy else state
         elif type_out == 'ct':
             # ca to cv
             ca_dim = 3 * axis
@@ -675,21 +851,21 @@ def state_switch(state, type_in, type_out):
             stmp = np.dot(slct, stmp)
             return stmp
         elif type_out == 'ct':
-            return state
+            return state.copy() if copy else state
         else:
             raise ValueError('unknown output type: %s' % type_out)
     else:
         raise ValueError('unknown input type: %s' % type_in)
 
 
-def cov_switch(cov, type_in, type_out):
+def cov_switch(cov, type_in, type_out, copy=True):
+    # 'copy' is the same as in state_switch
     dim = len(cov)
-    cov = cov.copy()
     uncertainty = 100
     if type_in == 'cv':
         axis = dim // 2
         if type_out == 'cv':
-            return cov
+            return cov.copy() if copy else cov
         elif type_out == 'ca':
             ca_dim = 3 * axis
             sel_diff = range(2, ca_dim, 3)
@@ -716,7 +892,7 @@ def cov_switch(cov, type_in, type_out):
             ctmp = slct @ cov @ slct.T
             return ctmp
         elif type_out == 'ca':
-            return cov
+            return cov.copy() if copy else cov
         elif type_out == 'ct':
             # ca to cv
             ca_dim = 3 * axis
@@ -755,32 +931,39 @@ def cov_switch(cov, type_in, type_out):
             ctmp[sel_diff, sel_diff] = uncertainty
             return ctmp
         elif type_out == 'ct':
-            return cov
+            return cov.copy() if copy else cov
         else:
             raise ValueError('unknown output type: %s' % type_out)
     else:
         raise ValueError('unknown input type: %s' % type_in)
 
 
-def model_switch(x, type_in, type_out):
+def model_switch(x, type_in, type_out, copy=True):
     dim = len(x)
     if isinstance(x, np.ndarray):
         if len(x.shape) == 1:
-            state = state_switch(x, type_in, type_out)
+            state = state_switch(x, type_in, type_out, copy=copy)
             return state
         elif len(x.shape) == 2:
-            cov = cov_switch(x, type_in, type_out)
+            cov = cov_switch(x, type_in, type_out, copy=copy)
             return cov
         else:
             raise ValueError("shape of 'x' must be 1 or 2")
     elif hasattr(x, '__getitem__'):
-        state = state_switch(x[0], type_in, type_out)
-        cov = cov_switch(x[1], type_in, type_out)
+        state = state_switch(x[0], type_in, type_out, copy=copy)
+        cov = cov_switch(x[1], type_in, type_out, copy=copy)
         return state, cov
     else:
         raise TypeError("error 'x' type: '%s'" % x.__class__.__name__)
 
 
+def model_switch_view(x, type_in, type_out):
+    # the same as model_switch, but the input is returned without copy when type_in is
+    # the same as type_out. The multiple model filters use it in place of model_switch,
+    # since the switched estimates of their sub-models are only read by the combination
+    return model_switch(x, type_in, type_out, copy=False)
+
+
 def trajectory_cv(state, interval, length, velocity):
     head = state.copy()
     dim = head.size
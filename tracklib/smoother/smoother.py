@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+'''
+Kalman smoother
+
+REFERENCE:
+[1]. D. Simon, "Optimal State Estimation: Kalman, H Infinity, and Nonlinear Approaches," John Wiley and Sons, Inc., 2006.
+[2]. S. Särkkä, "Bayesian Filtering and Smoothing," Cambridge University Press, 2013.
+'''
+from __future__ import division, absolute_import, print_function
+
+
+__all__ = ['rts_gain', 'rts_smoother', 'FixedLagSmoother']
+
+import numpy as np
+from tracklib.filter.base import FilterBase
+
+
+def rts_gain(prior_cov, cross_cov):
+    '''
+    Gains of Rauch-Tung-Striebel smoother, C = D*inv(P), evaluated by a single
+    batched solve over time
+
+    Parameters
+    ----------
+    prior_cov : ndarray
+        Predicted error covariances P_k|k-1 of shape (N, n, n)
+    cross_cov : ndarray
+        Cross-covariances D_k = E[(x_k-1 - x_k-1|k-1)*(x_k - x_k|k-1)'] of shape (N, n, n)
+
+    Returns
+    -------
+    gain : ndarray
+        Smoother gains of shape (N, n, n)
+    '''
+    prior_cov = np.asarray(prior_cov, dtype=float)
+    cross_cov = np.asarray(cross_cov, dtype=float)
+    # P is symmetric, so C' = inv(P)*D'
+    gain_t = np.linalg.solve(prior_cov, np.swapaxes(cross_cov, -1, -2))
+    return np.swapaxes(gain_t, -1, -2)
+
+
+def rts_smoother(state, cov, prior_state, prior_cov, cross_cov):
+    '''
+    Fixed-interval Rauch-Tung-Striebel smoother, see[1, 2]
+
+    It runs the backward recursion over the stored forward pass of a Kalman-type
+    filter, e.g. KFilter, EKFilterAN or UKFilterAN. The k-th entry of each input
+    is recorded at the k-th scan: 'prior_state', 'prior_cov' and 'cross_cov' after
+    predict(), 'state' and 'cov' after correct(). The first entries of the prior
+    quantities link the track to its initial state and are not used.
+
+    Parameters
+    ----------
+    state : ndarray
+        Filtered state estimates x_k|k of shape (N, n)
+    cov : ndarray
+        Filtered error covariances P_k|k of shape (N, n, n)
+    prior_state : ndarray
+        Predicted state estimates x_k|k-1 of shape (N, n)
+    prior_cov : ndarray
+        Predicted error covariances P_k|k-1 of shape (N, n, n)
+    cross_cov : ndarray
+        Cross-covariances between x_k-1|k-1 and x_k|k-1 of shape (N, n, n),
+        available from the 'cross_cov' property of the filter after predict()
+
+    Returns
+    -------
+    smoothed_state : ndarray
+        Smoothed state estimates x_k|N of shape (N, n)
+    smoothed_cov : ndarray
+        Smoothed error covariances P_k|N of shape (N, n, n)
+    '''
+    state = np.asarray(state, dtype=float)
+    cov = np.asarray(cov, dtype=float)
+    prior_state = np.asarray(prior_state, dtype=float)
+    prior_cov = np.asarray(prior_cov, dtype=float)
+    N = state.shape[0]
+
+    smoothed_state = state.copy()
+    smoothed_cov = cov.copy()
+    if N < 2:
+        return smoothed_state, smoothed_cov
+
+    # all the gains are independent of the recursion, so they are computed at once
+    # and the backward pass only consists of matrix-vector and matrix products
+    gain = rts_gain(prior_cov[1:], np.asarray(cross_cov, dtype=float)[1:])
+    gain_t = np.swapaxes(gain, -1, -2)
+    for k in range(N - 2, -1, -1):
+        smoothed_state[k] += gain[k] @ (smoothed_state[k + 1] - prior_state[k + 1])
+        smoothed_cov[k] += gain[k] @ (smoothed_cov[k + 1] - prior_cov[k + 1]) @ gain_t[k]
+        smoothed_cov[k] = (smoothed_cov[k] + smoothed_cov[k].T) / 2
+
+    return smoothed_state, smoothed_cov
+
+
+class FixedLagSmoother(FilterBase):
+    '''
+    Fixed-lag Rauch-Tung-Striebel smoother, see[1, 2]
+
+    It wraps a filter recording 'cross_cov' in predict(), e.g. KFilter, EKFilterAN
+    or UKFilterAN, and forwards predict, correct, distance and likelihood to it, so
+    it can be used wherever the filter is used. The moments of the last 'lag' + 1
+    scans are kept in preallocated ring buffers and 'smooth' returns the estimate
+    of 'lag' scans ago smoothed by all the following ones, which costs 'lag'
+    backward steps per scan instead of a full backward pass.
+    '''
+    def __init__(self, filter, lag):
+        super().__init__()
+
+        if not hasattr(type(filter), 'cross_cov'):
+            raise ValueError("the filter must provide 'cross_cov', e.g. KFilter, EKFilterAN or UKFilterAN")
+        if lag < 1:
+            raise ValueError('lag must be a positive integer')
+        self._ft = filter
+        self._lag = lag
+        self._size = lag + 1
+        self._head = 0
+        self._count = 0
+        self._smoothed = None
+
+    def __str__(self):
+        msg = 'Fixed-lag(%d) smoother of %s' % (self._lag, str(self._ft).lower())
+        return msg
+
+    def __restart(self):
+        self._post_state[0] = self._ft.state_view
+        self._post_cov[0] = self._ft.cov_view
+        self._head = 0
+        self._count = 1
+        self._smoothed = None
+
+    def init(self, state, cov):
+        self._ft.init(state, cov)
+        dim = len(state)
+        # slot i holds the moments of one scan, gain[i] links slot i to the next scan
+        self._prior_state = np.empty((self._size, dim))
+        self._prior_cov = np.empty((self._size, dim, dim))
+        self._post_state = np.empty((self._size, dim))
+        self._post_cov = np.empty((self._size, dim, dim))
+        self._gain = np.empty((self._size, dim, dim))
+        self.__restart()
+        self._init = True
+
+    def reset(self, state, cov):
+        self._ft.reset(state, cov)
+        self.__restart()
+
+    def predict(self, u=None, **kwargs):
+        if self._init == False:
+            raise RuntimeError('smoother must be initialized with init() before use')
+
+        ret = self._ft.predict(u, **kwargs)
+        self._gain[self._head] = rts_gain(self._ft.cov_view, self._ft.cross_cov)
+
+        self._head = (self._head + 1) % self._size
+        self._count = min(self._count + 1, self._size)
+        self._prior_state[self._head] = self._ft.state_view
+        self._prior_cov[self._head] = self._ft.cov_view
+        # if the scan is not corrected, e.g. coasting, its posterior is the prior
+        self._post_state[self._head] = self._prior_state[self._head]
+        self._post_cov[self._head] = self._prior_cov[self._head]
+        self._smoothed = None
+
+        return ret
+
+    def __record_post(self):
+        self._post_state[self._head] = self._ft.state_view
+        self._post_cov[self._head] = self._ft.cov_view
+        self._smoothed = None
+
+    def correct(self, z, **kwargs):
+        if self._init == False:
+            raise RuntimeError('smoother must be initialized with init() before use')
+
+        ret = self._ft.correct(z, **kwargs)
+        self.__record_post()
+
+        return ret
+
+    def correct_JPDA(self, zs, probs, **kwargs):
+        if self._init == False:
+            raise RuntimeError('smoother must be initialized with init() before use')
+
+        ret = self._ft.correct_JPDA(zs, probs, **kwargs)
+        self.__record_post()
+
+        return ret
+
+    def distance(self, z, **kwargs):
+        return self._ft.distance(z, **kwargs)
+
+    def likelihood(self, z, **kwargs):
+        return self._ft.likelihood(z, **kwargs)
+
+    def log_likelihood(self, z, **kwargs):
+        return self._ft.log_likelihood(z, **kwargs)
+
+    def smooth(self):
+        '''
+        Return the smoothed state and covariance of the oldest buffered scan, which is
+        'lag' scans before the current one once more than 'lag' scans have been seen
+        '''
+        if self._init == False:
+            raise RuntimeError('smoother must be initialized with init() before use')
+
+        if self._smoothed is None:
+            # the slots from the newest to the oldest
+            idx = (self._head - np.arange(self._count)) % self._size
+            state = self._post_state[idx[0]].copy()
+            cov = self._post_cov[idx[0]].copy()
+            for k, k_next in zip(idx[1:], idx[:-1]):
+                gain = self._gain[k]
+                state = self._post_state[k] + gain @ (state - self._prior_state[k_next])
+                cov = self._post_cov[k] + gain @ (cov - self._prior_cov[k_next]) @ gain.T
+            cov = (cov + cov.T) / 2
+            self._smoothed = (state, cov)
+        state, cov = self._smoothed
+
+        return state.copy(), cov.copy()
+
+    @property
+    def lag(self):
+        return self._lag
+
+    @property
+    def filter(self):
+        return self._ft
+
+    @property
+    def state(self):
+        return self._ft.state
+
+    @property
+    def cov(self):
+        return self._ft.cov
+
+    @property
+    def state_view(self):
+        return self._ft.state_view
+
+    @property
+    def cov_view(self):
+        return self._ft.cov_view
@@ -88,8 +88,15 @@ class ScoreLogic():
         self._score = np.log(pd * beta / lamb)
         self._max_score = self._score
 
-    def hit(self, likelihood):
-        self._score += np.log(self._vol * likelihood)
+    def hit(self, likelihood, log=False):
+        '''
+        Update the score with the likelihood of the assigned measurement, if 'log'
+        is True, 'likelihood' is the log-likelihood, e.g. from filter.log_likelihood()
+        '''
+        if log:
+            self._score += np.log(self._vol) + likelihood
+        else:
+            self._score += np.log(self._vol * likelihood)
         self._score += np.log(self._pd / self._pfa)
         if self._score >= self._max_score:
             self._max_score = self._score
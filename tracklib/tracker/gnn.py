@@ -12,6 +12,7 @@ __all__ = [
 
 import numpy as np
 import scipy.optimize as op
+from tracklib.utils import get_dtype
 from .common import *
 
 
@@ -25,15 +26,18 @@ class GNNTrack():
         self._age = 1
         self._has_confirmed = False
 
-    def _predict(self):
-        self._ft.predict()
+    def _predict(self, dt=None):
+        if dt is None:
+            self._ft.predict()
+        else:
+            self._ft.predict(dt=dt)
 
     def _assign(self, z, R):
         # update logic
         if isinstance(self._lgc, HistoryLogic):
             self._lgc.hit()
         if isinstance(self._lgc, ScoreLogic):
-            self._lgc.hit(self._ft.likelihood(z, R=R))
+            self._lgc.hit(self._ft.log_likelihood(z, R=R), log=True)
         self._ft.correct(z, R=R)
 
         if not self._has_confirmed:
@@ -51,9 +55,16 @@ class GNNTrack():
             self._lgc.miss()
         self._age += 1
 
+    def _assign_OOSM(self, z, R, dt):
+        # the logic is not updated, since the scan of the measurement has been counted
+        self._ft.correct_OOSM(z, dt=dt, R=R)
+
     def _distance(self, z, R):
         return self._ft.distance(z, R=R)
 
+    def _distance_OOSM(self, z, R, dt):
+        return self._ft.distance_OOSM(z, dt=dt, R=R)
+
     def _likelihood(self, z, R):
         return self._ft.likelihood(z, R=R)
 
@@ -83,6 +94,14 @@ class GNNTrack():
     def cov(self):
         return self._ft.cov
 
+    @property
+    def state_view(self):
+        return self._ft.state_view
+
+    @property
+    def cov_view(self):
+        return self._ft.cov_view
+
     @property
     def age(self):
         return self._age
@@ -141,6 +160,8 @@ class GNNTracker():
         self._ctr = TrackCounter()
         self._tent_tracks = []
         self._conf_tracks = []
+        self._time = None
+        self._prev_time = None
 
         self._len = 0
 
@@ -156,7 +177,68 @@ class GNNTracker():
     def tracks(self):
         return self._conf_tracks
 
-    def add_detection(self, detection):
+    def __associate(self, cost_main):
+        track_num, meas_num = cost_main.shape
+        virt_track = np.full((meas_num, meas_num), np.inf, dtype=cost_main.dtype)
+        np.fill_diagonal(virt_track, self._gate / 2)
+        virt_det = np.full((track_num, track_num), np.inf, dtype=cost_main.dtype)
+        np.fill_diagonal(virt_det, self._gate / 2)
+        cost_zero = np.zeros((meas_num, track_num), dtype=cost_main.dtype)
+        cost_mat = np.block([[cost_main, virt_det], [virt_track, cost_zero]])
+
+        # find best assignment
+        row_idx, col_idx = self._asg_fcn(cost_mat)
+        asg_idx = [i for i in range(track_num) if col_idx[i] < meas_num]
+        asg_tk = row_idx[asg_idx]
+        unasg_tk = np.setdiff1d(np.arange(track_num), asg_tk)
+        asg_meas = col_idx[asg_idx]
+        unasg_meas = np.setdiff1d(np.arange(meas_num), asg_meas)
+        return asg_tk, unasg_tk, asg_meas, unasg_meas
+
+    def __add_OOSM(self, detection, timestamp):
+        # only the measurements after the previous scan can be retrodicted in one step,
+        # the older ones are dropped. A filter takes at most one out-of-sequence update
+        # between two scans, and the tracks born in the current scan have no estimate
+        # of the previous one, so the tracks which are not 'OOSM_ready' are left out
+        if self._prev_time is None or timestamp < self._prev_time:
+            return
+        dt = self._time - timestamp
+        tracks = [t for t in self._conf_tracks + self._tent_tracks if getattr(t.filter(), 'OOSM_ready', False)]
+        if len(tracks) == 0 or len(detection) == 0:
+            return
+
+        cost_main = np.zeros((len(tracks), len(detection)), dtype=get_dtype())
+        for ti in range(len(tracks)):
+            for mi in range(len(detection)):
+                z, R = detection[mi]
+                cost_main[ti, mi] = tracks[ti]._distance_OOSM(z, R, dt)
+        asg_tk, _, asg_meas, _ = self.__associate(cost_main)
+
+        # unassigned measurements can not start tracks in the past and are dropped
+        for ti, mi in zip(asg_tk, asg_meas):
+            z, R = detection[mi]
+            tracks[ti]._assign_OOSM(z, R, dt)
+
+    def add_detection(self, detection, timestamp=None):
+        '''
+        If 'timestamp' is given, the tracks are predicted by the interval since the last
+        timestamped detection, which requires filters accepting 'dt' in predict.
+
+        A detection older than the last one is an out-of-sequence measurement, it only
+        updates the tracks assigned to it by 'correct_OOSM' if it is not older than the
+        previous scan, without replaying the scans. Each track takes at most one of them
+        between two scans, and the later ones are not assigned to it.
+        '''
+        dt = None
+        if timestamp is not None:
+            if self._time is not None:
+                if timestamp < self._time:
+                    self.__add_OOSM(detection, timestamp)
+                    return
+                dt = timestamp - self._time
+            self._prev_time = self._time
+            self._time = timestamp
+
         tracks = self._conf_tracks + self._tent_tracks
         if len(tracks) == 0:
             for z, R in detection:
@@ -173,30 +255,19 @@ class GNNTracker():
         else:
             # predict all tracks
             for track in tracks:
-                track._predict()
+                track._predict(dt)
 
             # form cost matrix
             track_num = len(tracks)
             meas_num = len(detection)
-            cost_main = np.zeros((track_num, meas_num))
-            virt_track = np.full((meas_num, meas_num), np.inf, dtype=float)
-            np.fill_diagonal(virt_track, self._gate / 2)
-            virt_det = np.full((track_num, track_num), np.inf, dtype=float)
-            np.fill_diagonal(virt_det, self._gate / 2)
-            cost_zero = np.zeros((meas_num, track_num))
+            cost_main = np.zeros((track_num, meas_num), dtype=get_dtype())
             for ti in range(track_num):
                 for mi in range(meas_num):
                     z, R = detection[mi]
                     cost_main[ti, mi] = tracks[ti]._distance(z, R)
-            cost_mat = np.block([[cost_main, virt_det], [virt_track, cost_zero]])
 
             # find best assignment
-            row_idx, col_idx = self._asg_fcn(cost_mat)
-            asg_idx = [i for i in range(track_num) if col_idx[i] < meas_num]
-            asg_tk = row_idx[asg_idx]
-            unasg_tk = np.setdiff1d(np.arange(track_num), asg_tk)
-            asg_meas = col_idx[asg_idx]
-            unasg_meas = np.setdiff1d(np.arange(meas_num), asg_meas)
+            asg_tk, unasg_tk, asg_meas, unasg_meas = self.__associate(cost_main)
 
             # update assigned tracks
             for ti, mi in zip(asg_tk, asg_meas):
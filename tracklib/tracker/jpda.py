@@ -16,6 +16,7 @@ __all__ = [
 ]
 
 import numpy as np
+from scipy.special import logsumexp
 from .common import *
 
 
@@ -103,8 +104,11 @@ class JPDATrack():
         self._age = 1
         self._has_confirmed = False
 
-    def _predict(self):
-        self._ft.predict()
+    def _predict(self, dt=None):
+        if dt is None:
+            self._ft.predict()
+        else:
+            self._ft.predict(dt=dt)
 
     def _assign(self, zs, probs, Rs):
         if isinstance(self._lgc, HistoryLogic):
@@ -126,8 +130,8 @@ class JPDATrack():
     def _distance(self, z, R):
         return self._ft.distance(z, R=R)
 
-    def _likelihood(self, z, R):
-        return self._ft.likelihood(z, R=R)
+    def _log_likelihood(self, z, R):
+        return self._ft.log_likelihood(z, R=R)
 
     def _confirmed(self):
         if isinstance(self._lgc, HistoryLogic):
@@ -151,6 +155,14 @@ class JPDATrack():
     def cov(self):
         return self._ft.cov
 
+    @property
+    def state_view(self):
+        return self._ft.state_view
+
+    @property
+    def cov_view(self):
+        return self._ft.cov_view
+
     @property
     def age(self):
         return self._age
@@ -228,6 +240,7 @@ class JPDATracker():
         self._ctr = TrackCounter()
         self._tent_tracks = []
         self._conf_tracks = []
+        self._time = None
 
         self._len = 0
 
@@ -243,7 +256,22 @@ class JPDATracker():
     def tracks(self):
         return self._conf_tracks
 
-    def add_detection(self, detection):
+    def add_detection(self, detection, timestamp=None):
+        '''
+        If 'timestamp' is given, the tracks are predicted by the interval since the last
+        timestamped detection, which requires filters accepting 'dt' in predict.
+
+        A detection not later than the last one is dropped, since the tracks can not
+        be predicted by a negative or zero interval.
+        '''
+        dt = None
+        if timestamp is not None:
+            if self._time is not None:
+                if timestamp <= self._time:
+                    return
+                dt = timestamp - self._time
+            self._time = timestamp
+
         tracks = self._conf_tracks + self._tent_tracks
         if len(tracks) == 0:
             for z, R in detection:
@@ -255,7 +283,7 @@ class JPDATracker():
         else:
             # predict all tracks
             for track in tracks:
-                track._predict()
+                track._predict(dt)
 
             # form the validation matrix, row means the target and column represents the measurement
             unasg_meas = []
@@ -279,35 +307,27 @@ class JPDATracker():
                     tmp_mat = valid_mat[meas][:, tar]
                     sub_valid_mat = np.ones((len(meas), len(tar) + 1), dtype=bool)
                     sub_valid_mat[:, 1:] = tmp_mat
-                    event_list = JPDA_events(sub_valid_mat)
-
-                    # compute the probabilites of association events in events list
-                    event_probs = []
-                    for event in event_list:
-                        item1 = item2 = 1
-                        for j in range(event.shape[0]):
-                            for i in range(1, event.shape[1]):
-                                if event[j, i]:
-                                    z, R = detection[meas[j]]
-                                    pdf = tracks[tar[i - 1]]._likelihood(z, R)
-                                    item1 *= (pdf / self._lamb)
-                                    break
-                        for i in range(1, event.shape[1]):
-                            for j in range(event.shape[0]):
-                                if event[j, i]:
-                                    item2 *= self._pd
-                                    break
-                            else:
-                                item2 *= (1 - self._pd)
-                        event_probs.append(item1 * item2)
-                    event_probs = event_probs / np.sum(event_probs)
+                    events = np.array(JPDA_events(sub_valid_mat))
+                    assoc = events[:, :, 1:]
+
+                    # the log-likelihood of each valid pair is evaluated only once per cluster
+                    llh = np.zeros((len(meas), len(tar)))
+                    for j in range(llh.shape[0]):
+                        z, R = detection[meas[j]]
+                        for i in range(llh.shape[1]):
+                            if tmp_mat[j, i]:
+                                llh[j, i] = tracks[tar[i]]._log_likelihood(z, R) - np.log(self._lamb)
+
+                    # compute the probabilites of association events in log domain
+                    detected = np.any(assoc, axis=1)
+                    with np.errstate(divide='ignore'):
+                        log_pd, log_pm = np.log(self._pd), np.log(1 - self._pd)
+                    log_probs = np.einsum('ejt,jt->e', assoc, llh)
+                    log_probs += np.sum(np.where(detected, log_pd, log_pm), axis=1)
+                    event_probs = np.exp(log_probs - logsumexp(log_probs))
 
                     # compute the marginal association probabilities
-                    beta = np.zeros((len(meas), len(tar)))
-                    for j in range(beta.shape[0]):
-                        for i in range(beta.shape[1]):
-                            for event, prob in zip(event_list, event_probs):
-                                beta[j, i] += prob * event[j, i + 1]
+                    beta = np.einsum('e,ejt->jt', event_probs, assoc)
 
                     # update assigned tracks and coast the unassigned tracks
                     for i in range(beta.shape[1]):
@@ -6,8 +6,9 @@ __all__ = [
     'is_matrix', 'is_square', 'is_column', 'is_row', 'is_diag', 'is_symmetirc',
     'col', 'row', 'deg2rad', 'rad2deg', 'cart2pol', 'pol2cart', 'cart2sph',
     'sph2cart', 'rotate_matrix_rad', 'rotate_matrix_deg', 'ellip_volume',
-    'ellip_point', 'ellip_uniform', 'cholcov', 'multi_normal',
-    'disc_random'
+    'ellip_point', 'ellip_uniform', 'cholcov', 'tria', 'cholupdate',
+    'multi_normal',
+    'disc_random', 'set_dtype', 'get_dtype'
 ]
 
 import numbers
@@ -17,6 +18,35 @@ import scipy.special as sl
 from collections.abc import Iterable
 
 
+_dtype = np.dtype(np.float64)
+
+
+def set_dtype(dtype):
+    '''
+    Set the floating point type of the bulk arrays, i.e. the particles and weights
+    of particle filters, the states and covariances of filter banks and the cost
+    matrices of trackers. It takes effect on the arrays created afterwards, the
+    arrays made by col, row and multi_normal and the single-track filters keep
+    float64 unless the type is given explicitly.
+
+    Only float64, the default, and float32 are supported. float32 halves the memory
+    and bandwidth of the arrays, but they are only stored in it, the moments,
+    covariance updates and likelihoods are still computed in float64.
+    '''
+    global _dtype
+    dtype = np.dtype(dtype)
+    if dtype != np.float64 and dtype != np.float32:
+        raise ValueError('unsupported dtype: %s' % dtype)
+    _dtype = dtype
+
+
+def get_dtype():
+    '''
+    Get the floating point type of the bulk arrays set by set_dtype
+    '''
+    return _dtype
+
+
 def is_matrix(x):
     return isinstance(x, np.ndarray) and len(x.shape) == 2
 
@@ -190,7 +220,89 @@ def cholcov(cov, lower=False):
     return S
 
 
-def multi_normal(mean, cov, Ns=1, axis=0):
+def tria(A):
+    '''
+    Triangularization used by square-root filters.
+
+    return lower triangular S such that dot(S, S.T) = dot(A, A.T), which is obtained
+    from the QR decomposition of A.T, so A*A' is never formed explicitly. The diagonal
+    of S is made non-negative, so S is the lower Cholesky factor of A*A' if A has full
+    row rank.
+
+    Parameters
+    ----------
+    A : 2-D array_like, of shape (N, M)
+        Rectangular square root of a covariance matrix
+
+    Returns
+    -------
+    S : (N, N) ndarray
+        Lower triangular square root of A*A'.
+    '''
+    rows, cols = A.shape
+    R = lg.qr(A.T, mode='r')[0]
+    k = min(rows, cols)
+    S = np.zeros((rows, rows))
+    S[:, :k] = R[:k].T
+    sign = np.sign(S.diagonal())
+    sign[sign == 0] = 1
+    S *= sign
+    return S
+
+
+def cholupdate(S, x, sign='+'):
+    '''
+    Rank-1 update or downdate of a lower triangular Cholesky factor.
+
+    return lower triangular S1 such that dot(S1, S1.T) = dot(S, S.T) + x*x' if
+    sign is '+', or dot(S, S.T) - x*x' if sign is '-'. If x is a matrix, its
+    columns are applied one after another. The factor is modified by plane or
+    hyperbolic rotations in O(N^2) operations per column instead of factorizing
+    the updated matrix.
+
+    Parameters
+    ----------
+    S : 2-D array_like, of shape (N, N)
+        Lower triangular Cholesky factor
+    x : array_like, of shape (N,) or (N, K)
+        Vector or columns of the update
+    sign : str, optional
+        '+' for update and '-' for downdate. Default is update.
+
+    Returns
+    -------
+    S1 : (N, N) ndarray
+        Lower triangular Cholesky factor of the updated matrix.
+    '''
+    if sign != '+' and sign != '-':
+        raise ValueError("sign must be '+' or '-'")
+    S = np.array(S, dtype=float)
+    x = np.array(x, dtype=float).reshape(S.shape[0], -1)
+    n = S.shape[0]
+    for j in range(x.shape[1]):
+        v = x[:, j]
+        for k in range(n):
+            if v[k] == 0:
+                continue
+            if sign == '+':
+                r = np.hypot(S[k, k], v[k])
+            else:
+                r2 = (S[k, k] - v[k]) * (S[k, k] + v[k])
+                if r2 <= 0:
+                    raise lg.LinAlgError('downdated matrix is not positive definite')
+                r = np.sqrt(r2)
+            c, s = S[k, k] / r, v[k] / r
+            col = S[k:, k].copy()
+            if sign == '+':
+                S[k:, k] = c * col + s * v[k:]
+                v[k:] = c * v[k:] - s * col
+            else:
+                S[k:, k] = c * col - s * v[k:]
+                v[k:] = c * v[k:] - s * col
+    return S
+
+
+def multi_normal(mean, cov, Ns=1, axis=0, sqrt=False, dtype=float):
     '''
     Draw random samples from a normal (Gaussian) distribution with mean and cov
 
@@ -205,6 +317,13 @@ def multi_normal(mean, cov, Ns=1, axis=0):
         Number of samples. Default is 0
     axis : int, optional
         The axis along which the noise will be generated. Default is 0
+    sqrt : bool, optional
+        If True, `cov` is a square root factor S of the covariance matrix such
+        that covariance = dot(S, S.T), e.g. the factor carried by square-root
+        filters, and the decomposition is skipped. Default is False
+    dtype : data-type, optional
+        The type of the drawn samples, which are always computed in float64.
+        Default is float, the particle filters pass get_dtype()
 
     Returns
     -------
@@ -215,7 +334,7 @@ def multi_normal(mean, cov, Ns=1, axis=0):
     dim = cov.shape[0]
     if isinstance(mean, numbers.Number):
         mean = np.full(dim, mean, dtype=float)
-    D = cholcov(cov, lower=True)
+    D = cov if sqrt else cholcov(cov, lower=True)
     if Ns == 1:
         wgn = np.random.randn(dim)
     else:
@@ -228,13 +347,19 @@ def multi_normal(mean, cov, Ns=1, axis=0):
         out += np.reshape(mean, (-1, 1))
     else:
         raise ValueError('axis must be 0 or 1')
-    return out
+    return out.astype(dtype, copy=False)
 
 
 def disc_random(prob, Ns=1, scope=None, alg='roulette'):
     '''
     Draw random samples from a discrete distribution
 
+    All the algorithms locate the drawn points in the cumulative distribution by a
+    single binary search, so they cost O(N + Ns*log(N)). Systematic, stratified and
+    residual sampling are the resampling schemes of particle filters with lower
+    variance than multinomial sampling, see R. Douc and O. Cappe, "Comparison of
+    resampling schemes for particle filtering," ISPA 2005, pp. 64-69.
+
     Parameters
     ----------
     prob : list, of length N
@@ -244,43 +369,49 @@ def disc_random(prob, Ns=1, scope=None, alg='roulette'):
     scope : list, optional
         The scope in which the samples will be drawn. Default is 0
     alg : str, optional
-        Sample algorithm, it can be 'roulette' and 'low_var'
+        Sample algorithm, it can be 'roulette' or 'multinomial' for independent
+        draws, 'low_var' or 'systematic' for a single random offset of a regular
+        grid, 'stratified' for one draw in each of Ns equal strata, and 'residual'
+        for the integer parts of Ns*prob followed by multinomial draws of the rest
 
     Returns
     -------
-    rv : list
-        The drawn samples from scope
-    index : list
+    rv : ndarray or list
+        The drawn samples from scope, which is an ndarray if scope is an ndarray or None
+    index : ndarray
         The index corresponding to the sample drawn from the scope
     '''
+    prob = np.asarray(prob, dtype=float)
     rv_num = len(prob)
-    if scope is None:
-        scope = range(rv_num)
 
-    rv = []
-    index = []
-
-    if alg == 'roulette':
-        cdf = np.zeros(rv_num + 1)
+    if alg == 'roulette' or alg == 'multinomial':
         rnd = np.random.rand(Ns)
-        for i in range(rv_num):
-            cdf[i + 1] = cdf[i] + prob[i]
-        for i in range(Ns):
-            idx = np.where(cdf < rnd[i])[0][-1]
-            rv.append(scope[idx])
-            index.append(idx)
-    elif alg == 'low_var':
+        index = np.searchsorted(np.cumsum(prob), rnd)
+    elif alg == 'low_var' or alg == 'systematic':
         rnd = np.random.rand() / Ns
-        cdf = prob[0]
-        idx = 0
-        for i in range(Ns):
-            u = rnd + i / Ns
-            while u > cdf:
-                idx += 1
-                cdf += prob[idx]
-            rv.append(scope[idx])
-            index.append(idx)
+        index = np.searchsorted(np.cumsum(prob), rnd + np.arange(Ns) / Ns)
+    elif alg == 'stratified':
+        rnd = np.random.rand(Ns)
+        index = np.searchsorted(np.cumsum(prob), (np.arange(Ns) + rnd) / Ns)
+    elif alg == 'residual':
+        counts = np.floor(Ns * prob).astype(int)
+        rest = Ns - counts.sum()
+        index = np.repeat(np.arange(rv_num), counts)
+        if rest > 0:
+            res_prob = Ns * prob - counts
+            rnd = np.random.rand(rest)
+            res_index = np.searchsorted(np.cumsum(res_prob / res_prob.sum()), rnd)
+            index = np.concatenate((index, res_index))
     else:
         raise ValueError('unknown algorithem: %s' % alg)
+    # the sum of probabilities may be slightly less than 1 due to rounding
+    index = np.minimum(index, rv_num - 1)
+
+    if scope is None:
+        rv = index
+    elif isinstance(scope, np.ndarray):
+        rv = scope[index]
+    else:
+        rv = [scope[idx] for idx in index]
 
     return rv, index
@@ -39,6 +39,7 @@ def UKFilter_test():
     # pt_gen = ft.SimplexSigmaPoints()      # not suitable for non-additive noise
     # pt_gen = ft.SphericalSimplexSigmaPoints()
     # pt_gen = ft.SymmetricSigmaPoints()       # CKF
+    # pt_gen = ft.CubaturePoints(degree=5)     # fifth-degree CKF
     pt_gen = ft.ScaledSigmaPoints()
 
     # ukf = ft.UKFilterAN(f, L, h, M, Q, R, point_generator=pt_gen)
@@ -130,5 +131,76 @@ def UKFilter_test():
     plt.show()
 
 
+def SRUKFilter_test():
+    N, T = 200, 1
+
+    axis = 2
+    xdim, zdim = 4, 2
+    sigma_w = [np.sqrt(0.01), np.sqrt(0.01)]
+    sigma_v = [np.sqrt(0.1), np.sqrt(0.01)]
+
+    F = model.F_cv(axis, T)
+    L = np.eye(xdim)
+    f = lambda x, u: F @ x
+    Q = model.Q_cv_dd(axis, T, sigma_w)
+
+    M = np.eye(zdim)
+    h = lambda x: np.array([lg.norm(x[::2]), np.arctan2(x[2], x[0])], dtype=float)
+    R = model.R_cv(axis, sigma_v)
+
+    x = np.array([1, 0.2, 2, 0.3], dtype=float)
+
+    ukf = ft.UKFilterAN(f, L, h, M, Q, R, point_generator=ft.ScaledSigmaPoints())
+    srukf = ft.SRUKFilterAN(f, L, h, M, Q, R, point_generator=ft.ScaledSigmaPoints())
+
+    state_arr = np.empty((xdim, N))
+    ukf_state_arr = np.empty((xdim, N))
+    srukf_state_arr = np.empty((xdim, N))
+    srukf_var_arr = np.empty((xdim, N))
+
+    for n in range(-1, N):
+        w = tlb.multi_normal(0, Q)
+        v = tlb.multi_normal(0, R)
+
+        x = f(x, 0) + L @ w
+        z = h(x) + M @ v
+        if n == -1:
+            x_init, P_init = init.cv_init(z, R, 1)
+            ukf.init(x_init, P_init)
+            srukf.init(x_init, P_init)
+            continue
+        state_arr[:, n] = x
+
+        ukf.predict()
+        ukf.correct(z)
+        ukf_state_arr[:, n] = ukf.state
+
+        srukf.predict()
+        srukf.correct(z)
+        srukf_state_arr[:, n] = srukf.state
+        # the factor is propagated, so the variances are the squared row norms of it
+        srukf_var_arr[:, n] = np.sum(srukf.cov_sqrt**2, axis=1)
+
+    print(srukf)
+
+    print('UKF RMS: %s' % np.std(state_arr - ukf_state_arr, axis=1))
+    print('SR-UKF RMS: %s' % np.std(state_arr - srukf_state_arr, axis=1))
+
+    # plot
+    n = np.arange(N)
+    fig = plt.figure()
+    ax = fig.add_subplot(211)
+    ax.plot(n, state_arr[0, :], linewidth=0.8)
+    ax.plot(n, ukf_state_arr[0, :], linewidth=0.8)
+    ax.plot(n, srukf_state_arr[0, :], linewidth=0.8)
+    ax.legend(['real', 'UKF', 'SR-UKF'])
+    ax.set_title('x state')
+    ax = fig.add_subplot(212)
+    ax.plot(n, srukf_var_arr[0, :], linewidth=0.8)
+    ax.set_title('x error variance of SR-UKF')
+    plt.show()
+
+
 if __name__ == '__main__':
     UKFilter_test()
+    SRUKFilter_test()